@@ -0,0 +1,143 @@
+"""
+Requests/sec of the async (ASGI) views against their sync (WSGI) counterparts.
+
+Both paths run in-process against the local stub upstream. The sync views are
+driven from a pool of ``--wsgi-threads`` threads, like a threaded WSGI worker.
+The async views are driven from a single event loop with up to
+``--concurrency`` requests in flight, like one ASGI worker.
+
+Every request has to reach the upstream, so both paths are measured cold: the
+run uses a temporary copy of the project database, every cache alias except
+the single-flight one is a dummy that never hits, and prefetch is off. The
+single-flight cache lives in the same temporary directory. Trending feeds are
+always served from their stored snapshots, so those two endpoints measure
+that path rather than an upstream call.
+
+Run from the repository root:
+
+    python -m benchmarks.async_views --requests 400 --concurrency 100 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'enterainmentdjango.settings')
+
+from benchmarks.database import copy_project_db, migrate, setup  # noqa: E402
+from benchmarks.stub_upstream import StubUpstream  # noqa: E402
+
+# (name, sync path, async path); {n} is a different number for every request,
+# so concurrent requests aren't coalesced by single-flight either
+ENDPOINTS = [
+    ('shows', '/shows/?page={n}', '/async/shows/?page={n}'),
+    ('books', '/books/?page={n}', '/async/books/?page={n}'),
+    ('animanga', '/animanga/?page={n}', '/async/animanga/?page={n}'),
+    ('movie_detail', '/movie/{n}/', '/async/movie/{n}/'),
+    ('anime_detail', '/animanga/{n}/', '/async/animanga/{n}/'),
+    ('trending-posters', '/api/trending-posters', '/async/api/trending-posters'),
+    ('trending-anime', '/api/trending-anime', '/async/api/trending-anime'),
+]
+
+
+def isolate(workdir):
+    """Point Django at a database copy and caches in ``workdir`` that never hit."""
+    from django.conf import settings
+
+    settings.CACHES = {
+        **{alias: {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'} for alias in settings.CACHES},
+        'coordination': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(workdir, 'coordination'),
+        },
+    }
+    settings.PREFETCH_ENABLED = False
+    settings.METRICS_DIR = os.path.join(workdir, 'metrics')
+    settings.RATELIMIT_DIR = os.path.join(workdir, 'coordination', 'ratelimit')
+    setup('production', copy_project_db(os.path.join(workdir, 'db.sqlite3')))
+    migrate()
+
+
+def run_sync(path, total, threads):
+    from django.test import Client
+
+    def fetch(n):
+        return Client().get(path.format(n=n + 1)).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        statuses = list(pool.map(fetch, range(total)))
+    return time.perf_counter() - start, statuses
+
+
+async def run_async(path, total, concurrency):
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def fetch(n):
+        async with slots:
+            response = await client.get(path.format(n=n + 1))
+            return response.status_code
+
+    start = time.perf_counter()
+    statuses = await asyncio.gather(*(fetch(n) for n in range(total)))
+    return time.perf_counter() - start, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and path')
+    parser.add_argument('--concurrency', type=int, default=100, help='In-flight requests on the async path')
+    parser.add_argument('--wsgi-threads', type=int, default=8, help='Worker threads on the sync path')
+    parser.add_argument('--latency', type=float, default=0.05, help='Stub upstream latency in seconds')
+    parser.add_argument('--endpoint', action='append', help='Only run the named endpoint(s)')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-async-')
+    try:
+        isolate(workdir)
+        results = compare(args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'latency': args.latency, 'concurrency': args.concurrency,
+                       'wsgi_threads': args.wsgi_threads, 'results': results}, f, indent=2)
+
+
+def compare(args):
+    from django.test import override_settings
+
+    results = []
+    with StubUpstream(latency=args.latency) as stub:
+        with override_settings(**stub.settings()):
+            for name, sync_path, async_path in ENDPOINTS:
+                if args.endpoint and name not in args.endpoint:
+                    continue
+                sync_elapsed, sync_statuses = run_sync(sync_path, args.requests, args.wsgi_threads)
+                async_elapsed, async_statuses = asyncio.run(run_async(async_path, args.requests, args.concurrency))
+                result = {
+                    'endpoint': name,
+                    'requests': args.requests,
+                    'wsgi_rps': round(args.requests / sync_elapsed, 1),
+                    'asgi_rps': round(args.requests / async_elapsed, 1),
+                    'wsgi_errors': sum(status >= 400 for status in sync_statuses),
+                    'asgi_errors': sum(status >= 400 for status in async_statuses),
+                }
+                result['speedup'] = round(result['asgi_rps'] / result['wsgi_rps'], 2)
+                results.append(result)
+                print(f"{name:<18} wsgi {result['wsgi_rps']:>8} req/s   asgi {result['asgi_rps']:>8} req/s   "
+                      f"x{result['speedup']:<6} errors {result['wsgi_errors']}/{result['asgi_errors']}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
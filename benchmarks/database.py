@@ -0,0 +1,82 @@
+"""
+Benchmark databases: seeded copies of the project database.
+
+The committed ``db.sqlite3`` is never written to; benchmarks copy it to a
+temporary directory and point Django at the copy before setup.
+"""
+import os
+import shutil
+import sqlite3
+
+USER = 'dummy_user'
+PROJECT_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db.sqlite3')
+
+
+def copy_project_db(path):
+    shutil.copy(PROJECT_DB, path)
+    return path
+
+
+def setup(profile, path):
+    """Point Django at ``path`` with ``profile``'s database settings.
+
+    ``baseline`` is a single rollback-journal connection with no routing;
+    ``production`` is ``settings.DATABASES`` as shipped.
+    """
+    import django
+    from django.conf import settings
+
+    if profile == 'baseline':
+        settings.DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}}
+        settings.DATABASE_ROUTERS = []
+    else:
+        for database in settings.DATABASES.values():
+            database['NAME'] = path
+    settings.ALLOWED_HOSTS = ['testserver']
+    django.setup()
+
+
+def migrate():
+    from django.core.management import call_command
+
+    call_command('migrate', '--fake-initial', verbosity=0)
+    call_command('createcachetable', verbosity=0)
+
+
+def seed_watchlist(items, user=USER):
+    """Replace ``user``'s watchlist with ``items`` enriched movies."""
+    from django.utils import timezone
+
+    from enterainmentdjango.models import MediaCatalog, WatchlistItem
+
+    WatchlistItem.objects.filter(user=user).delete()
+    now = timezone.now()
+    external_ids = [f'bench-{i}' for i in range(items)]
+    MediaCatalog.objects.bulk_create([
+        MediaCatalog(source='tmdb', media_type='movie', external_id=external_id, title=f'Movie {i}',
+                     genres=['Drama'], year='2020', enriched_at=now)
+        for i, external_id in enumerate(external_ids)
+    ], batch_size=500, ignore_conflicts=True)
+    entries = MediaCatalog.objects.filter(
+        source='tmdb', media_type='movie', external_id__in=external_ids,
+    ).values_list('id', flat=True)
+    WatchlistItem.objects.bulk_create([
+        WatchlistItem(user=user, catalog_id=catalog_id, media_type='movie', status='watching')
+        for catalog_id in entries
+    ], batch_size=500)
+
+
+def checkpoint(path):
+    """Fold the WAL back into the file so copies of it are complete."""
+    from django.db import connections
+
+    connections.close_all()
+    with sqlite3.connect(path) as connection:
+        connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+def seed(path, items):
+    """Migrate the database at ``path`` and add ``items`` enriched rows."""
+    migrate()
+    seed_watchlist(items)
+    checkpoint(path)
@@ -0,0 +1,155 @@
+"""
+Watchlist read and write throughput under concurrent load, per database profile.
+
+``baseline`` is the original configuration: a rollback-journal SQLite file,
+a new connection per request and every query on ``default``. ``production``
+is ``settings.DATABASES`` as shipped: WAL, the SQLITE_PRAGMAS, persistent
+connections, IMMEDIATE write transactions and the read-only alias for the
+watchlist views.
+
+Each profile gets its own copy of a seeded database. ``--readers`` processes
+loop on ``GET /api/watchlist/`` and ``--writers`` processes loop on
+``POST /api/watchlist/update/`` for ``--duration`` seconds, like separate
+worker processes sharing one file. Failed requests, including "database is
+locked", are counted as errors.
+
+Run from the repository root:
+
+    python -m benchmarks.sqlite_concurrency --readers 4 --writers 4 --duration 5
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'enterainmentdjango.settings')
+
+from benchmarks.database import USER, copy_project_db, seed, setup  # noqa: E402
+
+PROFILES = ('baseline', 'production')
+
+
+def worker(profile, path, role, duration, results):
+    setup(profile, path)
+    from django.db import connections
+    from django.test import Client
+
+    from enterainmentdjango.models import WatchlistItem
+
+    client = Client()
+    item_ids = list(WatchlistItem.objects.filter(user=USER).values_list('id', flat=True))
+    connections.close_all()
+    latencies, errors = [], {}
+
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if role == 'read':
+                status = client.get('/api/watchlist/?limit=50').status_code
+            else:
+                body = {'id': random.choice(item_ids), 'progress': random.randint(0, 100)}
+                status = client.post('/api/watchlist/update/', json.dumps(body),
+                                     content_type='application/json').status_code
+            error = f'HTTP {status}' if status >= 400 else None
+        except Exception as e:
+            error = str(e)
+        if error:
+            errors[error] = errors.get(error, 0) + 1
+        else:
+            latencies.append(time.perf_counter() - start)
+    results.put((role, latencies, errors))
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_profile(profile, path, args):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(profile, path, role, args.duration, results))
+        for role, count in (('read', args.readers), ('write', args.writers))
+        for _ in range(count)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    result = {'profile': profile}
+    for role in ('read', 'write'):
+        latencies = [value for kind, values, _ in collected if kind == role for value in values]
+        errors = {}
+        for kind, _, counts in collected:
+            if kind == role:
+                for message, count in counts.items():
+                    errors[message] = errors.get(message, 0) + count
+        result[role] = {
+            'ok': len(latencies),
+            'per_second': round(len(latencies) / args.duration, 1),
+            'p50_ms': round(statistics.median(latencies) * 1000, 2) if latencies else None,
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+            'errors': sum(errors.values()),
+            'error_messages': errors,
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=4, help='Reader processes')
+    parser.add_argument('--writers', type=int, default=4, help='Writer processes')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per profile')
+    parser.add_argument('--items', type=int, default=1000, help='Watchlist rows to seed')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sqlite-bench-')
+    try:
+        template = copy_project_db(os.path.join(workdir, 'template.sqlite3'))
+        setup('production', template)
+        seed(template, args.items)
+
+        results = []
+        for profile in PROFILES:
+            path = os.path.join(workdir, f'{profile}.sqlite3')
+            shutil.copy(template, path)
+            if profile == 'baseline':
+                with sqlite3.connect(path) as connection:
+                    connection.execute('PRAGMA journal_mode=DELETE')
+            result = run_profile(profile, path, args)
+            results.append(result)
+            read, write = result['read'], result['write']
+            print(f"{profile:<11} reads {read['per_second']:>8}/s p95 {read['p95_ms']} ms  errors {read['errors']:<5}"
+                  f" writes {write['per_second']:>8}/s p95 {write['p95_ms']} ms  errors {write['errors']}")
+            for message, count in {**read['error_messages'], **write['error_messages']}.items():
+                print(f'            {count:>6} x {message}', file=sys.stderr)
+
+        baseline, production = results
+        for role in ('read', 'write'):
+            if baseline[role]['per_second']:
+                print(f"{role} throughput x{production[role]['per_second'] / baseline[role]['per_second']:.2f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'readers': args.readers, 'writers': args.writers, 'duration': args.duration,
+                       'items': args.items, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+"""
+Local stand-in for TMDB, AniList and Google Books used by the benchmarks.
+
+Serves responses shaped like the real APIs after an artificial delay, so
+benchmark runs measure this app rather than the network:
+
+    TMDB          GET  /tmdb/3/...
+    AniList       POST /anilist
+    Google Books  GET  /books/v1/volumes[/<id>]
+
+Responses are generated unless a fixture directory is given. Then a request
+that was recorded there is replayed instead, and with ``record=True`` one
+that wasn't is forwarded to the real API once and saved (TMDB_API_KEY and
+GOOGLE_BOOKS_API_KEY are read from the environment; keys are never written
+to the fixtures). ``error_rate`` injects failures, and ``jitter`` adds up to
+that many seconds of random delay on top of ``latency``.
+
+``StubUpstream.settings()`` returns the setting overrides that point the app
+at the stub.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+# Stub path prefix -> real API base URL, for recording fixtures
+REAL_URLS = {
+    '/tmdb': 'https://api.themoviedb.org',
+    '/anilist': 'https://graphql.anilist.co',
+    '/books': 'https://www.googleapis.com/books',
+}
+
+# Query parameters that carry credentials
+SECRET_PARAMS = ('api_key', 'key')
+
+
+def tmdb_item(media_id, media_type='movie'):
+    title_key, date_key = ('title', 'release_date') if media_type == 'movie' else ('name', 'first_air_date')
+    return {
+        'id': media_id,
+        title_key: f'Stub {media_type} {media_id}',
+        date_key: '2020-01-01',
+        'poster_path': f'/poster{media_id}.jpg',
+        'backdrop_path': f'/backdrop{media_id}.jpg',
+        'overview': 'A stub overview.',
+        'vote_average': 7.5,
+        'adult': False,
+    }
+
+
+def tmdb_detail(media_id, media_type='movie'):
+    data = tmdb_item(media_id, media_type)
+    data.update({
+        'genres': [{'id': 28, 'name': 'Action'}, {'id': 18, 'name': 'Drama'}],
+        'runtime': 120,
+        'tagline': 'A stub tagline.',
+        'created_by': [{'name': 'Stub Creator'}],
+        'number_of_episodes': 24,
+        'credits': {
+            'cast': [{'id': i, 'name': f'Actor {i}', 'character': f'Role {i}',
+                      'profile_path': f'/actor{i}.jpg'} for i in range(40)],
+            'crew': [{'id': 1000 + i, 'name': f'Crew {i}', 'job': 'Director' if i == 0 else 'Writer'}
+                     for i in range(60)],
+        },
+        'videos': {'results': [{'key': 'stub', 'site': 'YouTube', 'type': 'Trailer'}]},
+        'similar': {'results': [tmdb_item(media_id * 100 + i, media_type) for i in range(20)]},
+    })
+    return data
+
+
+def tmdb_response(path):
+    parts = path.strip('/').split('/')[1:]  # Drop the API version
+    if parts[0] in ('movie', 'tv') and parts[1].isdigit():
+        return tmdb_detail(int(parts[1]), parts[0])
+    media_type = 'tv' if 'tv' in parts else 'movie'
+    return {
+        'page': 1,
+        'total_pages': 500,
+        'total_results': 10000,
+        'results': [tmdb_item(i + 1, media_type) for i in range(20)],
+    }
+
+
+def anilist_media(media_id):
+    return {
+        'id': media_id,
+        'title': {'english': f'Stub anime {media_id}', 'romaji': f'Stub anime {media_id}', 'native': ''},
+        'description': 'A stub description.',
+        'episodes': 12,
+        'chapters': None,
+        'status': 'FINISHED',
+        'format': 'TV',
+        'genres': ['Action', 'Fantasy'],
+        'averageScore': 80,
+        'coverImage': {'large': f'https://stub/{media_id}.jpg', 'extraLarge': f'https://stub/{media_id}.jpg'},
+        'nextAiringEpisode': None,
+        'startDate': {'year': 2020, 'month': 1, 'day': 1},
+        'studios': {'edges': [], 'nodes': [{'name': 'Stub Studio'}]},
+        'staff': {'edges': []},
+        'characters': {'edges': []},
+        'relations': {'edges': []},
+        'recommendations': {'edges': []},
+        'reviews': {'nodes': []},
+        'rankings': [],
+        'tags': [],
+        'externalLinks': [],
+        'streamingEpisodes': [],
+    }
+
+
+def anilist_section(page, per_page):
+    people = [
+        {'node': {'id': page * 1000 + i, 'name': {'full': f'Person {i}'}, 'image': {'large': f'https://stub/p{i}.jpg'},
+                  'siteUrl': 'https://stub/'},
+         'role': 'MAIN', 'voiceActors': [{'id': i, 'name': {'full': f'Actor {i}'}}]}
+        for i in range(per_page)
+    ]
+    return {
+        'pageInfo': {'hasNextPage': page < 3},
+        'edges': people,
+        'nodes': [
+            {'id': page * 1000 + i, 'summary': 'A stub review.', 'rating': 80, 'ratingAmount': 10, 'siteUrl': 'https://stub/',
+             'user': {'name': f'user{i}', 'avatar': {'large': 'https://stub/a.jpg'}, 'siteUrl': 'https://stub/'},
+             'mediaRecommendation': anilist_media(page * 1000 + i)}
+            for i in range(per_page)
+        ],
+    }
+
+
+def anilist_response(payload):
+    variables = payload.get('variables') or {}
+    if 'id' in variables and 'page' in variables:
+        section = anilist_section(variables['page'], variables.get('perPage', 25))
+        return {'data': {'Media': {name: section for name in ('characters', 'staff', 'reviews', 'recommendations')}}}
+    if 'id' in variables:
+        return {'data': {'Media': anilist_media(variables['id'])}}
+    if 'ids' in variables:
+        # Batched lookups (views.fetch_anilist_info) filter with id_in
+        return {'data': {'Page': {'media': [anilist_media(i) for i in variables['ids']]}}}
+    return {
+        'data': {
+            'Page': {
+                'pageInfo': {'hasNextPage': True, 'currentPage': variables.get('page', 1)},
+                'media': [anilist_media(i + 1) for i in range(50)],
+            }
+        }
+    }
+
+
+def books_volume(volume_id):
+    return {
+        'id': volume_id,
+        'volumeInfo': {
+            'title': f'Stub book {volume_id}',
+            'authors': ['Stub Author'],
+            'description': 'A stub description.',
+            'imageLinks': {'thumbnail': f'https://stub/{volume_id}.jpg'},
+            'infoLink': 'https://stub/',
+            'publishedDate': '2020',
+            'categories': ['Fiction'],
+            'averageRating': 4,
+            'ratingsCount': 10,
+        },
+    }
+
+
+def books_response(path, query):
+    parts = path.strip('/').split('/')
+    if len(parts) > 3:
+        return books_volume(parts[3])
+    start = int(query.get('startIndex', ['0'])[0])
+    return {
+        'totalItems': 2000,
+        'items': [books_volume(f'vol{start + i}') for i in range(20)],
+    }
+
+
+class Fixtures:
+    """Recorded responses on disk, one JSON file per request."""
+
+    def __init__(self, directory, real_urls=None):
+        self.directory = directory
+        self.real_urls = real_urls or REAL_URLS
+
+    @staticmethod
+    def _prefix(path):
+        return next((prefix for prefix in REAL_URLS if path.startswith(prefix)), None)
+
+    def _path(self, method, path, query, body):
+        query = {name: values for name, values in query.items() if name not in SECRET_PARAMS}
+        try:
+            body = json.loads(body) if body else None
+        except ValueError:
+            body = body.decode(errors='replace')
+        raw = json.dumps([method, path, sorted(query.items()), body], sort_keys=True)
+        key = hashlib.sha1(raw.encode()).hexdigest()
+        upstream = (self._prefix(path) or '/other').strip('/')
+        return os.path.join(self.directory, upstream, f'{key}.json')
+
+    def load(self, method, path, query, body):
+        """Return ``(status, payload)`` for a recorded request, or ``None``."""
+        try:
+            with open(self._path(method, path, query, body)) as f:
+                fixture = json.load(f)
+        except FileNotFoundError:
+            return None
+        return fixture['status'], fixture['payload']
+
+    def record(self, method, path, query, body):
+        """Send a request to the real API, save the response and return it."""
+        prefix = self._prefix(path)
+        if prefix is None:
+            return None
+        headers = {'Accept': 'application/json'}
+        query = {name: values for name, values in query.items() if name not in SECRET_PARAMS}
+        params = dict(query)
+        if prefix == '/tmdb' and os.getenv('TMDB_API_KEY'):
+            headers['Authorization'] = f"Bearer {os.environ['TMDB_API_KEY']}"
+        if prefix == '/books' and os.getenv('GOOGLE_BOOKS_API_KEY'):
+            params['key'] = os.environ['GOOGLE_BOOKS_API_KEY']
+        if body:
+            headers['Content-Type'] = 'application/json'
+        response = requests.request(
+            method, self.real_urls[prefix] + path[len(prefix):],
+            params=params, data=body or None, headers=headers, timeout=30,
+        )
+        status, payload = response.status_code, response.json()
+
+        file_path = self._path(method, path, query, body)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'w') as f:
+            json.dump({
+                'request': {
+                    'method': method,
+                    'path': path,
+                    'query': query,
+                },
+                'status': status,
+                'payload': payload,
+            }, f, indent=1)
+        return status, payload
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # Listen backlog; the default of 5 drops bursts
+
+
+class StubUpstream:
+    """Threaded stub server; use as a context manager."""
+
+    def __init__(self, latency=0.05, host='127.0.0.1', port=0, jitter=0.0, error_rate=0.0,
+                 error_status=503, fixtures=None, record=False, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.fixtures = Fixtures(fixtures) if isinstance(fixtures, str) else fixtures
+        self.record = record
+        self.requests = 0
+        self.counters = {'errors_injected': 0, 'replayed': 0, 'recorded': 0, 'generated': 0}
+        self._random = random.Random(seed)
+        self._count_lock = threading.Lock()
+        self.server = _Server((host, port), self._handler())
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def settings(self):
+        return {
+            'TMDB_API_URL': f'{self.url}/tmdb/3',
+            'ANILIST_API_URL': f'{self.url}/anilist',
+            'GOOGLE_BOOKS_API_URL': f'{self.url}/books/v1',
+            # The stub has no rate limits; measure the app, not the budget
+            'UPSTREAM_RATE_LIMITS': {},
+        }
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, name):
+        with self._count_lock:
+            self.counters[name] += 1
+
+    def respond(self, method, path, query, body):
+        """Return ``(status, payload)`` for a request; override to customize."""
+        if self.fixtures is not None:
+            fixture = self.fixtures.load(method, path, query, body)
+            if fixture is None and self.record:
+                fixture = self.fixtures.record(method, path, query, body)
+                if fixture is not None:
+                    self._count('recorded')
+            elif fixture is not None:
+                self._count('replayed')
+            if fixture is not None:
+                return fixture
+        self._count('generated')
+        return self.generate(method, path, query, body)
+
+    def generate(self, method, path, query, body):
+        """A synthetic response for a request."""
+        if path.startswith('/tmdb/'):
+            return 200, tmdb_response(path[len('/tmdb'):])
+        if path.startswith('/anilist'):
+            return 200, anilist_response(json.loads(body or b'{}'))
+        if path.startswith('/books/'):
+            return 200, books_response(path, query)
+        return 404, {'error': 'not found'}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _handle(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                url = urlsplit(self.path)
+                with stub._count_lock:
+                    stub.requests += 1
+                    delay = stub.latency + (stub._random.uniform(0, stub.jitter) if stub.jitter else 0)
+                    inject_error = stub.error_rate and stub._random.random() < stub.error_rate
+                if delay:
+                    time.sleep(delay)
+                if inject_error:
+                    stub._count('errors_injected')
+                    status, payload = stub.error_status, {'status_message': 'Injected error'}
+                else:
+                    status, payload = stub.respond(method, url.path, parse_qs(url.query), body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
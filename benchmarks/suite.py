@@ -0,0 +1,309 @@
+"""
+Offline benchmark suite for the request paths that matter: the watchlist API
+at several sizes, paging through shows, books and anime, detail pages and
+bulk writes.
+
+Everything runs in-process against a seeded copy of the project database and
+the local upstream stub, so a run needs no API keys or network access and is
+repeatable. ``--fixtures`` replays recorded TMDB, AniList and Google Books
+responses (``--record`` fills the directory from the real APIs, once);
+``--latency``, ``--jitter`` and ``--error-rate`` shape the stub.
+
+Catalog pages and detail pages are measured cold (every cache cleared before
+each request) and warm. Speculative prefetch is off so cold runs stay cold.
+
+Each benchmark reports latency percentiles, database queries and upstream
+calls per iteration (from the ``Server-Timing`` header) and error responses.
+``--json`` writes the results with the commit and versions they came from;
+``--compare`` checks a run against such a file and exits with status 1 if any
+benchmark's median got slower by more than ``--threshold``.
+
+Run from the repository root:
+
+    python -m benchmarks.suite --json results.json
+    python -m benchmarks.suite --compare results.json --threshold 0.2
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'enterainmentdjango.settings')
+
+from benchmarks.database import checkpoint, copy_project_db, migrate, seed_watchlist, setup  # noqa: E402
+from benchmarks.stub_upstream import StubUpstream  # noqa: E402
+
+GROUPS = ('watchlist', 'pages', 'details', 'writes')
+SIZES = (10, 100, 1000)
+
+# (name, path with a {page} placeholder)
+PAGES = [
+    ('shows.movie', '/shows/?page={page}'),
+    ('shows.tv', '/shows/?media_type=tv&page={page}'),
+    ('books', '/books/?page={page}'),
+    ('animanga', '/animanga/?page={page}'),
+]
+
+DETAILS = [
+    ('movie_detail', '/movie/603/'),
+    ('tv_detail', '/tv/1399/'),
+    ('anime_detail', '/animanga/21/'),
+    ('anime_characters', '/api/animanga/21/characters/?page=1'),
+]
+
+BULK_SIZE = 100
+
+# Noise floor: slowdowns smaller than this are never regressions
+MIN_REGRESSION_MS = 1.0
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _timing(response):
+    # Database queries and upstream calls from the Server-Timing header
+    header = response.get('Server-Timing', '')
+    queries = sum(int(count) for count in re.findall(r'db;[^,]*desc="(\d+) queries"', header))
+    upstream = sum(int(count) for count in re.findall(r'upstream-[^,]*desc="(\d+) calls', header))
+    return queries, upstream
+
+
+def clear_caches():
+    from django.core.cache import caches
+
+    for cache in caches.all():
+        cache.clear()
+
+
+def measure(name, iterations, request, before=None):
+    """Time ``request(iteration)``, which returns one response or a list."""
+    samples, queries, upstream, errors = [], [], [], {}
+    requests = 0
+    for iteration in range(iterations):
+        if before:
+            before(iteration)
+        start = time.perf_counter()
+        responses = request(iteration)
+        samples.append(time.perf_counter() - start)
+
+        if not isinstance(responses, list):
+            responses = [responses]
+        requests += len(responses)
+        counts = [_timing(response) for response in responses]
+        queries.append(sum(count[0] for count in counts))
+        upstream.append(sum(count[1] for count in counts))
+        for response in responses:
+            if response.status_code >= 400:
+                errors[str(response.status_code)] = errors.get(str(response.status_code), 0) + 1
+
+    result = {
+        'name': name,
+        'iterations': iterations,
+        'requests': requests,
+        'p50_ms': round(statistics.median(samples) * 1000, 3),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+        'min_ms': round(min(samples) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+        'queries': round(statistics.mean(queries), 1),
+        'upstream_calls': round(statistics.mean(upstream), 1),
+        'errors': sum(errors.values()),
+        'error_statuses': errors,
+    }
+    print(f"{name:<34} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+          f"queries {result['queries']:>6}  upstream {result['upstream_calls']:>5}  errors {result['errors']}")
+    return result
+
+
+def bench_watchlist(client, args):
+    results = []
+    for size in args.sizes:
+        seed_watchlist(size)
+        n = f'[n={size}]'
+
+        results.append(measure(f'watchlist.first_page{n}', args.iterations,
+                               lambda _: client.get('/api/watchlist/')))
+
+        def all_pages(_):
+            responses, cursor = [], ''
+            while True:
+                responses.append(client.get(f'/api/watchlist/?limit=200&cursor={cursor}'))
+                cursor = responses[-1].json().get('next_cursor')
+                if not cursor:
+                    return responses
+        results.append(measure(f'watchlist.all_pages{n}', args.iterations, all_pages))
+
+        etag = client.get('/api/watchlist/').get('ETag', '')
+        results.append(measure(f'watchlist.not_modified{n}', args.iterations,
+                               lambda _: client.get('/api/watchlist/', HTTP_IF_NONE_MATCH=etag)))
+        results.append(measure(f'watchlist.search{n}', args.iterations,
+                               lambda _: client.get('/api/watchlist/search/?q=movie&genre=Drama')))
+    return results
+
+
+def bench_pages(client, args):
+    results = []
+    for name, path in PAGES:
+        def page(iteration, path=path):
+            return client.get(path.format(page=iteration % args.pages + 1))
+
+        results.append(measure(f'{name}.cold', args.iterations, page, before=lambda _: clear_caches()))
+        for iteration in range(args.pages):
+            page(iteration)
+        results.append(measure(f'{name}.warm', args.iterations, page))
+    return results
+
+
+def bench_details(client, args):
+    results = []
+    for name, path in DETAILS:
+        def detail(_, path=path):
+            return client.get(path)
+
+        results.append(measure(f'{name}.cold', args.iterations, detail, before=lambda _: clear_caches()))
+        detail(None)
+        results.append(measure(f'{name}.warm', args.iterations, detail))
+    return results
+
+
+def bench_writes(client, args):
+    from enterainmentdjango.models import WatchlistItem
+
+    seed_watchlist(0)
+
+    def bulk(operations):
+        return client.post('/api/watchlist/bulk/', json.dumps({'operations': operations}),
+                           content_type='application/json')
+
+    def add(iteration):
+        return bulk([
+            {'op': 'add', 'media_type': 'movie', 'media_id': f'bulk-{iteration}-{i}', 'title': f'Bulk {i}'}
+            for i in range(BULK_SIZE)
+        ])
+    results = [measure(f'bulk.add[{BULK_SIZE}]', args.iterations, add)]
+
+    item_ids = list(WatchlistItem.objects.filter(user='dummy_user').values_list('id', flat=True)[:BULK_SIZE])
+
+    def update(iteration):
+        return bulk([
+            {'op': 'update', 'id': item_id, 'progress': iteration, 'status': 'watching'}
+            for item_id in item_ids
+        ])
+    results.append(measure(f'bulk.update[{BULK_SIZE}]', args.iterations, update))
+
+    def delete(_):
+        ids = list(WatchlistItem.objects.filter(user='dummy_user').values_list('id', flat=True)[:BULK_SIZE])
+        return bulk([{'op': 'delete', 'id': item_id} for item_id in ids])
+    results.append(measure(f'bulk.delete[{BULK_SIZE}]', args.iterations, delete))
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Print changes against a previous run; return the regressed names."""
+    with open(baseline_path) as f:
+        baseline = {result['name']: result for result in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        before = baseline.get(result['name'])
+        if before is None:
+            continue
+        change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] if before['p50_ms'] else 0
+        regressed = change > threshold and result['p50_ms'] - before['p50_ms'] > MIN_REGRESSION_MS
+        if regressed:
+            regressions.append(result['name'])
+        print(f"{result['name']:<34} {before['p50_ms']:>9.2f} -> {result['p50_ms']:>9.2f} ms  "
+              f"{change:+.0%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--group', action='append', choices=GROUPS, help='Only run the named group(s)')
+    parser.add_argument('--iterations', type=int, default=20, help='Timed iterations per benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='Watchlist sizes')
+    parser.add_argument('--pages', type=int, default=5, help='Catalog pages to cycle through')
+    parser.add_argument('--latency', type=float, default=0.02, help='Stub upstream latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random stub latency, up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of stub responses that fail')
+    parser.add_argument('--error-status', type=int, default=503, help='Status of injected failures')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for stub jitter and errors')
+    parser.add_argument('--fixtures', help='Replay recorded upstream responses from this directory')
+    parser.add_argument('--record', action='store_true', help='Record missing fixtures from the real APIs')
+    parser.add_argument('--json', help='Also write results to this file')
+    parser.add_argument('--compare', help='Results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Median slowdown that counts as a regression')
+    args = parser.parse_args()
+    if args.record and not args.fixtures:
+        parser.error('--record needs --fixtures')
+
+    workdir = tempfile.mkdtemp(prefix='bench-suite-')
+    try:
+        path = copy_project_db(os.path.join(workdir, 'db.sqlite3'))
+        setup('production', path)
+        # Registers the query timer before any connection is opened
+        from enterainmentdjango import timing  # noqa: F401
+        migrate()
+        checkpoint(path)
+
+        import django
+        from django.test import Client, override_settings
+
+        # One log line per request would be most of the output
+        logging.getLogger('enterainmentdjango.timing').setLevel(logging.ERROR)
+
+        stub = StubUpstream(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            error_status=args.error_status, fixtures=args.fixtures, record=args.record,
+                            seed=args.seed)
+        results = []
+        with stub, override_settings(**stub.settings(), PREFETCH_ENABLED=False, SERVER_TIMING_HEADER=True):
+            client = Client()
+            for group in GROUPS:
+                if not args.group or group in args.group:
+                    results.extend(globals()[f'bench_{group}'](client, args))
+        print(f'stub: {stub.requests} requests, {json.dumps(stub.counters)}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'meta': {
+                    'commit': _git_commit(),
+                    'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'platform': platform.platform(),
+                    'args': {key: value for key, value in vars(args).items() if key not in ('json', 'compare')},
+                    'stub': {'requests': stub.requests, **stub.counters},
+                },
+                'results': results,
+            }, f, indent=2)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
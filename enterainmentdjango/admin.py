@@ -1,3 +1,33 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import BookVolume, EnrichmentJob, MediaCatalog, WatchlistItem
+
+
+@admin.register(MediaCatalog)
+class MediaCatalogAdmin(admin.ModelAdmin):
+    list_display = ('title', 'source', 'media_type', 'external_id', 'enriched_at', 'date_updated')
+    list_filter = ('source', 'media_type')
+    search_fields = ('title', 'external_id')
+
+
+@admin.register(WatchlistItem)
+class WatchlistItemAdmin(admin.ModelAdmin):
+    list_display = ('catalog', 'user', 'media_type', 'status', 'date_updated')
+    list_filter = ('media_type', 'status')
+    list_select_related = ('catalog',)
+    search_fields = ('catalog__title', 'catalog__external_id')
+    raw_id_fields = ('catalog',)
+
+
+@admin.register(EnrichmentJob)
+class EnrichmentJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'catalog', 'status', 'attempts', 'run_after', 'date_updated')
+    list_filter = ('status',)
+    list_select_related = ('catalog',)
+    readonly_fields = ('last_error',)
+
+
+@admin.register(BookVolume)
+class BookVolumeAdmin(admin.ModelAdmin):
+    list_display = ('title', 'id', 'published_date', 'date_fetched')
+    search_fields = ('title', 'id')
@@ -0,0 +1,381 @@
+"""
+AniList detail pages, split into a core record and lazily loaded sections.
+
+The first render only needs ``CORE_QUERY``: titles, dates, scores, genres,
+tags, relations, streaming episodes, rankings and links. Characters, staff,
+reviews and recommendations are the heavy, below-the-fold parts. Each is
+fetched a page at a time through its own query and served as JSON to
+``animangainfo.html`` when its tab is shown.
+
+Every record goes through ``detail_cache`` with a TTL per part from
+``settings.ANIMANGA_DETAIL_TTLS``. Cast lists rarely change; reviews and
+recommendations do.
+"""
+import httpx
+import requests
+from django.conf import settings
+
+from . import detail_cache, upstream
+
+CORE_QUERY = '''
+    query ($id: Int) {
+    Media(id: $id, type: ANIME) {
+        id
+        title {
+        romaji
+        english
+        native
+        }
+        description
+        startDate {
+        year
+        month
+        day
+        }
+        endDate {
+        year
+        month
+        day
+        }
+        season
+        seasonYear
+        episodes
+        duration
+        status
+        averageScore
+        meanScore
+        popularity
+        favourites
+        format
+        genres
+        tags {
+        name
+        description
+        category
+        rank
+        isGeneralSpoiler
+        isMediaSpoiler
+        isAdult
+        }
+        studios {
+        edges {
+            node {
+            id
+            name
+            siteUrl
+            }
+            isMain
+        }
+        }
+        relations {
+        edges {
+            node {
+            id
+            title {
+                romaji
+                english
+            }
+            type
+            format
+            status
+            coverImage {
+                large
+            }
+            siteUrl
+            }
+            relationType
+        }
+        }
+        trailer {
+        id
+        site
+        thumbnail
+        }
+        siteUrl
+        nextAiringEpisode {
+        airingAt
+        timeUntilAiring
+        episode
+        }
+        streamingEpisodes {
+        title
+        thumbnail
+        url
+        site
+        }
+        rankings {
+        id
+        rank
+        type
+        format
+        year
+        season
+        allTime
+        context
+        }
+        coverImage {
+        extraLarge
+        }
+        bannerImage
+        externalLinks {
+        id
+        site
+        url
+        type
+        language
+        color
+        icon
+        notes
+        isDisabled
+        }
+        source
+        hashtag
+        updatedAt
+    }
+    }
+    '''
+
+CHARACTERS_QUERY = '''
+    query ($id: Int, $page: Int, $perPage: Int) {
+    Media(id: $id) {
+        characters(page: $page, perPage: $perPage, sort: [ROLE, RELEVANCE, ID]) {
+        pageInfo {
+            hasNextPage
+        }
+        edges {
+            node {
+            id
+            name {
+                full
+            }
+            image {
+                large
+            }
+            siteUrl
+            }
+            role
+            voiceActors(language: JAPANESE) {
+            id
+            name {
+                full
+            }
+            }
+        }
+        }
+    }
+    }
+    '''
+
+STAFF_QUERY = '''
+    query ($id: Int, $page: Int, $perPage: Int) {
+    Media(id: $id) {
+        staff(page: $page, perPage: $perPage, sort: [RELEVANCE, ID]) {
+        pageInfo {
+            hasNextPage
+        }
+        edges {
+            node {
+            id
+            name {
+                full
+            }
+            image {
+                large
+            }
+            siteUrl
+            }
+            role
+        }
+        }
+    }
+    }
+    '''
+
+REVIEWS_QUERY = '''
+    query ($id: Int, $page: Int, $perPage: Int) {
+    Media(id: $id) {
+        reviews(page: $page, perPage: $perPage, sort: [RATING_DESC, ID]) {
+        pageInfo {
+            hasNextPage
+        }
+        nodes {
+            id
+            summary
+            rating
+            ratingAmount
+            siteUrl
+            user {
+            name
+            avatar {
+                large
+            }
+            siteUrl
+            }
+        }
+        }
+    }
+    }
+    '''
+
+RECOMMENDATIONS_QUERY = '''
+    query ($id: Int, $page: Int, $perPage: Int) {
+    Media(id: $id) {
+        recommendations(page: $page, perPage: $perPage, sort: [RATING_DESC, ID]) {
+        pageInfo {
+            hasNextPage
+        }
+        nodes {
+            rating
+            mediaRecommendation {
+            id
+            title {
+                romaji
+                english
+            }
+            format
+            status
+            averageScore
+            popularity
+            coverImage {
+                large
+            }
+            siteUrl
+            }
+        }
+        }
+    }
+    }
+    '''
+
+
+class AniListError(requests.RequestException, httpx.HTTPError):
+    """AniList answered 200 with GraphQL ``errors`` instead of data."""
+
+
+def _character(edge):
+    voice_actors = edge.get('voiceActors') or []
+    return {
+        'id': edge['node']['id'],
+        'name': edge['node']['name']['full'],
+        'image': (edge['node'].get('image') or {}).get('large'),
+        'url': edge['node'].get('siteUrl'),
+        'role': edge.get('role'),
+        'voice_actor': voice_actors[0]['name']['full'] if voice_actors else None,
+    }
+
+
+def _staff(edge):
+    return {
+        'id': edge['node']['id'],
+        'name': edge['node']['name']['full'],
+        'image': (edge['node'].get('image') or {}).get('large'),
+        'url': edge['node'].get('siteUrl'),
+        'role': edge.get('role'),
+    }
+
+
+def _review(node):
+    user = node.get('user') or {}
+    return {
+        'id': node['id'],
+        'summary': node.get('summary'),
+        'rating': node.get('rating'),
+        'rating_amount': node.get('ratingAmount'),
+        'url': node.get('siteUrl'),
+        'user': {
+            'name': user.get('name'),
+            'avatar': (user.get('avatar') or {}).get('large'),
+            'url': user.get('siteUrl'),
+        },
+    }
+
+
+def _recommendation(node):
+    media = node.get('mediaRecommendation')
+    if not media:
+        # The recommended entry was deleted
+        return None
+    return {
+        'id': media['id'],
+        'title': media['title'].get('english') or media['title'].get('romaji'),
+        'cover': (media.get('coverImage') or {}).get('large'),
+        'format': media.get('format'),
+        'status': media.get('status'),
+        'average_score': media.get('averageScore'),
+        'popularity': media.get('popularity'),
+        'rating': node.get('rating'),
+        'url': media.get('siteUrl'),
+    }
+
+
+# section -> (query, list key in the connection, projection)
+SECTIONS = {
+    'characters': (CHARACTERS_QUERY, 'edges', _character),
+    'staff': (STAFF_QUERY, 'edges', _staff),
+    'reviews': (REVIEWS_QUERY, 'nodes', _review),
+    'recommendations': (RECOMMENDATIONS_QUERY, 'nodes', _recommendation),
+}
+
+
+def _media(query, variables):
+    response = upstream.anilist_query(query, variables)
+    response.raise_for_status()
+    return media_from(response.json())
+
+
+def media_from(data):
+    """The ``Media`` object of an AniList response; raises ``AniListError``."""
+    if data.get('errors'):
+        raise AniListError(data['errors'][0]['message'])
+    return data['data']['Media']
+
+
+def section_record(section, media, page):
+    query, list_key, project = SECTIONS[section]
+    connection = media.get(section) or {}
+    items = [project(entry) for entry in connection.get(list_key) or []]
+    return {
+        'section': section,
+        'page': page,
+        'has_next': bool((connection.get('pageInfo') or {}).get('hasNextPage')),
+        'items': [item for item in items if item is not None],
+    }
+
+
+def section_variables(anime_id, page):
+    return {'id': anime_id, 'page': page, 'perPage': settings.ANIMANGA_SECTION_PER_PAGE}
+
+
+def core_key(anime_id):
+    return f'anilist:v1:{anime_id}:core'
+
+
+def section_key(anime_id, section, page):
+    return f'anilist:v1:{anime_id}:{section}:{page}'
+
+
+def fetch_core(anime_id):
+    return _media(CORE_QUERY, {'id': anime_id})
+
+
+def fetch_section(anime_id, section, page):
+    media = _media(SECTIONS[section][0], section_variables(anime_id, page))
+    return section_record(section, media, page)
+
+
+def core(anime_id):
+    """The first-render record for an anime."""
+    return detail_cache.get(
+        core_key(anime_id),
+        lambda: fetch_core(anime_id),
+        settings.ANIMANGA_DETAIL_TTLS['core'],
+    )
+
+
+def section(anime_id, name, page=1):
+    """One page of a section: ``{'section', 'page', 'has_next', 'items'}``."""
+    return detail_cache.get(
+        section_key(anime_id, name, page),
+        lambda: fetch_section(anime_id, name, page),
+        settings.ANIMANGA_DETAIL_TTLS[name],
+    )
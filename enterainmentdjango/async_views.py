@@ -0,0 +1,171 @@
+"""
+Async variants of the catalog, detail and trending views for ASGI deployments.
+
+Request building and context shaping are shared with the sync views in
+``views.py``; only the upstream call changes, going through the pooled async
+client in ``upstream``. One ASGI worker can then keep hundreds of upstream
+requests in flight instead of blocking a thread per request.
+"""
+import logging
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+
+from . import animanga_details, detail_cache, prefetch, upstream, views, volumes
+
+logger = logging.getLogger(__name__)
+
+
+async def books(request):
+    query = request.GET.get('q', '')
+    page = views.request_page(request)
+
+    try:
+        params = views.books_params(query, page)
+        # The page cache and volume store are backed by the database, which is sync-only
+        result = await sync_to_async(prefetch.cached)('books', params)
+        if result is None:
+            result = await sync_to_async(volumes.cached_search)(params)
+        if result is None:
+            response = await upstream.google_books_get_async('/volumes', params=params)
+            response.raise_for_status()
+            result = await sync_to_async(volumes.store_search)(params, response.json())
+            await sync_to_async(prefetch.store)('books', params, result)
+        context = views.books_context(result, query, page)
+        if context['has_next']:
+            await sync_to_async(views.prefetch_books)(query, page + 1)
+
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return views.books_json_response(request, context)
+        return render(request, 'books.html', context)
+
+    except httpx.HTTPError as e:
+        error_message = f"Error fetching books: {str(e)}"
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({'error': error_message}, status=500)
+        return render(request, 'books.html', {
+            'error': error_message,
+            'books': [],
+            'query': query
+        })
+
+
+async def shows(request):
+    filters = views.shows_filters(request)
+    path, params = views.shows_request(filters)
+    data = await sync_to_async(prefetch.cached)('shows', [path, params])
+    if data is None:
+        try:
+            response = await upstream.tmdb_get_async(path, params=params)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.error(f"Error fetching shows: {str(e)}")
+            return render(request, 'shows.html', views.shows_error_context(filters, f"Failed to fetch shows: {str(e)}"))
+        data = response.json()
+        await sync_to_async(prefetch.store)('shows', [path, params], data)
+
+    context = views.shows_context(data, filters)
+    if context['has_next']:
+        # Prefetches run on the sync pool
+        await sync_to_async(views.prefetch_shows)({**filters, 'page': filters['page'] + 1})
+    return render(request, 'shows.html', context)
+
+
+async def show_detail(request, media_type, show_id):
+    if media_type not in views.DETAIL_MEDIA_TYPES:
+        raise Http404(f"Unknown media type: {media_type}")
+
+    key = views.show_detail_key(media_type, show_id)
+    ttl = settings.DETAIL_CACHE_TTLS[media_type]
+    cached = await sync_to_async(detail_cache.lookup)(key)
+    if cached is not None:
+        record, stale = cached
+        if stale:
+            # The refresh runs on the detail cache's own pool
+            await sync_to_async(detail_cache.refresh)(key, lambda: views.fetch_show_detail(media_type, show_id), ttl)
+        return render(request, 'showsinfo.html', views.movie_detail_context(record))
+
+    try:
+        response = await upstream.tmdb_get_async(
+            views.show_detail_path(media_type, show_id), params=views.MOVIE_DETAIL_PARAMS
+        )
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.error(f"Error fetching {media_type} details: {str(e)}")
+        return render(request, 'showsinfo.html', {'error': 'Failed to load movie details'})
+
+    record = views.show_detail_record(media_type, response.json())
+    await sync_to_async(detail_cache.store)(key, record, ttl)
+    return render(request, 'showsinfo.html', views.movie_detail_context(record))
+
+
+async def movie_detail(request, movie_id):
+    return await show_detail(request, 'movie', movie_id)
+
+
+async def animanga(request):
+    page = views.request_page(request)
+
+    variables = {'page': page}
+    try:
+        data = await sync_to_async(prefetch.cached)('animanga', variables)
+        if data is None:
+            response = await upstream.anilist_query_async(views.ANIMANGA_QUERY, variables)
+            response.raise_for_status()
+            data = response.json()
+            await sync_to_async(prefetch.store)('animanga', variables, data)
+        context = views.animanga_context(data, page)
+        if context['has_next']:
+            await sync_to_async(views.prefetch_animanga)(page + 1)
+    except httpx.HTTPError as e:
+        return render(request, 'animanga.html', {
+            'error': f"Failed to fetch anime: {str(e)}",
+            'animanga_list': [],
+            'has_next': False,
+            'current_page': page
+        })
+
+    return render(request, 'animanga.html', context)
+
+
+async def animanga_detail(request, anime_id):
+    key = animanga_details.core_key(anime_id)
+    ttl = settings.ANIMANGA_DETAIL_TTLS['core']
+    cached = await sync_to_async(detail_cache.lookup)(key)
+    if cached is not None:
+        media, stale = cached
+        if stale:
+            await sync_to_async(detail_cache.refresh)(key, lambda: animanga_details.fetch_core(anime_id), ttl)
+        return render(request, 'animangainfo.html', {'anime_id': anime_id, 'Media': media})
+
+    try:
+        response = await upstream.anilist_query_async(animanga_details.CORE_QUERY, {'id': anime_id})
+        response.raise_for_status()
+        media = animanga_details.media_from(response.json())
+
+    except httpx.HTTPError as e:
+        return render(request, 'animangainfo.html', {
+            'anime_id': anime_id,
+            'error': f"Failed to fetch anime: {str(e)}"
+        })
+
+    await sync_to_async(detail_cache.store)(key, media, ttl)
+    return render(request, 'animangainfo.html', {'anime_id': anime_id, 'Media': media})
+
+
+# Snapshots come from memory, with an occasional table read to pick up newer
+# ones. The ETag and Last-Modified checks read them too, so the sync views run
+# whole in a thread, keeping their conditional GET and Cache-Control handling
+async def get_trending_anime(request):
+    return await sync_to_async(views.get_trending_anime)(request)
+
+
+async def get_trending_posters(request):
+    return await sync_to_async(views.get_trending_posters)(request)
+
+
+async def get_trending(request):
+    return await sync_to_async(views.get_trending)(request)
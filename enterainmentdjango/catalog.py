@@ -0,0 +1,89 @@
+"""
+The shared media catalog behind watchlist rows.
+
+Watchlist rows hold a user's status, progress and rating; everything about the
+title itself lives on one ``MediaCatalog`` entry per
+``(source, media_type, external_id)``, shared by every user who tracks it.
+``resolve`` finds or creates entries for add requests (only enrichment fills
+in their metadata), and ``serialize`` flattens a row and its entry back into
+the watchlist API's item shape.
+"""
+from .enrichment import UPSTREAMS as SOURCES
+from .models import MediaCatalog
+
+
+def key(media_type, media_id):
+    return (SOURCES[media_type], media_type, str(media_id))
+
+
+def _entry(data):
+    # Entries are shared, so nothing else a client sends is stored: the
+    # client's title stands in until enrichment replaces it with the
+    # upstream's, along with the poster and the rest of the metadata
+    source, media_type, external_id = key(data['media_type'], data['media_id'])
+    return MediaCatalog(
+        source=source,
+        media_type=media_type,
+        external_id=external_id,
+        title=data['title'][:MediaCatalog._meta.get_field('title').max_length],
+    )
+
+
+def _lookup(keys):
+    found = {}
+    for media_type in {media_type for _, media_type, _ in keys}:
+        external_ids = [external_id for _, entry_type, external_id in keys if entry_type == media_type]
+        rows = MediaCatalog.objects.filter(
+            source=SOURCES[media_type], media_type=media_type, external_id__in=external_ids
+        ).values_list('id', 'enriched_at', 'external_id')
+        for catalog_id, enriched_at, external_id in rows:
+            found[(SOURCES[media_type], media_type, external_id)] = (catalog_id, enriched_at)
+    return found
+
+
+def resolve(entries):
+    """Find or create catalog entries for add-to-watchlist data dicts.
+
+    Returns ``{key: (catalog_id, enriched_at)}`` for every entry's ``key``.
+    Entries another request created first are used as they are.
+    """
+    wanted = {}
+    for data in entries:
+        wanted.setdefault(key(data['media_type'], data['media_id']), data)
+
+    found = _lookup(wanted)
+    missing = [_entry(data) for entry_key, data in wanted.items() if entry_key not in found]
+    if missing:
+        MediaCatalog.objects.bulk_create(missing, ignore_conflicts=True)
+        # Not every database returns primary keys from bulk_create, so read them back
+        found.update(_lookup([entry_key for entry_key in wanted if entry_key not in found]))
+    return found
+
+
+def serialize(item):
+    """A watchlist row and its catalog entry as one API item dict.
+
+    ``item`` should come from a queryset with ``select_related('catalog')``.
+    """
+    entry = item.catalog
+    return {
+        'id': item.id,
+        'user': item.user,
+        'catalog_id': entry.id,
+        'media_id': entry.external_id,
+        'media_type': entry.media_type,
+        'title': entry.title,
+        'status': item.status,
+        'poster_path': entry.poster_path,
+        'progress': item.progress,
+        'total_episodes': entry.total_episodes,
+        'genres': entry.genres,
+        'creator': entry.creator,
+        'year': entry.year,
+        # The upstream score stands in until the user rates the item
+        'rating': item.rating or round(entry.score),
+        'version': item.version,
+        'enriched_at': entry.enriched_at,
+        'date_added': item.date_added,
+        'date_updated': item.date_updated,
+    }
@@ -0,0 +1,53 @@
+"""
+Read/write routing between the primary connection and a read-only one.
+
+Views decorated with ``read_only`` run their queries on
+``settings.READ_ONLY_DATABASE``, a second connection to the same SQLite file
+opened with ``PRAGMA query_only``. With WAL, readers see the last committed
+state without waiting on the writer's lock, and a stray write from a routed
+view fails loudly instead of taking that lock. Writes always go to
+``default``, so caches and sessions behave the same inside routed views.
+
+The flag is a context variable, so it follows the request into threads
+started with ``contextvars.copy_context`` and into ``sync_to_async`` calls.
+"""
+import contextvars
+import functools
+
+from django.conf import settings
+
+_read_only = contextvars.ContextVar('read_only', default=False)
+
+
+class ReadOnlyRouter:
+    """Send reads inside ``read_only`` views to the read-only alias."""
+
+    def db_for_read(self, model, **hints):
+        if _read_only.get() and settings.READ_ONLY_DATABASE in settings.DATABASES:
+            return settings.READ_ONLY_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != settings.READ_ONLY_DATABASE
+
+
+def read_only(view):
+    """Route the view's reads, including its ``condition`` checks, to the replica.
+
+    Apply it outermost so ETag and Last-Modified queries are routed too.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _read_only.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_only.reset(token)
+    return wrapper
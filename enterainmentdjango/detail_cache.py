@@ -0,0 +1,131 @@
+"""
+Stale-while-revalidate cache for detail-page records.
+
+Entries are fresh for their TTL and then kept for up to
+``settings.DETAIL_STALE_TTL`` more seconds. A stale entry is still served
+straight away while one background refresh replaces it. Only a missing entry
+makes the request wait for the upstream. Refreshes are deduplicated within the
+process and, through a short lock in the shared cache, across workers.
+``stats()`` reports how many reads were fresh, stale or missing.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import timing
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.DETAIL_REFRESH_WORKERS,
+    thread_name_prefix='detail-refresh',
+)
+_refreshing = set()
+_lock = threading.Lock()
+
+_counters = {
+    'fresh': 0,       # Reads served from a fresh record
+    'stale': 0,       # Reads served from a stale record
+    'misses': 0,      # Reads that waited for the upstream
+    'refreshed': 0,   # Background refreshes that stored a record
+    'failed': 0,
+}
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def stats():
+    """Counters for this process, with the share of reads served from cache."""
+    with _lock:
+        counters = dict(_counters)
+    reads = counters['fresh'] + counters['stale'] + counters['misses']
+    counters['hit_rate'] = round((reads - counters['misses']) / reads, 3) if reads else None
+    return counters
+
+
+def _cache():
+    return caches[settings.DETAIL_CACHE]
+
+
+def lookup(key):
+    """Return ``(data, stale)`` for a cached record, or ``None``."""
+    try:
+        entry = _cache().get(f'detail:{key}')
+    except Exception as e:
+        logger.warning(f"Detail cache read failed: {str(e)}")
+        return None
+    if entry is None:
+        _count('misses')
+        timing.record_cache('detail', False)
+        return None
+    stale = time.time() > entry['fresh_until']
+    _count('stale' if stale else 'fresh')
+    timing.record_cache('detail', True)
+    return entry['data'], stale
+
+
+def store(key, data, ttl):
+    try:
+        _cache().set(
+            f'detail:{key}',
+            {'data': data, 'fresh_until': time.time() + ttl},
+            ttl + settings.DETAIL_STALE_TTL,
+        )
+    except Exception as e:
+        logger.warning(f"Detail cache write failed: {str(e)}")
+
+
+def _refresh(key, fetch, ttl):
+    try:
+        store(key, fetch(), ttl)
+        _count('refreshed')
+    except Exception as e:
+        _count('failed')
+        # Keep serving the stale record; the next read tries again
+        logger.warning(f"Refreshing {key} failed: {str(e)}")
+    finally:
+        try:
+            _cache().delete(f'detail-refresh:{key}')
+        except Exception:
+            pass
+        with _lock:
+            _refreshing.discard(key)
+
+
+def refresh(key, fetch, ttl):
+    """Re-fetch a record in the background unless a refresh is already running."""
+    with _lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    try:
+        # Another worker is already on it
+        claimed = _cache().add(f'detail-refresh:{key}', 1, settings.DETAIL_REFRESH_LOCK_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Detail refresh lock failed: {str(e)}")
+        claimed = True
+    if not claimed:
+        with _lock:
+            _refreshing.discard(key)
+        return
+    _executor.submit(_refresh, key, fetch, ttl)
+
+
+def get(key, fetch, ttl):
+    """Return the record for ``key``; ``fetch()`` is only awaited on a miss."""
+    cached = lookup(key)
+    if cached is not None:
+        data, stale = cached
+        if stale:
+            refresh(key, fetch, ttl)
+        return data
+    data = fetch()
+    store(key, data, ttl)
+    return data
@@ -0,0 +1,155 @@
+"""
+Concurrent enrichment of watchlist rows with upstream metadata.
+
+Cached metadata is applied straight away; the remaining lookups run on a
+shared, bounded thread pool with a cap on concurrent calls per upstream. Items
+whose lookup misses the request deadline keep the fields stored in the
+database. Their lookups keep running in the background and fill the cache for
+the next request.
+"""
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+from django.conf import settings
+
+from . import metadata_cache
+
+logger = logging.getLogger(__name__)
+
+# Which upstream serves metadata for each media type
+UPSTREAMS = {
+    'movie': 'tmdb',
+    'tv': 'tmdb',
+    'anime': 'anilist',
+    'manga': 'anilist',
+    'book': 'google_books',
+}
+
+# Catalog fields that only ever come from the upstream, never from clients
+SHARED_FIELDS = ('title', 'poster_path')
+
+# Upstreams that can look up many items in one request, with their batch size
+BATCH_SIZES = {
+    'anilist': settings.ANILIST_BATCH_SIZE,
+    'google_books': settings.GOOGLE_BOOKS_BATCH_SIZE,
+}
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.ENRICHMENT_MAX_WORKERS,
+    thread_name_prefix='enrichment',
+)
+_slots = {
+    upstream: threading.BoundedSemaphore(limit)
+    for upstream, limit in settings.ENRICHMENT_UPSTREAM_CONCURRENCY.items()
+}
+
+
+def info_fields(info):
+    """Map looked-up metadata onto watchlist item fields."""
+    fields = {
+        'genres': info.get('genres', []),
+        'creator': info.get('creator', 'Unknown'),
+        'year': info.get('year', ''),
+        'rating': info.get('rating', 0),
+        'total_episodes': info.get('total_episodes')
+    }
+    # Lookups cached before titles and posters were looked up lack them
+    fields.update({name: info[name] for name in SHARED_FIELDS if info.get(name)})
+    return fields
+
+
+def apply_info(item, info):
+    """Overlay looked-up metadata onto a serialized watchlist item."""
+    if info:
+        item.update(info_fields(info))
+
+
+def _submit(fn, *args):
+    # Lookups run in the request's context, so timing and routing follow them
+    return _executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _lookup(lookup, item):
+    with _slots[UPSTREAMS[item['media_type']]]:
+        return lookup(item)
+
+
+def _batch_lookup(batch_lookup, upstream, items):
+    with _slots[upstream]:
+        return batch_lookup(items)
+
+
+def iter_enrichment(items, lookup, deadline=None, batch_lookup=None):
+    """Yield ``(item, info)`` for serialized watchlist items as metadata arrives.
+
+    ``lookup`` is called with an item dict and returns its metadata dict (see
+    ``views.iteminfo``). If ``batch_lookup`` is given, items for upstreams in
+    ``BATCH_SIZES`` are instead looked up in chunks; it is called with a list
+    of item dicts and returns ``{(media_type, media_id): info}`` (see
+    ``views.iteminfo_batch``). Cached metadata is yielded first, then upstream
+    lookups in completion order for at most ``deadline`` seconds. Items
+    without metadata are not yielded.
+    """
+    if deadline is None:
+        deadline = settings.ENRICHMENT_DEADLINE
+
+    enrichable = [item for item in items if item['media_type'] in UPSTREAMS]
+    cached = metadata_cache.get_many(
+        [(item['media_type'], item['media_id']) for item in enrichable]
+    )
+
+    hits = []
+    pending = {}
+    batches = {}
+    for item in enrichable:
+        info = cached.get((item['media_type'], item['media_id']))
+        upstream = UPSTREAMS[item['media_type']]
+        if info is not None:
+            hits.append((item, info))
+        elif batch_lookup is not None and upstream in BATCH_SIZES:
+            # Batched upstreams are queried per media type
+            batches.setdefault((upstream, item['media_type']), []).append(item)
+        else:
+            pending[_submit(_lookup, lookup, item)] = ([item], False)
+
+    for (upstream, _), batch_items in batches.items():
+        size = BATCH_SIZES[upstream]
+        for start in range(0, len(batch_items), size):
+            chunk = batch_items[start:start + size]
+            pending[_submit(_batch_lookup, batch_lookup, upstream, chunk)] = (chunk, True)
+
+    # Upstream lookups are already running while the cache hits are consumed
+    yield from hits
+    if not pending:
+        return
+
+    completed = 0
+    try:
+        for future in as_completed(pending, timeout=deadline):
+            completed += 1
+            chunk, batched = pending[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Error enriching items {[item['id'] for item in chunk]}: {str(e)}")
+                continue
+            if not batched:
+                if result:
+                    yield chunk[0], result
+                continue
+            for item in chunk:
+                info = result.get((item['media_type'], item['media_id']))
+                if info:
+                    yield item, info
+    except FuturesTimeoutError:
+        logger.warning(f"{len(pending) - completed} enrichment lookups missed the {deadline}s deadline")
+
+
+def enrich_items(items, lookup, deadline=None, batch_lookup=None):
+    """Enrich serialized watchlist items in place; see ``iter_enrichment``."""
+    for item, info in iter_enrichment(items, lookup, deadline, batch_lookup):
+        apply_info(item, info)
+    return items
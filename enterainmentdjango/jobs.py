@@ -0,0 +1,162 @@
+"""
+Database-backed queue that enriches catalog entries once, at write time.
+
+Adding a title nobody has enriched yet enqueues an ``EnrichmentJob`` for its
+``MediaCatalog`` entry. The ``process_enrichment_jobs`` management command
+drains the queue and writes the looked-up metadata onto the entry, once for
+every user tracking the title. Failed lookups are retried with exponential
+backoff until ``settings.ENRICHMENT_JOB_MAX_ATTEMPTS``.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from .enrichment import SHARED_FIELDS
+from .models import EnrichmentJob, MediaCatalog
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(catalog_id):
+    """Queue an enrichment job for a catalog entry unless one is already waiting."""
+    job = EnrichmentJob.objects.filter(catalog_id=catalog_id, status__in=['pending', 'running']).first()
+    if job is None:
+        job = EnrichmentJob.objects.create(catalog_id=catalog_id, run_after=timezone.now())
+    return job
+
+
+def enqueue_many(catalog_ids):
+    """``enqueue`` for several entries with a constant number of queries."""
+    waiting = set(
+        EnrichmentJob.objects.filter(catalog_id__in=catalog_ids, status__in=['pending', 'running'])
+        .values_list('catalog_id', flat=True)
+    )
+    EnrichmentJob.objects.bulk_create([
+        EnrichmentJob(catalog_id=catalog_id, run_after=timezone.now())
+        for catalog_id in sorted(set(catalog_ids) - waiting)
+    ])
+
+
+def backfill(batch_size=500):
+    """Queue jobs for catalog entries that were never enriched nor queued.
+
+    Covers rows added before the queue existed. Entries whose jobs failed
+    for good are left alone. Returns the number of entries queued.
+    """
+    entries = MediaCatalog.objects.filter(enriched_at__isnull=True, enrichment_jobs__isnull=True)
+    catalog_ids = list(entries.values_list('id', flat=True))
+    for start in range(0, len(catalog_ids), batch_size):
+        enqueue_many(catalog_ids[start:start + batch_size])
+    return len(catalog_ids)
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number ``attempts``, with jitter."""
+    delay = settings.ENRICHMENT_JOB_BACKOFF * 2 ** (attempts - 1)
+    return delay * random.uniform(0.5, 1.5)
+
+
+def claim(limit):
+    """Mark up to ``limit`` due jobs as running and return them.
+
+    Jobs are claimed with a conditional UPDATE so several drainers can run at
+    once without processing the same job twice.
+    """
+    now = timezone.now()
+
+    # Jobs left running by a crashed worker go back on the queue
+    stale = now - timedelta(seconds=settings.ENRICHMENT_JOB_TIMEOUT)
+    EnrichmentJob.objects.filter(status='running', date_updated__lt=stale).update(status='pending')
+
+    due = EnrichmentJob.objects.filter(status='pending', run_after__lte=now).order_by('run_after')
+    claimed = []
+    for job_id in due.values_list('id', flat=True)[:limit]:
+        if EnrichmentJob.objects.filter(id=job_id, status='pending').update(status='running', date_updated=now):
+            claimed.append(job_id)
+    return list(EnrichmentJob.objects.filter(id__in=claimed).select_related('catalog'))
+
+
+def lookup_item(entry):
+    """The item dict lookups expect, for a catalog entry."""
+    return {'id': entry.id, 'media_type': entry.media_type, 'media_id': entry.external_id}
+
+
+def run(job, lookup):
+    """Look up metadata for the job's catalog entry and store it on the entry."""
+    entry = job.catalog
+    job.attempts += 1
+    try:
+        info = lookup(lookup_item(entry))
+        if not info:
+            raise ValueError('Upstream returned no metadata')
+    except Exception as e:
+        job.last_error = str(e)
+        if job.attempts >= settings.ENRICHMENT_JOB_MAX_ATTEMPTS:
+            job.status = 'failed'
+            logger.error(f"Enrichment job {job.id} for catalog entry {entry.id} failed: {str(e)}")
+        else:
+            job.status = 'pending'
+            job.run_after = timezone.now() + timedelta(seconds=backoff(job.attempts))
+            logger.warning(f"Enrichment job {job.id} for catalog entry {entry.id} will retry: {str(e)}")
+        job.save()
+        return False
+
+    fields = {
+        'genres': info.get('genres', []),
+        'creator': info.get('creator', 'Unknown'),
+        'year': info.get('year', ''),
+        'total_episodes': info.get('total_episodes'),
+        'score': info.get('rating') or 0,
+        'enriched_at': timezone.now(),
+        'date_updated': timezone.now(),
+    }
+    fields.update({name: info[name] for name in SHARED_FIELDS if info.get(name)})
+    MediaCatalog.objects.filter(id=entry.id).update(**fields)
+
+    job.status = 'done'
+    job.last_error = ''
+    job.save()
+    return True
+
+
+def process(lookup, limit=50, batch_lookup=None):
+    """Drain up to ``limit`` due jobs; returns ``(succeeded, failed)`` counts.
+
+    If given, ``batch_lookup`` is called once with all claimed entries to warm
+    the metadata cache before the per-job lookups (see ``views.iteminfo_batch``).
+    """
+    claimed = claim(limit)
+    if batch_lookup is not None and claimed:
+        try:
+            batch_lookup([lookup_item(job.catalog) for job in claimed])
+        except Exception as e:
+            # The per-job lookups still run and retry on their own
+            logger.warning(f"Batched enrichment lookup failed: {str(e)}")
+
+    succeeded = failed = 0
+    for job in claimed:
+        if run(job, lookup):
+            succeeded += 1
+        else:
+            failed += 1
+    return succeeded, failed
+
+
+def status_summary():
+    """Job counts per status plus the most recent failures."""
+    counts = dict(
+        EnrichmentJob.objects.values_list('status').annotate(count=Count('id')).order_by()
+    )
+    failures = list(
+        EnrichmentJob.objects.filter(status='failed')
+        .order_by('-date_updated')
+        .values('id', 'catalog_id', 'attempts', 'last_error', 'date_updated')[:20]
+    )
+    return {
+        'counts': {status: counts.get(status, 0) for status, _ in EnrichmentJob.STATUS_CHOICES},
+        'recent_failures': failures,
+    }
@@ -0,0 +1,429 @@
+"""
+Drive a mix of browse, detail and watchlist traffic at a running server.
+
+Each virtual user is a thread with its own HTTP session that loops over
+weighted actions until the step ends:
+
+    browse   shows (movies and TV), animanga and books pages
+    detail   movie, TV and anime pages and an anime characters section
+    read     the watchlist API, watchlist search and the watchlist page
+    write    add, update and delete watchlist items
+
+Before the run the database gets a catalog of synthetic titles and
+``--users`` synthetic users with ``--items`` watchlist rows each, so queries
+run against tables of realistic size. The API has no per-user accounts yet,
+so all traffic acts as ``dummy_user``, whose watchlist is seeded the same
+way; each virtual user only updates and deletes the titles it added itself.
+Synthetic rows are replaced on every seeded run and removed by ``--cleanup``.
+The command writes to the database in its own settings, which must be the
+server's.
+
+With ``--stub`` the local upstream stub from ``benchmarks`` runs for the
+duration of the test on ``--stub-port``; start the server with the printed
+TMDB_API_URL, ANILIST_API_URL and GOOGLE_BOOKS_API_URL first. Upstream rate
+limits still apply, as they would in production.
+
+``--find-saturation`` doubles the number of virtual users each step until
+throughput stops growing by ``--min-gain`` or a step breaks ``--max-p95`` or
+``--max-error-rate``, and reports the last step that was worth its users.
+The load generator is one process; if its CPU use nears 100%, run it from
+another machine, or the results understate the server.
+"""
+import itertools
+import json
+import random
+import statistics
+import threading
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from enterainmentdjango.catalog import SOURCES
+from enterainmentdjango.models import MediaCatalog, WatchlistItem
+
+# Synthetic titles have ten-digit ids above any real TMDB or AniList id (and
+# within GraphQL's Int); titles added during a run are numbered from ADD_ID_BASE
+ID_BASE = 2_000_000_000
+ADD_ID_BASE = 2_100_000_000
+ID_PATTERN = r'^2[01][0-9]{8}$'
+USER_PREFIX = 'loadtest-'
+
+# Repeated types are more common
+CATALOG_TYPES = ('movie', 'movie', 'tv', 'tv', 'anime', 'manga', 'book')
+ADD_TYPES = ('movie', 'tv', 'anime', 'book')
+GENRES = ('Action', 'Adventure', 'Comedy', 'Drama', 'Fantasy', 'Horror', 'Mystery', 'Romance', 'Sci-Fi', 'Thriller')
+SEARCH_TERMS = ('loadtest', 'movie', 'anime', 'book', 'tv 1')
+
+ACTIONS = ('browse', 'detail', 'read', 'write')
+DEFAULT_MIX = 'browse=40,detail=20,read=30,write=10'
+BROWSE_PAGES = 5
+DETAIL_IDS = 500
+
+
+def parse_mix(text):
+    """``'browse=40,write=10'`` -> ``{'browse': 40, 'write': 10}``."""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ACTIONS:
+            raise CommandError(f"Unknown action in --mix: {name} (choose from {', '.join(ACTIONS)})")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise CommandError(f'Invalid weight for {name} in --mix: {weight}')
+    if sum(mix.values()) <= 0:
+        raise CommandError('--mix needs a positive weight')
+    return mix
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Recorder:
+    """Latencies and errors per endpoint for one step, from every virtual user."""
+
+    def __init__(self):
+        self.latencies = {}  # endpoint -> [seconds]
+        self.errors = {}     # endpoint -> {reason: count}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, seconds, error=None):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if error:
+                reasons = self.errors.setdefault(endpoint, {})
+                reasons[error] = reasons.get(error, 0) + 1
+
+    def summary(self, elapsed):
+        with self._lock:
+            endpoints = {
+                endpoint: self._stats(latencies, self.errors.get(endpoint, {}), elapsed)
+                for endpoint, latencies in sorted(self.latencies.items())
+            }
+            everything = [seconds for latencies in self.latencies.values() for seconds in latencies]
+            errors = {}
+            for reasons in self.errors.values():
+                for reason, count in reasons.items():
+                    errors[reason] = errors.get(reason, 0) + count
+        return {'total': self._stats(everything, errors, elapsed), 'endpoints': endpoints}
+
+    @staticmethod
+    def _stats(latencies, errors, elapsed):
+        if not latencies:
+            return {'requests': 0, 'requests_per_second': 0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None,
+                    'errors': 0, 'error_rate': 0, 'error_reasons': {}}
+        failed = sum(errors.values())
+        return {
+            'requests': len(latencies),
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(statistics.median(latencies) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+            'errors': failed,
+            'error_rate': round(failed / len(latencies), 4),
+            'error_reasons': errors,
+        }
+
+
+class VirtualUser(threading.Thread):
+    """One simulated visitor, looping over actions until ``stop`` is set."""
+
+    def __init__(self, base_url, recorder, stop, mix, add_ids, seed, think_time, timeout):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.stop = stop
+        self.actions, self.weights = zip(*mix.items())
+        self.add_ids = add_ids
+        self.random = random.Random(seed)
+        self.think_time = think_time
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.owned = []  # Watchlist item ids this user added
+
+    def request(self, endpoint, method, path, body=None):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, json=body, timeout=self.timeout)
+            error = f'HTTP {response.status_code}' if response.status_code >= 400 else None
+        except requests.RequestException as e:
+            response, error = None, type(e).__name__
+        self.recorder.add(endpoint, time.perf_counter() - start, error)
+        return response
+
+    def _page(self, limit):
+        # Earlier pages and lower ids are the popular ones
+        return int(self.random.triangular(1, limit + 1, 1))
+
+    def browse(self):
+        page = self._page(BROWSE_PAGES)
+        endpoint, path = self.random.choice([
+            ('shows', f'/shows/?page={page}'),
+            ('shows', f'/shows/?media_type=tv&page={page}'),
+            ('animanga', f'/animanga/?page={page}'),
+            ('books', f'/books/?page={page}'),
+        ])
+        self.request(endpoint, 'GET', path)
+
+    def detail(self):
+        media_id = self._page(DETAIL_IDS)
+        self.request(*self.random.choice([
+            ('movie_detail', 'GET', f'/movie/{media_id}/'),
+            ('show_detail', 'GET', f'/tv/{media_id}/'),
+            ('anime_detail', 'GET', f'/animanga/{media_id}/'),
+            ('anime_section', 'GET', f'/api/animanga/{media_id}/characters/?page=1'),
+        ]))
+
+    def read(self):
+        choice = self.random.random()
+        if choice < 0.6:
+            status = self.random.choice(['', '&status=watching', '&status=completed'])
+            self.request('get_watchlist', 'GET', f'/api/watchlist/?limit=50{status}')
+        elif choice < 0.9:
+            self.request('search_watchlist', 'GET', f'/api/watchlist/search/?q={self.random.choice(SEARCH_TERMS)}')
+        else:
+            self.request('watchlist', 'GET', '/watchlist/')
+
+    def write(self):
+        choice = self.random.random()
+        if len(self.owned) < 3 or choice < 0.4:
+            media_type = self.random.choice(ADD_TYPES)
+            media_id = next(self.add_ids)
+            response = self.request('add_to_watchlist', 'POST', '/api/watchlist/add/', {
+                'media_id': media_id, 'media_type': media_type, 'title': f'Loadtest {media_type} {media_id}',
+            })
+            if response is not None and response.ok:
+                self.owned.append(response.json()['item_id'])
+        elif choice < 0.85:
+            self.request('update_watchlist', 'POST', '/api/watchlist/update/', {
+                'id': self.random.choice(self.owned),
+                'progress': self.random.randint(0, 24),
+                'status': self.random.choice(['watching', 'completed', 'plan_to_watch']),
+            })
+        else:
+            self.request('delete_from_watchlist', 'DELETE', f'/api/watchlist/delete/{self.owned.pop(0)}/')
+
+    def run(self):
+        # The watchlist page sets the CSRF cookie the write APIs check
+        self.request('watchlist', 'GET', '/watchlist/')
+        self.session.headers['X-CSRFToken'] = self.session.cookies.get('csrftoken', '')
+        while not self.stop.is_set():
+            getattr(self, self.random.choices(self.actions, self.weights)[0])()
+            if self.think_time:
+                self.stop.wait(self.random.expovariate(1 / self.think_time))
+
+
+class Command(BaseCommand):
+    help = 'Load-test a running server with a mix of browse, detail and watchlist traffic'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server under test')
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help=f'Action weights, from {", ".join(ACTIONS)} (default: {DEFAULT_MIX})')
+        parser.add_argument('--concurrency', type=int, default=20, help='Virtual users')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds per step')
+        parser.add_argument('--think-time', type=float, default=0.0,
+                            help='Mean seconds a virtual user waits between requests')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds before a request counts as failed')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for data and traffic')
+
+        parser.add_argument('--users', type=int, default=200, help='Synthetic users to seed')
+        parser.add_argument('--items', type=int, default=100, help='Watchlist rows per synthetic user')
+        parser.add_argument('--catalog-size', type=int, default=5000, help='Synthetic titles to seed')
+        parser.add_argument('--no-seed', action='store_true', help='Use the data from an earlier run')
+        parser.add_argument('--cleanup', action='store_true', help='Remove synthetic data and exit')
+
+        parser.add_argument('--stub', action='store_true', help='Run the local upstream stub during the test')
+        parser.add_argument('--stub-port', type=int, default=8765, help='Port for --stub')
+        parser.add_argument('--stub-latency', type=float, default=0.05, help='Stub upstream latency in seconds')
+
+        parser.add_argument('--find-saturation', action='store_true',
+                            help='Double the virtual users each step until throughput stops growing')
+        parser.add_argument('--max-concurrency', type=int, default=512, help='Largest step for --find-saturation')
+        parser.add_argument('--min-gain', type=float, default=0.1,
+                            help='Throughput growth a step must add to be worth its users')
+        parser.add_argument('--max-p95', type=float, default=1000.0, help='p95 latency limit in ms')
+        parser.add_argument('--max-error-rate', type=float, default=0.01, help='Error rate limit')
+        parser.add_argument('--json', help='Also write results to this file')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self.stdout.write(f'Removed {self.cleanup()} synthetic rows')
+            return
+
+        mix = parse_mix(options['mix'])
+        if not options['no_seed']:
+            self.seed(options['users'], options['items'], options['catalog_size'], random.Random(options['seed']))
+
+        stub = None
+        if options['stub']:
+            try:
+                from benchmarks.stub_upstream import StubUpstream
+            except ImportError:
+                raise CommandError('--stub needs the benchmarks package; run from the repository root')
+            stub = StubUpstream(latency=options['stub_latency'], port=options['stub_port']).start()
+            urls = stub.settings()
+            self.stdout.write(
+                'Upstream stub running; the server needs '
+                f"TMDB_API_URL={urls['TMDB_API_URL']} ANILIST_API_URL={urls['ANILIST_API_URL']} "
+                f"GOOGLE_BOOKS_API_URL={urls['GOOGLE_BOOKS_API_URL']}"
+            )
+
+        try:
+            requests.get(options['url'], timeout=options['timeout'])
+        except requests.RequestException as e:
+            if stub:
+                stub.stop()
+            raise CommandError(f"Server at {options['url']} is not reachable: {str(e)}")
+
+        add_ids = itertools.count(ADD_ID_BASE)
+        steps = []
+        try:
+            if not options['find_saturation']:
+                steps.append(self.run_step(options['concurrency'], mix, add_ids, options))
+                self.report(steps[-1])
+            else:
+                concurrency = 1
+                while concurrency <= options['max_concurrency']:
+                    steps.append(self.run_step(concurrency, mix, add_ids, options))
+                    self.report(steps[-1], verbose=False)
+                    if self.stop_reason(steps, options):
+                        break
+                    concurrency *= 2
+        finally:
+            if stub:
+                stub.stop()
+
+        result = {'url': options['url'], 'mix': mix, 'duration': options['duration'], 'steps': steps}
+        if options['find_saturation']:
+            result['saturation'] = self.saturation(steps, options)
+            self.report(next(step for step in steps if step['concurrency'] == result['saturation']['concurrency']))
+            self.stdout.write(
+                f"Saturation: {result['saturation']['requests_per_second']} req/s with "
+                f"{result['saturation']['concurrency']} virtual users ({result['saturation']['reason']})"
+            )
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump(result, f, indent=2)
+
+    def cleanup(self):
+        entries = MediaCatalog.objects.filter(external_id__regex=ID_PATTERN)
+        with transaction.atomic():
+            deleted, _ = WatchlistItem.objects.filter(catalog__in=entries).delete()
+            removed, _ = WatchlistItem.objects.filter(user__startswith=USER_PREFIX).delete()
+            catalog_deleted, _ = entries.delete()
+        return deleted + removed + catalog_deleted
+
+    def seed(self, users, items, catalog_size, rng):
+        self.cleanup()
+        now = timezone.now()
+        entries = []
+        for index in range(catalog_size):
+            media_type = rng.choice(CATALOG_TYPES)
+            entries.append(MediaCatalog(
+                source=SOURCES[media_type],
+                media_type=media_type,
+                external_id=str(ID_BASE + index),
+                title=f'Loadtest {media_type} {index}',
+                genres=rng.sample(GENRES, 2),
+                creator=f'Creator {index % 300}',
+                year=str(rng.randint(1970, 2025)),
+                total_episodes=rng.randint(1, 50) if media_type in ('tv', 'anime') else None,
+                enriched_at=now,
+            ))
+
+        statuses = [status for status, _ in WatchlistItem.STATUS_CHOICES]
+        with transaction.atomic():
+            MediaCatalog.objects.bulk_create(entries, batch_size=500)
+            pool = list(MediaCatalog.objects.filter(external_id__regex=ID_PATTERN).values_list('id', 'media_type'))
+            rows = []
+            for user in ['dummy_user', *(f'{USER_PREFIX}{index}' for index in range(users))]:
+                for catalog_id, media_type in rng.sample(pool, min(items, len(pool))):
+                    rows.append(WatchlistItem(
+                        user=user, catalog_id=catalog_id, media_type=media_type, status=rng.choice(statuses),
+                        progress=rng.randint(0, 24), rating=rng.randint(0, 10),
+                    ))
+            WatchlistItem.objects.bulk_create(rows, batch_size=1000)
+        self.stdout.write(f'Seeded {len(entries)} titles and {len(rows)} watchlist rows for {users + 1} users')
+
+    def run_step(self, concurrency, mix, add_ids, options):
+        recorder = Recorder()
+        stop = threading.Event()
+        users = [
+            VirtualUser(options['url'], recorder, stop, mix, add_ids, options['seed'] * 100_000 + index,
+                        options['think_time'], options['timeout'])
+            for index in range(concurrency)
+        ]
+        started, cpu_started = time.perf_counter(), time.process_time()
+        for user in users:
+            user.start()
+        stop.wait(options['duration'])
+        stop.set()
+        for user in users:
+            user.join(options['timeout'])
+        elapsed = time.perf_counter() - started
+        return {
+            'concurrency': concurrency,
+            'seconds': round(elapsed, 2),
+            'client_cpu': round((time.process_time() - cpu_started) / elapsed, 2),
+            **recorder.summary(elapsed),
+        }
+
+    def report(self, step, verbose=True):
+        total = step['total']
+        self.stdout.write(
+            f"{step['concurrency']:>4} users  {total['requests_per_second']:>8} req/s  p50 {total['p50_ms']} ms  "
+            f"p95 {total['p95_ms']} ms  p99 {total['p99_ms']} ms  errors {total['error_rate']:.2%}"
+        )
+        if step['client_cpu'] > 0.9:
+            self.stdout.write(self.style.WARNING(
+                f"  Load generator CPU at {step['client_cpu']:.0%}; throughput may be limited by the client"
+            ))
+        if not verbose:
+            return
+        self.stdout.write(f"  {'endpoint':<22} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+                          f"{'p99 ms':>8} {'errors':>7}")
+        for endpoint, stats in step['endpoints'].items():
+            self.stdout.write(
+                f"  {endpoint:<22} {stats['requests']:>8} {stats['requests_per_second']:>8} {stats['p50_ms']:>8} "
+                f"{stats['p95_ms']:>8} {stats['p99_ms']:>8} {stats['error_rate']:>7.2%}"
+            )
+            for reason, count in stats['error_reasons'].items():
+                self.stdout.write(f'      {count:>6} x {reason}')
+
+    def stop_reason(self, steps, options):
+        """Why ramping should stop after the last step, or ``None``."""
+        total = steps[-1]['total']
+        if total['error_rate'] > options['max_error_rate']:
+            return f"error rate {total['error_rate']:.2%} over {options['max_error_rate']:.2%}"
+        if total['p95_ms'] is None or total['p95_ms'] > options['max_p95']:
+            return f"p95 {total['p95_ms']} ms over {options['max_p95']} ms"
+        if len(steps) > 1:
+            previous = steps[-2]['total']['requests_per_second']
+            if total['requests_per_second'] < previous * (1 + options['min_gain']):
+                return f"throughput grew less than {options['min_gain']:.0%}"
+        return None
+
+    def saturation(self, steps, options):
+        """The last step that stayed within limits and still added throughput."""
+        best = steps[0]
+        for index, step in enumerate(steps):
+            if self.stop_reason(steps[:index + 1], options):
+                reason = f"at {step['concurrency']} users {self.stop_reason(steps[:index + 1], options)}"
+                break
+            best = step
+        else:
+            reason = f"not reached at {steps[-1]['concurrency']} users"
+        return {
+            'concurrency': best['concurrency'],
+            'requests_per_second': best['total']['requests_per_second'],
+            'p95_ms': best['total']['p95_ms'],
+            'reason': reason,
+        }
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from enterainmentdjango import jobs
+from enterainmentdjango.views import iteminfo, iteminfo_batch
+
+
+class Command(BaseCommand):
+    help = 'Fill watchlist rows with upstream metadata from the enrichment job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Maximum number of jobs to claim per batch')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the queue instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to sleep between polls in --loop mode')
+        parser.add_argument('--backfill', action='store_true',
+                            help='First queue jobs for catalog entries that were never enriched')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['backfill']:
+            self.stdout.write(f'Queued {jobs.backfill()} catalog entries for enrichment')
+        while True:
+            total_succeeded = total_failed = 0
+            # Drain back-to-back while full batches keep coming
+            while True:
+                succeeded, failed = jobs.process(iteminfo, limit=batch_size, batch_lookup=iteminfo_batch)
+                total_succeeded += succeeded
+                total_failed += failed
+                if succeeded + failed < batch_size:
+                    break
+
+            if total_succeeded or total_failed:
+                self.stdout.write(
+                    f'Processed {total_succeeded + total_failed} jobs '
+                    f'({total_succeeded} succeeded, {total_failed} failed)'
+                )
+            elif not options['loop']:
+                self.stdout.write('No enrichment jobs due')
+
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
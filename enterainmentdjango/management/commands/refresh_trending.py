@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from enterainmentdjango import trending
+
+
+class Command(BaseCommand):
+    help = 'Download the trending poster feeds and store them as snapshots for the homepage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--feed', action='append', choices=sorted(trending.FEEDS),
+                            help='Only refresh the named feed(s)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep refreshing on a schedule instead of exiting')
+        parser.add_argument('--interval', type=float, default=settings.TRENDING_REFRESH_INTERVAL,
+                            help='Seconds between refreshes in --loop mode')
+
+    def handle(self, *args, **options):
+        while True:
+            feeds = options['feed'] or list(trending.FEEDS)
+            refreshed = trending.refresh(feeds)
+            message = f"Refreshed {', '.join(refreshed) or 'no feeds'}"
+            kept = [feed for feed in feeds if feed not in refreshed]
+            if kept:
+                message += f" ({', '.join(kept)} kept their last snapshot)"
+            self.stdout.write(message)
+
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
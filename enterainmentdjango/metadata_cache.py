@@ -0,0 +1,103 @@
+"""
+Cache for the per-item metadata that ``views.iteminfo`` pulls from upstream APIs.
+
+Entries are keyed by ``(media_type, media_id)`` and live in two tiers: a
+size-bounded, process-local LRU cache in front of the persistent cache shared
+by every worker. Each entry expires after the TTL configured for its media
+type in ``settings.METADATA_CACHE_TTLS``.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import timing
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'iteminfo'
+
+
+def _key(media_type, media_id):
+    return f'{KEY_PREFIX}:{media_type}:{media_id}'
+
+
+def _ttl(media_type):
+    ttls = settings.METADATA_CACHE_TTLS
+    return ttls.get(media_type, ttls['default'])
+
+
+def _local():
+    return caches[settings.METADATA_CACHE_LOCAL]
+
+
+def _shared():
+    return caches[settings.METADATA_CACHE_SHARED]
+
+
+def get(media_type, media_id):
+    """Return the cached metadata dict for an item, or ``None`` on a miss."""
+    return get_many([(media_type, media_id)]).get((media_type, media_id))
+
+
+def get_many(keys):
+    """Look up several ``(media_type, media_id)`` pairs at once.
+
+    Returns a dict containing only the pairs that were found.
+    """
+    by_key = {_key(*pair): pair for pair in keys}
+    found = _get_many(by_key)
+    timing.record_cache('metadata', True, len(found))
+    timing.record_cache('metadata', False, len(by_key) - len(found))
+    return found
+
+
+def _get_many(by_key):
+    found = {}
+
+    local_hits = _local().get_many(list(by_key))
+    for key, (expires_at, data) in local_hits.items():
+        found[by_key[key]] = data
+
+    missing = [key for key in by_key if key not in local_hits]
+    if not missing:
+        return found
+
+    try:
+        shared_hits = _shared().get_many(missing)
+    except Exception as e:
+        logger.warning(f"Metadata cache read failed: {str(e)}")
+        return found
+
+    now = time.time()
+    for key, (expires_at, data) in shared_hits.items():
+        remaining = int(expires_at - now)
+        if remaining <= 0:
+            continue
+        # Promote into the local tier for whatever lifetime the entry has left
+        _local().set(key, (expires_at, data), remaining)
+        found[by_key[key]] = data
+    return found
+
+
+def set(media_type, media_id, data):
+    """Store metadata for an item in both tiers."""
+    ttl = _ttl(media_type)
+    key = _key(media_type, media_id)
+    entry = (time.time() + ttl, data)
+    _local().set(key, entry, ttl)
+    try:
+        _shared().set(key, entry, ttl)
+    except Exception as e:
+        logger.warning(f"Metadata cache write failed: {str(e)}")
+
+
+def delete(media_type, media_id):
+    """Drop an item from both tiers so the next lookup refetches it."""
+    key = _key(media_type, media_id)
+    _local().delete(key)
+    try:
+        _shared().delete(key)
+    except Exception as e:
+        logger.warning(f"Metadata cache delete failed: {str(e)}")
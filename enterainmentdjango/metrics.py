@@ -0,0 +1,323 @@
+"""
+Counters and latency histograms, aggregated across worker processes and
+exported in the Prometheus text format at ``/metrics``.
+
+Recording only updates a dict in this process under a lock. A daemon thread
+writes the process's totals to ``settings.METRICS_DIR/<pid>-<token>.json``
+every ``settings.METRICS_FLUSH_INTERVAL`` seconds, and a scrape sums every
+process's file with the scraping process's live totals. The token is random
+per process, so a new process that gets an old one's PID doesn't overwrite
+its totals. At exit a process folds its totals into ``exited.json`` and
+removes its own file. Everything in the files is a counter or a histogram, so
+totals from processes that have exited still add up; clear the directory when
+deploying.
+
+Gauges are computed at scrape time instead: the rate limiter's queue depth
+and available tokens from the shared buckets (see ``ratelimit.usage``), and
+cache hit ratios from the summed counters.
+
+What is recorded:
+
+- requests, 5xx errors and latency per URL name (``ServerTimingMiddleware``)
+- upstream calls per upstream and status, and their latency
+- rate limiter decisions per upstream
+- detail, page and metadata cache hits and misses
+
+Requests, upstream calls and cache lookups arrive through ``timing``.
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests by URL name, method and status.'),
+    'http_request_errors_total': ('counter', 'Requests that ended in a 5xx response.'),
+    'http_request_duration_seconds': ('histogram', 'Time to produce a response, by URL name.'),
+    'upstream_requests_total': ('counter', 'Upstream HTTP calls by status; shared calls used another request\'s response.'),
+    'upstream_request_duration_seconds': ('histogram', 'Upstream HTTP call latency, including rate limit waits.'),
+    'upstream_ratelimit_decisions_total': ('counter', 'Rate limiter decisions per upstream.'),
+    'upstream_ratelimit_queue_depth': ('gauge', 'Calls waiting for a token, across all workers.'),
+    'upstream_ratelimit_available_tokens': ('gauge', 'Tokens left in the shared bucket.'),
+    'cache_lookups_total': ('counter', 'Cache lookups by cache and result.'),
+    'cache_hit_ratio': ('gauge', 'Share of cache lookups that were hits.'),
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [count per bucket..., +Inf count, sum]
+_flusher_pid = None
+_file_name = None  # This process's file, set when its flusher starts
+_file_lock = threading.Lock()
+_retired = False
+
+EXITED = 'exited.json'
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    _ensure_flusher()
+
+
+def observe(name, seconds, **labels):
+    key = (name, _labels(labels))
+    index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        histogram[index] += 1
+        histogram[-1] += seconds
+    _ensure_flusher()
+
+
+def observe_request(view, method, status, seconds):
+    view = view or 'unmatched'
+    inc('http_requests_total', view=view, method=method, status=status)
+    if status >= 500:
+        inc('http_request_errors_total', view=view, status=status)
+    observe('http_request_duration_seconds', seconds, view=view)
+
+
+def upstream_label(url):
+    prefixes = {
+        'tmdb': settings.TMDB_API_URL,
+        'anilist': settings.ANILIST_API_URL,
+        'google_books': settings.GOOGLE_BOOKS_API_URL,
+    }
+    for name, prefix in prefixes.items():
+        if url.startswith(prefix):
+            return name
+    return 'other'
+
+
+def observe_upstream(url, status, shared, seconds):
+    upstream = upstream_label(url)
+    inc('upstream_requests_total', upstream=upstream, status=status, shared=str(shared).lower())
+    if not shared:
+        observe('upstream_request_duration_seconds', seconds, upstream=upstream)
+
+
+def snapshot():
+    """This process's counters and histograms."""
+    with _lock:
+        return {
+            'counters': [[name, labels, value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, labels, list(values)] for (name, labels), values in _histograms.items()],
+        }
+
+
+def _path(name):
+    return os.path.join(settings.METRICS_DIR, name)
+
+
+def _read(name):
+    with open(_path(name)) as f:
+        return json.load(f)
+
+
+def _write(name, data):
+    fd, temp_path = tempfile.mkstemp(dir=settings.METRICS_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, _path(name))
+
+
+def flush():
+    """Write this process's totals where other processes can read them."""
+    with _file_lock:
+        if _file_name is None or _retired:
+            return
+        try:
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            _write(_file_name, snapshot())
+        except OSError as e:
+            logger.warning(f"Writing metrics failed: {str(e)}")
+
+
+def _flush_loop():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        flush()
+
+
+def _ensure_flusher():
+    global _flusher_pid, _file_name
+    if _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        if _flusher_pid is not None:
+            # Forked: the parent's totals are the parent's
+            _counters.clear()
+            _histograms.clear()
+        _flusher_pid = os.getpid()
+        _file_name = f'{_flusher_pid}-{uuid.uuid4().hex[:12]}.json'
+    threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+
+
+def retire():
+    """Fold this process's totals into ``exited.json`` and remove its file.
+
+    ``exited.json`` lists the files folded into it, so a scrape that runs
+    between the two steps doesn't count them twice. Without ``fcntl`` (on
+    Windows) the process just leaves its file behind.
+    """
+    global _retired
+    try:
+        import fcntl
+    except ImportError:
+        flush()
+        return
+
+    with _file_lock:
+        if _file_name is None or _retired:
+            return
+        try:
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            with open(_path('exited.lock'), 'w') as lock:
+                # Exiting processes take turns updating the file
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    exited = _read(EXITED)
+                except FileNotFoundError:
+                    exited = {'counters': [], 'histograms': [], 'retired': []}
+                present = set(os.listdir(settings.METRICS_DIR))
+                _write(EXITED, {
+                    **_dump(*_sum([exited, snapshot()])),
+                    'retired': [name for name in exited['retired'] if name in present] + [_file_name],
+                })
+                _retired = True
+                if _file_name in present:
+                    os.remove(_path(_file_name))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Retiring metrics failed: {str(e)}")
+
+
+@atexit.register
+def _retire_at_exit():
+    if _flusher_pid == os.getpid():
+        retire()
+
+
+def _sum(snapshots):
+    counters, histograms = {}, {}
+    for data in snapshots:
+        for name, labels, value in data['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in data['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                total[index] += value
+    return counters, histograms
+
+
+def _dump(counters, histograms):
+    # Back to the file format of ``snapshot``
+    return {
+        'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+        'histograms': [[name, labels, values] for (name, labels), values in histograms.items()],
+    }
+
+
+def collect():
+    """Counters and histograms summed over every process."""
+    snapshots = [snapshot()]
+    try:
+        names = os.listdir(settings.METRICS_DIR)
+    except FileNotFoundError:
+        names = []
+    skip = {_file_name}
+    if EXITED in names:
+        try:
+            exited = _read(EXITED)
+            snapshots.append(exited)
+            skip.update(exited['retired'])
+        except (OSError, ValueError) as e:
+            logger.warning(f"Reading metrics file {EXITED} failed: {str(e)}")
+    for name in names:
+        if not name.endswith('.json') or name == EXITED or name in skip:
+            continue
+        try:
+            snapshots.append(_read(name))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Reading metrics file {name} failed: {str(e)}")
+    return _sum(snapshots)
+
+
+def _gauges(counters, ratelimit_usage):
+    gauges = {}
+    for name, usage in (ratelimit_usage or {}).items():
+        gauges[('upstream_ratelimit_queue_depth', (('upstream', name),))] = usage['queued']
+        gauges[('upstream_ratelimit_available_tokens', (('upstream', name),))] = usage['available']
+
+    lookups = {}
+    for (name, labels), value in counters.items():
+        if name == 'cache_lookups_total':
+            labels = dict(labels)
+            hits, total = lookups.get(labels['cache'], (0, 0))
+            lookups[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), total + value)
+    for cache, (hits, total) in lookups.items():
+        gauges[('cache_hit_ratio', (('cache', cache),))] = round(hits / total, 4) if total else 0
+    return gauges
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _series(name, labels, value, extra=()):
+    pairs = [*labels, *extra]
+    label_text = ','.join(f'{key}="{_escape(str(label))}"' for key, label in pairs)
+    return f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}'
+
+
+def render(ratelimit_usage=None):
+    """All metrics in the Prometheus text exposition format.
+
+    ``ratelimit_usage`` is ``ratelimit.usage()``, for the limiter gauges.
+    """
+    counters, histograms = collect()
+    values = {**counters, **_gauges(counters, ratelimit_usage)}
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        series = sorted(key for key in (histograms if kind == 'histogram' else values) if key[0] == name)
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key in series:
+            labels = key[1]
+            if kind != 'histogram':
+                lines.append(_series(name, labels, values[key]))
+                continue
+            histogram = histograms[key]
+            cumulative = 0
+            for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), histogram[:-1]):
+                cumulative += count
+                lines.append(_series(f'{name}_bucket', labels, cumulative, [('le', bound)]))
+            lines.append(_series(f'{name}_sum', labels, round(histogram[-1], 6)))
+            lines.append(_series(f'{name}_count', labels, cumulative))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatchlistItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user', models.CharField(max_length=100)),
+                ('media_id', models.CharField(max_length=100)),
+                ('media_type', models.CharField(choices=[('movie', 'Movie'), ('tv', 'TV Show'), ('anime', 'Anime'), ('manga', 'Manga'), ('book', 'Book')], max_length=20)),
+                ('title', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('watching', 'Currently Watching'), ('plan_to_watch', 'Plan to Watch'), ('completed', 'Completed'), ('dropped', 'Dropped')], max_length=20)),
+                ('poster_path', models.CharField(blank=True, max_length=255, null=True)),
+                ('progress', models.IntegerField(default=0)),
+                ('total_episodes', models.IntegerField(blank=True, null=True)),
+                ('genres', models.JSONField(blank=True, default=list)),
+                ('creator', models.CharField(default='Unknown', max_length=255)),
+                ('year', models.CharField(blank=True, max_length=4)),
+                ('rating', models.IntegerField(default=0)),
+                ('date_added', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('user', 'media_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enterainmentdjango', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watchlistitem',
+            name='enriched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='EnrichmentJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('run_after', models.DateTimeField()),
+                ('date_added', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enrichment_jobs', to='enterainmentdjango.watchlistitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='enterainmen_status_3fe344_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enterainmentdjango', '0002_enrichment_jobs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='watchlistitem',
+            index=models.Index(fields=['user', 'date_updated'], name='enterainmen_user_552e95_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlistitem',
+            index=models.Index(fields=['user', 'status', 'date_updated'], name='enterainmen_user_cc701c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlistitem',
+            index=models.Index(fields=['user', 'media_type', 'date_added'], name='enterainmen_user_d30306_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enterainmentdjango', '0003_watchlist_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watchlistitem',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enterainmentdjango', '0004_watchlist_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookVolume',
+            fields=[
+                ('id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=500)),
+                ('authors', models.JSONField(blank=True, default=list)),
+                ('description', models.TextField(blank=True)),
+                ('thumbnail', models.URLField(blank=True, max_length=500)),
+                ('info_link', models.URLField(blank=True, max_length=500)),
+                ('published_date', models.CharField(blank=True, max_length=20)),
+                ('categories', models.JSONField(blank=True, default=list)),
+                ('average_rating', models.FloatField(default=0)),
+                ('ratings_count', models.IntegerField(default=0)),
+                ('page_count', models.IntegerField(blank=True, null=True)),
+                ('date_fetched', models.DateTimeField()),
+            ],
+        ),
+    ]
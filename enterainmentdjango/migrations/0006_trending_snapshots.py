@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enterainmentdjango', '0005_book_volumes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('feed', models.CharField(max_length=20, unique=True)),
+                ('data', models.JSONField(default=list)),
+                ('date_refreshed', models.DateTimeField()),
+            ],
+        ),
+    ]
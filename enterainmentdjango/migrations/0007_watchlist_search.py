@@ -0,0 +1,104 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The FTS5 index and the genre table are kept in sync by triggers so that
+# bulk_create, bulk_update and QuerySet.update/delete are covered too. Other
+# databases skip this; search.py falls back to plain filters there.
+SEARCH_SQL = [
+    """
+    CREATE VIRTUAL TABLE enterainmentdjango_watchlistitem_fts USING fts5(
+        title, creator, genres,
+        content='enterainmentdjango_watchlistitem', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER enterainmentdjango_watchlistitem_search_ai
+    AFTER INSERT ON enterainmentdjango_watchlistitem BEGIN
+        INSERT INTO enterainmentdjango_watchlistitem_fts (rowid, title, creator, genres)
+        VALUES (new.id, new.title, new.creator, new.genres);
+        INSERT INTO enterainmentdjango_watchlistgenre (item_id, user, name)
+        SELECT DISTINCT new.id, new.user, value FROM json_each(new.genres) WHERE type = 'text';
+    END
+    """,
+    """
+    CREATE TRIGGER enterainmentdjango_watchlistitem_search_ad
+    AFTER DELETE ON enterainmentdjango_watchlistitem BEGIN
+        INSERT INTO enterainmentdjango_watchlistitem_fts (enterainmentdjango_watchlistitem_fts, rowid, title, creator, genres)
+        VALUES ('delete', old.id, old.title, old.creator, old.genres);
+        DELETE FROM enterainmentdjango_watchlistgenre WHERE item_id = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER enterainmentdjango_watchlistitem_search_au
+    AFTER UPDATE OF title, creator, genres ON enterainmentdjango_watchlistitem BEGIN
+        INSERT INTO enterainmentdjango_watchlistitem_fts (enterainmentdjango_watchlistitem_fts, rowid, title, creator, genres)
+        VALUES ('delete', old.id, old.title, old.creator, old.genres);
+        INSERT INTO enterainmentdjango_watchlistitem_fts (rowid, title, creator, genres)
+        VALUES (new.id, new.title, new.creator, new.genres);
+    END
+    """,
+    """
+    CREATE TRIGGER enterainmentdjango_watchlistitem_genres_au
+    AFTER UPDATE OF user, genres ON enterainmentdjango_watchlistitem BEGIN
+        DELETE FROM enterainmentdjango_watchlistgenre WHERE item_id = old.id;
+        INSERT INTO enterainmentdjango_watchlistgenre (item_id, user, name)
+        SELECT DISTINCT new.id, new.user, value FROM json_each(new.genres) WHERE type = 'text';
+    END
+    """,
+    # Index the rows that already exist
+    "INSERT INTO enterainmentdjango_watchlistitem_fts (enterainmentdjango_watchlistitem_fts) VALUES ('rebuild')",
+    """
+    INSERT INTO enterainmentdjango_watchlistgenre (item_id, user, name)
+    SELECT DISTINCT item.id, item.user, genre.value
+    FROM enterainmentdjango_watchlistitem AS item, json_each(item.genres) AS genre
+    WHERE genre.type = 'text'
+    """,
+]
+
+DROP_SEARCH_SQL = [
+    'DROP TRIGGER IF EXISTS enterainmentdjango_watchlistitem_genres_au',
+    'DROP TRIGGER IF EXISTS enterainmentdjango_watchlistitem_search_au',
+    'DROP TRIGGER IF EXISTS enterainmentdjango_watchlistitem_search_ad',
+    'DROP TRIGGER IF EXISTS enterainmentdjango_watchlistitem_search_ai',
+    'DROP TABLE IF EXISTS enterainmentdjango_watchlistitem_fts',
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in SEARCH_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SEARCH_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enterainmentdjango', '0006_trending_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatchlistGenre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user', models.CharField(max_length=100)),
+                ('name', models.CharField(max_length=100)),
+                ('item', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='genre_index', to='enterainmentdjango.watchlistitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'name'], name='enterainmen_user_2b2d04_idx')],
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,310 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:34
+
+import importlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+watchlist_search = importlib.import_module('enterainmentdjango.migrations.0007_watchlist_search')
+
+# Which upstream each media type comes from (enrichment.UPSTREAMS at the time)
+SOURCES = {
+    'movie': 'tmdb',
+    'tv': 'tmdb',
+    'anime': 'anilist',
+    'manga': 'anilist',
+    'book': 'google_books',
+}
+
+# The anime page used to save AniList's format (TV, ONA, MOVIE, ...) as the
+# media type
+ANILIST_MANGA_FORMATS = ('MANGA', 'NOVEL', 'ONE_SHOT')
+
+CATALOG_FIELDS = ('title', 'poster_path', 'total_episodes', 'genres', 'creator', 'year', 'enriched_at')
+
+# Same as migration 0007, now over the shared catalog entries
+CATALOG_SEARCH_SQL = [
+    """
+    CREATE VIRTUAL TABLE enterainmentdjango_mediacatalog_fts USING fts5(
+        title, creator, genres,
+        content='enterainmentdjango_mediacatalog', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER enterainmentdjango_mediacatalog_search_ai
+    AFTER INSERT ON enterainmentdjango_mediacatalog BEGIN
+        INSERT INTO enterainmentdjango_mediacatalog_fts (rowid, title, creator, genres)
+        VALUES (new.id, new.title, new.creator, new.genres);
+        INSERT INTO enterainmentdjango_cataloggenre (catalog_id, name)
+        SELECT DISTINCT new.id, value FROM json_each(new.genres) WHERE type = 'text';
+    END
+    """,
+    """
+    CREATE TRIGGER enterainmentdjango_mediacatalog_search_ad
+    AFTER DELETE ON enterainmentdjango_mediacatalog BEGIN
+        INSERT INTO enterainmentdjango_mediacatalog_fts (enterainmentdjango_mediacatalog_fts, rowid, title, creator, genres)
+        VALUES ('delete', old.id, old.title, old.creator, old.genres);
+        DELETE FROM enterainmentdjango_cataloggenre WHERE catalog_id = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER enterainmentdjango_mediacatalog_search_au
+    AFTER UPDATE OF title, creator, genres ON enterainmentdjango_mediacatalog BEGIN
+        INSERT INTO enterainmentdjango_mediacatalog_fts (enterainmentdjango_mediacatalog_fts, rowid, title, creator, genres)
+        VALUES ('delete', old.id, old.title, old.creator, old.genres);
+        INSERT INTO enterainmentdjango_mediacatalog_fts (rowid, title, creator, genres)
+        VALUES (new.id, new.title, new.creator, new.genres);
+    END
+    """,
+    """
+    CREATE TRIGGER enterainmentdjango_mediacatalog_genres_au
+    AFTER UPDATE OF genres ON enterainmentdjango_mediacatalog BEGIN
+        DELETE FROM enterainmentdjango_cataloggenre WHERE catalog_id = old.id;
+        INSERT INTO enterainmentdjango_cataloggenre (catalog_id, name)
+        SELECT DISTINCT new.id, value FROM json_each(new.genres) WHERE type = 'text';
+    END
+    """,
+    "INSERT INTO enterainmentdjango_mediacatalog_fts (enterainmentdjango_mediacatalog_fts) VALUES ('rebuild')",
+    """
+    INSERT INTO enterainmentdjango_cataloggenre (catalog_id, name)
+    SELECT DISTINCT catalog.id, genre.value
+    FROM enterainmentdjango_mediacatalog AS catalog, json_each(catalog.genres) AS genre
+    WHERE genre.type = 'text'
+    """,
+]
+
+DROP_CATALOG_SEARCH_SQL = [
+    'DROP TRIGGER IF EXISTS enterainmentdjango_mediacatalog_genres_au',
+    'DROP TRIGGER IF EXISTS enterainmentdjango_mediacatalog_search_au',
+    'DROP TRIGGER IF EXISTS enterainmentdjango_mediacatalog_search_ad',
+    'DROP TRIGGER IF EXISTS enterainmentdjango_mediacatalog_search_ai',
+    'DROP TABLE IF EXISTS enterainmentdjango_mediacatalog_fts',
+]
+
+
+def create_catalog_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CATALOG_SEARCH_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_catalog_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_CATALOG_SEARCH_SQL:
+        schema_editor.execute(statement)
+
+
+def media_type(value):
+    if value in SOURCES:
+        return value
+    return 'manga' if value in ANILIST_MANGA_FORMATS else 'anime'
+
+
+def populate_catalog(apps, schema_editor):
+    WatchlistItem = apps.get_model('enterainmentdjango', 'WatchlistItem')
+    MediaCatalog = apps.get_model('enterainmentdjango', 'MediaCatalog')
+    EnrichmentJob = apps.get_model('enterainmentdjango', 'EnrichmentJob')
+
+    # Every user's copy of a title becomes one entry; the most recently
+    # enriched copy (or else the most recently updated one) wins
+    best = {}
+    items = list(WatchlistItem.objects.order_by('id'))
+    for item in items:
+        item.media_type = media_type(item.media_type)
+        key = (SOURCES[item.media_type], item.media_type, item.media_id)
+        rank = (item.enriched_at is not None, item.enriched_at or item.date_updated, item.date_updated)
+        if key not in best or rank > best[key][0]:
+            best[key] = (rank, item)
+
+    MediaCatalog.objects.bulk_create([
+        MediaCatalog(
+            source=source, media_type=media_type, external_id=external_id,
+            **{name: getattr(item, name) for name in CATALOG_FIELDS}
+        )
+        for (source, media_type, external_id), (_, item) in best.items()
+    ], batch_size=500)
+    catalog_ids = {
+        (source, media_type, external_id): catalog_id
+        for catalog_id, source, media_type, external_id
+        in MediaCatalog.objects.values_list('id', 'source', 'media_type', 'external_id')
+    }
+
+    for item in items:
+        item.catalog_id = catalog_ids[(SOURCES[item.media_type], item.media_type, item.media_id)]
+    WatchlistItem.objects.bulk_update(items, ['catalog', 'media_type'], batch_size=500)
+
+    # Jobs now enrich the shared entry; one waiting job per entry is enough
+    waiting = set()
+    duplicates = []
+    jobs = EnrichmentJob.objects.select_related('item').order_by('run_after', 'id')
+    updated = []
+    for job in jobs:
+        job.catalog_id = job.item.catalog_id
+        if job.status in ('pending', 'running'):
+            if job.catalog_id in waiting:
+                duplicates.append(job.id)
+                continue
+            waiting.add(job.catalog_id)
+        updated.append(job)
+    EnrichmentJob.objects.bulk_update(updated, ['catalog'], batch_size=500)
+    EnrichmentJob.objects.filter(id__in=duplicates).delete()
+
+
+def restore_items(apps, schema_editor):
+    WatchlistItem = apps.get_model('enterainmentdjango', 'WatchlistItem')
+    EnrichmentJob = apps.get_model('enterainmentdjango', 'EnrichmentJob')
+
+    items = list(WatchlistItem.objects.select_related('catalog'))
+    for item in items:
+        item.media_id = item.catalog.external_id
+        for name in CATALOG_FIELDS:
+            setattr(item, name, getattr(item.catalog, name))
+    WatchlistItem.objects.bulk_update(items, ['media_id', *CATALOG_FIELDS], batch_size=500)
+
+    # A job goes back to one of the rows tracking its entry
+    first_item = {}
+    for item_id, catalog_id in WatchlistItem.objects.order_by('id').values_list('id', 'catalog_id'):
+        first_item.setdefault(catalog_id, item_id)
+    jobs = list(EnrichmentJob.objects.all())
+    for job in jobs:
+        job.item_id = first_item.get(job.catalog_id)
+    EnrichmentJob.objects.bulk_update(jobs, ['item'], batch_size=500)
+    EnrichmentJob.objects.filter(item__isnull=True).delete()
+
+
+def drop_watchlist_search(apps, schema_editor):
+    watchlist_search.drop_search_index(apps, schema_editor)
+
+
+def restore_watchlist_search(apps, schema_editor):
+    watchlist_search.create_search_index(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enterainmentdjango', '0007_watchlist_search'),
+    ]
+
+    operations = [
+        # The old triggers read columns that move to the catalog
+        migrations.RunPython(drop_watchlist_search, restore_watchlist_search),
+        migrations.DeleteModel(
+            name='WatchlistGenre',
+        ),
+        migrations.CreateModel(
+            name='MediaCatalog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('tmdb', 'TMDB'), ('anilist', 'AniList'), ('google_books', 'Google Books')], max_length=20)),
+                ('media_type', models.CharField(choices=[('movie', 'Movie'), ('tv', 'TV Show'), ('anime', 'Anime'), ('manga', 'Manga'), ('book', 'Book')], max_length=20)),
+                ('external_id', models.CharField(max_length=100)),
+                ('title', models.CharField(max_length=255)),
+                ('poster_path', models.CharField(blank=True, max_length=255, null=True)),
+                ('total_episodes', models.IntegerField(blank=True, null=True)),
+                ('genres', models.JSONField(blank=True, default=list)),
+                ('creator', models.CharField(default='Unknown', max_length=255)),
+                ('year', models.CharField(blank=True, max_length=4)),
+                ('score', models.FloatField(default=0)),
+                ('enriched_at', models.DateTimeField(blank=True, null=True)),
+                ('date_added', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('source', 'media_type', 'external_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CatalogGenre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('catalog', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='genre_index', to='enterainmentdjango.mediacatalog')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['name', 'catalog'], name='enterainmen_name_827ad9_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='watchlistitem',
+            name='catalog',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='watchlist_items', to='enterainmentdjango.mediacatalog'),
+        ),
+        migrations.AddField(
+            model_name='enrichmentjob',
+            name='catalog',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='enrichment_jobs', to='enterainmentdjango.mediacatalog'),
+        ),
+        migrations.AlterField(
+            model_name='enrichmentjob',
+            name='item',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='enrichment_jobs', to='enterainmentdjango.watchlistitem'),
+        ),
+        # Nullable while the row data moves, so migrating back can re-add them
+        migrations.AlterField(
+            model_name='watchlistitem',
+            name='media_id',
+            field=models.CharField(max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='watchlistitem',
+            name='title',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.RunPython(populate_catalog, restore_items),
+        migrations.RemoveField(
+            model_name='enrichmentjob',
+            name='item',
+        ),
+        migrations.AlterField(
+            model_name='enrichmentjob',
+            name='catalog',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enrichment_jobs', to='enterainmentdjango.mediacatalog'),
+        ),
+        migrations.AlterField(
+            model_name='watchlistitem',
+            name='catalog',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='watchlist_items', to='enterainmentdjango.mediacatalog'),
+        ),
+        # media_id was unique per user regardless of media type
+        migrations.AlterUniqueTogether(
+            name='watchlistitem',
+            unique_together={('user', 'catalog')},
+        ),
+        migrations.RemoveField(
+            model_name='watchlistitem',
+            name='creator',
+        ),
+        migrations.RemoveField(
+            model_name='watchlistitem',
+            name='enriched_at',
+        ),
+        migrations.RemoveField(
+            model_name='watchlistitem',
+            name='genres',
+        ),
+        migrations.RemoveField(
+            model_name='watchlistitem',
+            name='media_id',
+        ),
+        migrations.RemoveField(
+            model_name='watchlistitem',
+            name='poster_path',
+        ),
+        migrations.RemoveField(
+            model_name='watchlistitem',
+            name='title',
+        ),
+        migrations.RemoveField(
+            model_name='watchlistitem',
+            name='total_episodes',
+        ),
+        migrations.RemoveField(
+            model_name='watchlistitem',
+            name='year',
+        ),
+        migrations.RunPython(create_catalog_search, drop_catalog_search),
+    ]
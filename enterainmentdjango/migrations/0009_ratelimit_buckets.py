@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enterainmentdjango', '0008_media_catalog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('name', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('tokens', models.FloatField()),
+                ('stamp', models.FloatField()),
+                ('cooldown_until', models.FloatField(default=0)),
+            ],
+        ),
+    ]
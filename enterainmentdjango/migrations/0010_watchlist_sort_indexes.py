@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enterainmentdjango', '0009_ratelimit_buckets'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='watchlistitem',
+            index=models.Index(fields=['user', 'media_type', 'date_updated'], name='enterainmen_user_b2f793_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlistitem',
+            index=models.Index(fields=['user', 'date_added'], name='enterainmen_user_de7626_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlistitem',
+            index=models.Index(fields=['user', 'status', 'date_added'], name='enterainmen_user_d6e345_idx'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:18
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enterainmentdjango', '0010_watchlist_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='RateLimitBucket',
+        ),
+    ]
@@ -1,13 +1,18 @@
 from django.db import models
 
-class WatchlistItem(models.Model):
-    STATUS_CHOICES = [
-        ('watching', 'Currently Watching'),
-        ('plan_to_watch', 'Plan to Watch'),
-        ('completed', 'Completed'),
-        ('dropped', 'Dropped')
+class MediaCatalog(models.Model):
+    """Metadata for one title, shared by every watchlist row that tracks it.
+
+    Keyed by where the title comes from: a TMDB movie and an AniList anime
+    with the same numeric id are different entries. Enrichment refreshes the
+    entry once for all users.
+    """
+    SOURCES = [
+        ('tmdb', 'TMDB'),
+        ('anilist', 'AniList'),
+        ('google_books', 'Google Books')
     ]
-    
+
     MEDIA_TYPES = [
         ('movie', 'Movie'),
         ('tv', 'TV Show'),
@@ -15,26 +20,138 @@ class WatchlistItem(models.Model):
         ('manga', 'Manga'),
         ('book', 'Book')
     ]
-    
-    # Required fields
-    user = models.CharField(max_length=100)
-    media_id = models.CharField(max_length=100)
+
+    source = models.CharField(max_length=20, choices=SOURCES)
     media_type = models.CharField(max_length=20, choices=MEDIA_TYPES)
+    external_id = models.CharField(max_length=100)
     title = models.CharField(max_length=255)
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
-    
+
     # Optional fields
     poster_path = models.CharField(max_length=255, null=True, blank=True)
-    progress = models.IntegerField(default=0)
     total_episodes = models.IntegerField(null=True, blank=True)
     genres = models.JSONField(default=list, blank=True)
     creator = models.CharField(max_length=255, default='Unknown')
     year = models.CharField(max_length=4, blank=True)
-    rating = models.IntegerField(default=0)
+    score = models.FloatField(default=0)  # Upstream rating, on the upstream's scale
+
+    # Timestamps
+    enriched_at = models.DateTimeField(null=True, blank=True)
+    date_added = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['source', 'media_type', 'external_id']
+
+    def __str__(self):
+        return self.title
+
+
+class WatchlistItem(models.Model):
+    STATUS_CHOICES = [
+        ('watching', 'Currently Watching'),
+        ('plan_to_watch', 'Plan to Watch'),
+        ('completed', 'Completed'),
+        ('dropped', 'Dropped')
+    ]
+    
+    MEDIA_TYPES = MediaCatalog.MEDIA_TYPES
+    
+    # Required fields
+    user = models.CharField(max_length=100)
+    catalog = models.ForeignKey(MediaCatalog, on_delete=models.PROTECT, related_name='watchlist_items')
+    # Copied from the catalog entry (it never changes) for the indexed filters below
+    media_type = models.CharField(max_length=20, choices=MEDIA_TYPES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    
+    # Optional fields
+    progress = models.IntegerField(default=0)
+    rating = models.IntegerField(default=0)  # 0 until the user rates it
+
+    # Bumped on every update for optimistic concurrency control
+    version = models.IntegerField(default=0)
     
     # Timestamps
     date_added = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
 
     class Meta:
-        unique_together = ['user', 'media_id']
\ No newline at end of file
+        unique_together = ['user', 'catalog']
+        indexes = [
+            # Keyset pagination in queries.watchlist_page, one per filter and
+            # sort field; SQLite appends the id to every index, which covers
+            # the (field, id) tiebreak
+            models.Index(fields=['user', 'date_updated']),
+            models.Index(fields=['user', 'status', 'date_updated']),
+            models.Index(fields=['user', 'media_type', 'date_updated']),
+            models.Index(fields=['user', 'date_added']),
+            models.Index(fields=['user', 'status', 'date_added']),
+            models.Index(fields=['user', 'media_type', 'date_added']),
+        ]
+
+
+class EnrichmentJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed')
+    ]
+
+    catalog = models.ForeignKey(MediaCatalog, on_delete=models.CASCADE, related_name='enrichment_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    # Timestamps
+    run_after = models.DateTimeField()
+    date_added = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+
+class BookVolume(models.Model):
+    """A Google Books volume, normalized by ``volumes.normalize``."""
+    id = models.CharField(max_length=32, primary_key=True)  # Google Books volume id
+    title = models.CharField(max_length=500)
+    authors = models.JSONField(default=list, blank=True)
+    description = models.TextField(blank=True)
+    thumbnail = models.URLField(max_length=500, blank=True)
+    info_link = models.URLField(max_length=500, blank=True)
+    published_date = models.CharField(max_length=20, blank=True)
+    categories = models.JSONField(default=list, blank=True)
+    average_rating = models.FloatField(default=0)
+    ratings_count = models.IntegerField(default=0)
+    page_count = models.IntegerField(null=True, blank=True)
+
+    # Timestamps
+    date_fetched = models.DateTimeField()
+
+
+class TrendingSnapshot(models.Model):
+    """The last good download of a trending feed (see ``trending.py``)."""
+    feed = models.CharField(max_length=20, unique=True)
+    data = models.JSONField(default=list)
+
+    # Timestamps
+    date_refreshed = models.DateTimeField()
+
+
+class CatalogGenre(models.Model):
+    """One row per genre of a catalog entry, for genre filters and facets.
+
+    Derived from ``MediaCatalog.genres`` by SQLite triggers (see migration
+    0008); never written by the application.
+    """
+    catalog = models.ForeignKey(
+        MediaCatalog, on_delete=models.DO_NOTHING, db_constraint=False, related_name='genre_index'
+    )
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'catalog']),
+        ]
@@ -0,0 +1,272 @@
+"""
+Write paths for watchlist items shared by the single-item and bulk APIs.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import catalog, jobs
+from .models import WatchlistItem
+
+UPDATABLE_FIELDS = ('status', 'progress', 'rating')
+MAX_BULK_OPERATIONS = 500
+
+
+def build_item(user, data, catalog_id):
+    """Return an unsaved ``WatchlistItem`` for add-to-watchlist data."""
+    return WatchlistItem(
+        user=user,
+        catalog_id=catalog_id,
+        media_type=data['media_type'],
+        status='plan_to_watch',
+        progress=0,
+        rating=0
+    )
+
+
+def validate_add(data):
+    """Check add-to-watchlist data; raises ``ValueError``."""
+    missing = [key for key in ('media_id', 'media_type', 'title') if key not in data]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}")
+    if not isinstance(data['media_type'], str) or data['media_type'] not in dict(WatchlistItem.MEDIA_TYPES):
+        raise ValueError(f"Unknown media type: {data['media_type']}")
+    media_id = data['media_id']
+    if isinstance(media_id, bool) or not isinstance(media_id, (str, int)) or not str(media_id).strip():
+        raise ValueError('media_id must be a non-empty string or integer')
+    if not isinstance(data['title'], str) or not data['title'].strip():
+        raise ValueError('title must be a non-empty string')
+
+
+def add_item(user, data):
+    """Add a title to a user's watchlist; returns ``(item_id, created)``.
+
+    The title's catalog entry is created on first use and queued for
+    enrichment until it has been enriched.
+    """
+    validate_add(data)
+    catalog_id, enriched_at = catalog.resolve([data])[catalog.key(data['media_type'], data['media_id'])]
+    item, created = WatchlistItem.objects.get_or_create(
+        user=user,
+        catalog_id=catalog_id,
+        defaults={'media_type': data['media_type'], 'status': 'plan_to_watch', 'progress': 0, 'rating': 0},
+    )
+    if enriched_at is None:
+        jobs.enqueue(catalog_id)
+    return item.id, created
+
+
+class UpdateConflict(Exception):
+    """The item changed since the version the client based its update on."""
+
+    def __init__(self, current):
+        super().__init__('Item was modified by another request')
+        self.current = current
+
+
+def _number(name, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f'{name} must be a number')
+    return int(round(value))
+
+
+def validate_update(data):
+    """Return the updatable fields present in ``data``; raises ``ValueError``.
+
+    ``progress`` and ``rating`` may be given as ``{"inc": n}`` to add ``n`` to
+    the stored value instead of replacing it.
+    """
+    fields = {name: data[name] for name in UPDATABLE_FIELDS if name in data}
+    if not fields:
+        raise ValueError(f"Nothing to update; expected one of {', '.join(UPDATABLE_FIELDS)}")
+    if 'status' in fields and fields['status'] not in dict(WatchlistItem.STATUS_CHOICES):
+        raise ValueError(f"Unknown status: {fields['status']}")
+    for name in ('progress', 'rating'):
+        if name not in fields:
+            continue
+        if isinstance(fields[name], dict):
+            if set(fields[name]) != {'inc'}:
+                raise ValueError(f'{name} must be a number or {{"inc": n}}')
+            fields[name] = {'inc': _number(name, fields[name]['inc'])}
+        else:
+            fields[name] = _number(name, fields[name])
+    return fields
+
+
+def parse_precondition(data):
+    """Return lookups for the optimistic concurrency check requested in ``data``.
+
+    Clients send either the ``version`` they last saw or its ``date_updated``.
+    JSON timestamps are truncated to milliseconds, so ``date_updated`` matches
+    any stored value within that millisecond.
+    """
+    if data.get('version') is not None:
+        if isinstance(data['version'], bool) or not isinstance(data['version'], int):
+            raise ValueError('version must be an integer')
+        return {'version': data['version']}
+    if data.get('date_updated'):
+        value = parse_datetime(str(data['date_updated']))
+        if value is None:
+            raise ValueError('date_updated must be an ISO 8601 datetime')
+        return {'date_updated__lt': value + timedelta(milliseconds=1)}
+    return {}
+
+
+def _matches(item, precondition):
+    if 'version' in precondition:
+        return item.version == precondition['version']
+    if 'date_updated__lt' in precondition:
+        return item.date_updated < precondition['date_updated__lt']
+    return True
+
+
+def update_item(user, item_id, fields, precondition=None):
+    """Write ``fields`` to one item with a single conditional UPDATE.
+
+    Only the given columns (plus ``version`` and ``date_updated``) are written.
+    Returns their new values. Raises ``WatchlistItem.DoesNotExist`` or
+    ``UpdateConflict`` if the precondition no longer holds.
+    """
+    values = {
+        name: F(name) + value['inc'] if isinstance(value, dict) else value
+        for name, value in fields.items()
+    }
+    values['version'] = F('version') + 1
+    values['date_updated'] = timezone.now()
+
+    queryset = WatchlistItem.objects.filter(id=item_id, user=user)
+    updated = queryset.filter(**(precondition or {})).update(**values)
+
+    # Read back what was written (relative updates are resolved in SQL)
+    current = queryset.values('id', 'version', 'date_updated', *fields).first()
+    if current is None:
+        raise WatchlistItem.DoesNotExist(f'Watchlist item {item_id} not found')
+    if not updated:
+        raise UpdateConflict(current)
+    return current
+
+
+def _validate(operation):
+    op = operation.get('op')
+    if op == 'add':
+        validate_add(operation)
+    elif op == 'update':
+        if not isinstance(operation.get('id'), int):
+            raise ValueError('update needs an integer id')
+        validate_update(operation)
+        parse_precondition(operation)
+    elif op == 'delete':
+        if not isinstance(operation.get('id'), int):
+            raise ValueError('delete needs an integer id')
+    else:
+        raise ValueError(f'Unknown op: {op}')
+
+
+def apply_bulk(user, operations):
+    """Apply a list of add/update/delete operations in one transaction.
+
+    Operations run in phases (adds, then updates, then deletes), each with a
+    constant number of queries. Invalid operations are reported and skipped.
+    Returns one result dict per operation, in input order.
+    """
+    results = [None] * len(operations)
+    adds, updates, deletes = [], [], []
+    for index, operation in enumerate(operations):
+        try:
+            _validate(operation)
+        except ValueError as e:
+            results[index] = {'index': index, 'op': operation.get('op'), 'status': 'error', 'message': str(e)}
+            continue
+        {'add': adds, 'update': updates, 'delete': deletes}[operation['op']].append((index, operation))
+
+    with transaction.atomic():
+        if adds:
+            _bulk_add(user, adds, results)
+        if updates:
+            _bulk_update(user, updates, results)
+        if deletes:
+            _bulk_delete(user, deletes, results)
+    return results
+
+
+def _bulk_add(user, adds, results):
+    entries = catalog.resolve([operation for _, operation in adds])
+    catalog_ids = {entry_key: catalog_id for entry_key, (catalog_id, _) in entries.items()}
+    existing = dict(
+        WatchlistItem.objects.filter(user=user, catalog_id__in=catalog_ids.values()).values_list('catalog_id', 'id')
+    )
+
+    new_items = {}
+    first_add = {}
+    for index, operation in adds:
+        catalog_id = catalog_ids[catalog.key(operation['media_type'], operation['media_id'])]
+        if catalog_id in existing or catalog_id in new_items:
+            continue
+        new_items[catalog_id] = build_item(user, operation, catalog_id)
+        first_add[catalog_id] = index
+    WatchlistItem.objects.bulk_create(new_items.values())
+
+    # Not every database returns primary keys from bulk_create, so read them back
+    created = dict(
+        WatchlistItem.objects.filter(user=user, catalog_id__in=new_items).values_list('catalog_id', 'id')
+    )
+    jobs.enqueue_many([catalog_id for catalog_id, enriched_at in entries.values() if enriched_at is None])
+
+    for index, operation in adds:
+        catalog_id = catalog_ids[catalog.key(operation['media_type'], operation['media_id'])]
+        if first_add.get(catalog_id) == index:
+            results[index] = {'index': index, 'op': 'add', 'status': 'success', 'id': created[catalog_id]}
+        else:
+            item_id = existing.get(catalog_id, created.get(catalog_id))
+            results[index] = {'index': index, 'op': 'add', 'status': 'exists', 'id': item_id}
+
+
+def _bulk_update(user, updates, results):
+    # The rows are read and written inside the same transaction, so
+    # preconditions and relative updates can be resolved in Python
+    items = WatchlistItem.objects.filter(user=user).in_bulk([operation['id'] for _, operation in updates])
+
+    now = timezone.now()
+    changed_fields = {'version', 'date_updated'}
+    changed_items = {}
+    for index, operation in updates:
+        item = items.get(operation['id'])
+        if item is None:
+            results[index] = {'index': index, 'op': 'update', 'status': 'error',
+                              'id': operation['id'], 'message': 'Item not found'}
+            continue
+        if not _matches(item, parse_precondition(operation)):
+            results[index] = {'index': index, 'op': 'update', 'status': 'conflict',
+                              'id': item.id, 'version': item.version,
+                              'message': 'Item was modified by another request'}
+            continue
+        for name, value in validate_update(operation).items():
+            if isinstance(value, dict):
+                value = getattr(item, name) + value['inc']
+            setattr(item, name, value)
+            changed_fields.add(name)
+        item.version += 1
+        item.date_updated = now
+        changed_items[item.id] = item
+        results[index] = {'index': index, 'op': 'update', 'status': 'success',
+                          'id': item.id, 'version': item.version}
+
+    # bulk_update skips auto_now, so date_updated is set explicitly above
+    WatchlistItem.objects.bulk_update(changed_items.values(), sorted(changed_fields))
+
+
+def _bulk_delete(user, deletes, results):
+    ids = [operation['id'] for _, operation in deletes]
+    queryset = WatchlistItem.objects.filter(user=user, id__in=ids)
+    found = set(queryset.values_list('id', flat=True))
+    queryset.delete()
+
+    for index, operation in deletes:
+        if operation['id'] in found:
+            results[index] = {'index': index, 'op': 'delete', 'status': 'success', 'id': operation['id']}
+        else:
+            results[index] = {'index': index, 'op': 'delete', 'status': 'error',
+                              'id': operation['id'], 'message': 'Item not found'}
@@ -0,0 +1,156 @@
+"""
+Page cache with speculative next-page prefetch for the paged catalog views.
+
+``shows``, ``animanga`` and ``books`` read their upstream pages through
+``get`` (or ``cached``/``store`` in the async views). After serving page N
+they ``schedule`` page N+1 with the same filters. It is then fetched on a
+small background pool and stored in the shared cache, so the infinite-scroll
+request for it doesn't wait on the upstream.
+
+Prefetching is bounded by ``settings.PREFETCH_MAX_INFLIGHT`` concurrent
+fetches and ``settings.PREFETCH_PER_MINUTE`` fetches per process. ``stats()``
+reports how many pages were served from cache and how many prefetches paid off.
+"""
+import collections
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import timing
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.PREFETCH_MAX_INFLIGHT,
+    thread_name_prefix='prefetch',
+)
+_inflight = set()
+_recent = collections.deque()  # Start times of prefetches in the last minute
+_lock = threading.Lock()
+
+_counters = {
+    'hits': 0,            # Pages served from cache
+    'prefetch_hits': 0,   # ...of which a prefetch had stored
+    'misses': 0,          # Pages fetched on the request path
+    'scheduled': 0,       # Prefetches started
+    'skipped': 0,         # Prefetches dropped by the budget
+    'completed': 0,       # Prefetches that stored a page
+    'failed': 0,
+}
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def stats():
+    """Counters for this process, with cache and prefetch hit rates."""
+    with _lock:
+        counters = dict(_counters)
+    lookups = counters['hits'] + counters['misses']
+    counters['hit_rate'] = round(counters['hits'] / lookups, 3) if lookups else None
+    counters['prefetch_hit_rate'] = (
+        round(counters['prefetch_hits'] / counters['completed'], 3) if counters['completed'] else None
+    )
+    return counters
+
+
+def _cache():
+    return caches[settings.PREFETCH_CACHE]
+
+
+def _key(namespace, params):
+    raw = json.dumps(params, sort_keys=True, default=str)
+    return f'prefetch:{namespace}:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+
+def cached(namespace, params):
+    """Return the cached page for ``params``, or ``None``."""
+    try:
+        entry = _cache().get(_key(namespace, params))
+    except Exception as e:
+        logger.warning(f"Page cache read failed: {str(e)}")
+        entry = None
+    if entry is None:
+        _count('misses')
+        timing.record_cache('page', False)
+        return None
+    _count('hits')
+    timing.record_cache('page', True)
+    if entry['prefetched']:
+        # Only the first read of a prefetched page counts as a prefetch hit
+        _count('prefetch_hits')
+        store(namespace, params, entry['data'])
+    return entry['data']
+
+
+def store(namespace, params, data, prefetched=False):
+    if isinstance(data, dict) and 'errors' in data:
+        # GraphQL reports failures in a 200 response; don't keep them
+        return
+    try:
+        _cache().set(_key(namespace, params), {'data': data, 'prefetched': prefetched}, settings.PREFETCH_TTL)
+    except Exception as e:
+        logger.warning(f"Page cache write failed: {str(e)}")
+
+
+def get(namespace, params, fetch):
+    """Return the page for ``params``, calling ``fetch()`` on a cache miss."""
+    data = cached(namespace, params)
+    if data is None:
+        data = fetch()
+        store(namespace, params, data)
+    return data
+
+
+def _take_budget(key):
+    now = time.monotonic()
+    with _lock:
+        while _recent and now - _recent[0] > 60:
+            _recent.popleft()
+        if key in _inflight:
+            return False
+        if len(_inflight) >= settings.PREFETCH_MAX_INFLIGHT or len(_recent) >= settings.PREFETCH_PER_MINUTE:
+            _counters['skipped'] += 1
+            return False
+        _inflight.add(key)
+        _recent.append(now)
+        _counters['scheduled'] += 1
+    return True
+
+
+def _prefetch(namespace, params, fetch, key):
+    try:
+        # Another worker may have fetched the page in the meantime
+        if _cache().get(key) is None:
+            store(namespace, params, fetch(), prefetched=True)
+            _count('completed')
+    except Exception as e:
+        _count('failed')
+        # Only the key: params can carry API keys
+        logger.warning(f"Prefetch of {namespace} page {key} failed: {str(e)}")
+    finally:
+        with _lock:
+            _inflight.discard(key)
+
+
+def schedule(namespace, params, fetch):
+    """Fetch the page for ``params`` in the background if the budget allows."""
+    if not settings.PREFETCH_ENABLED:
+        return
+    key = _key(namespace, params)
+    try:
+        if _cache().get(key) is not None:
+            # Already warm; keep the budget for pages that aren't
+            return
+    except Exception as e:
+        logger.warning(f"Page cache read failed: {str(e)}")
+    if _take_budget(key):
+        _executor.submit(_prefetch, namespace, params, fetch, key)
@@ -0,0 +1,124 @@
+"""
+Filtered, keyset-paginated watchlist queries.
+
+Pages are ordered by ``(sort field, id)`` and continue from an opaque cursor
+that encodes the last row's values. Every page is then a single index range
+scan, however deep into the list it is (see the indexes on ``WatchlistItem``).
+Titles live on the catalog entry, where no index can cover a user's rows, so
+sorting by title is left to ``search``.
+"""
+import base64
+import json
+
+from django.db.models import Count, Max, Q
+from django.utils.dateparse import parse_datetime
+
+from . import catalog
+from .models import WatchlistItem
+
+SORT_FIELDS = ('date_updated', 'date_added')
+DEFAULT_SORT = '-date_updated'
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def encode_cursor(value, item_id):
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    raw = json.dumps([value, item_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, item_id = json.loads(base64.urlsafe_b64decode(padded))
+        value, item_id = parse_datetime(value), int(item_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if value is None:
+        raise ValueError('Invalid cursor')
+    return value, item_id
+
+
+def parse_filters(params):
+    """Validate watchlist filters from a QueryDict; raises ``ValueError``."""
+    status = params.get('status') or None
+    if status and status not in dict(WatchlistItem.STATUS_CHOICES):
+        raise ValueError(f'Unknown status: {status}')
+
+    media_type = params.get('media_type') or None
+    if media_type and media_type not in dict(WatchlistItem.MEDIA_TYPES):
+        raise ValueError(f'Unknown media type: {media_type}')
+
+    sort = params.get('sort') or DEFAULT_SORT
+    if sort.lstrip('-') not in SORT_FIELDS:
+        raise ValueError(f'Unknown sort: {sort}')
+
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+
+    return {
+        'status': status,
+        'media_type': media_type,
+        'sort': sort,
+        'limit': max(1, min(limit, MAX_LIMIT)),
+        'cursor': params.get('cursor') or None,
+    }
+
+
+def watchlist_state(user, status=None, media_type=None):
+    """Summarize a filtered watchlist for cache validation.
+
+    Returns the row count, the latest ``date_updated`` of the rows and of
+    their catalog entries, and the number of rows whose entry is still waiting
+    for enrichment, from one aggregate query that doesn't read any rows out.
+    """
+    queryset = WatchlistItem.objects.filter(user=user)
+    if status:
+        queryset = queryset.filter(status=status)
+    if media_type:
+        queryset = queryset.filter(media_type=media_type)
+    return queryset.aggregate(
+        count=Count('id'),
+        last_updated=Max('date_updated'),
+        catalog_updated=Max('catalog__date_updated'),
+        pending=Count('id', filter=Q(catalog__enriched_at__isnull=True)),
+    )
+
+
+def watchlist_page(user, status=None, media_type=None, sort=DEFAULT_SORT, limit=DEFAULT_LIMIT, cursor=None):
+    """Return ``(rows, next_cursor)`` for one page of a user's watchlist.
+
+    ``rows`` are dicts as produced by ``catalog.serialize``; ``next_cursor``
+    is ``None`` on the last page.
+    """
+    descending = sort.startswith('-')
+    field = sort.lstrip('-')
+
+    queryset = WatchlistItem.objects.filter(user=user)
+    if status:
+        queryset = queryset.filter(status=status)
+    if media_type:
+        queryset = queryset.filter(media_type=media_type)
+
+    if cursor:
+        value, item_id = decode_cursor(cursor)
+        op = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': item_id})
+        )
+
+    prefix = '-' if descending else ''
+    # Fetch one extra row to learn whether there is a next page
+    items = queryset.select_related('catalog').order_by(f'{prefix}{field}', f'{prefix}id')[:limit + 1]
+    rows = [catalog.serialize(item) for item in items]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[field], last['id'])
+    return rows, next_cursor
@@ -0,0 +1,236 @@
+"""
+Per-upstream rate limiting for the shared HTTP client.
+
+Each upstream in ``settings.UPSTREAM_RATE_LIMITS`` gets a token bucket that
+refills at ``rate`` calls per second up to ``burst``. The bucket is a small
+file in ``settings.RATELIMIT_DIR``, next to the single-flight cache, so every
+worker process on the host draws from the same budget without touching the
+database: taking a token locks the file with ``flock``, refills and updates
+it, and unlocks it, which costs microseconds and never competes with
+watchlist writes for SQLite's writer lock. A call that finds the bucket empty
+reserves the next token and waits for it, as long as the wait is under
+``settings.RATELIMIT_MAX_WAIT``; otherwise it is shed with ``RateLimited``.
+If the bucket file can't be used the call is shed too; it never falls back
+to a budget of its own. Without ``fcntl`` (on Windows) the file is only
+locked against other threads of the same process.
+
+Responses feed back into the limiter: a 429's ``Retry-After``, or
+``X-RateLimit-Remaining: 0`` with ``X-RateLimit-Reset``, pauses that upstream
+for every worker until the provider's window reopens.
+"""
+import contextlib
+import email.utils
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+import httpx
+import requests
+from django.conf import settings
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_last_headers = {}
+_lock = threading.Lock()
+_file_lock = threading.Lock()  # Stands in for flock where there is none
+
+_counters = {}
+
+
+class RateLimited(requests.RequestException, httpx.HTTPError):
+    """A call was shed because its upstream's rate budget is exhausted.
+
+    Subclasses both client libraries' base errors, so views catch it wherever
+    they already handle a failed upstream call.
+    """
+
+    def __init__(self, name, retry_after):
+        super().__init__(f'{name} rate limit reached; retry in {retry_after:.1f}s')
+        self.upstream = name
+        self.retry_after = retry_after
+
+
+def upstream_name(url):
+    """The rate-limited upstream that ``url`` belongs to, or ``None``."""
+    prefixes = {
+        'tmdb': settings.TMDB_API_URL,
+        'anilist': settings.ANILIST_API_URL,
+        'google_books': settings.GOOGLE_BOOKS_API_URL,
+    }
+    for name, prefix in prefixes.items():
+        if url.startswith(prefix) and name in settings.UPSTREAM_RATE_LIMITS:
+            return name
+    return None
+
+
+def _count(name, counter):
+    with _lock:
+        counters = _counters.setdefault(name, {'admitted': 0, 'delayed': 0, 'shed': 0, 'throttled': 0})
+        counters[counter] += 1
+    metrics.inc('upstream_ratelimit_decisions_total', upstream=name, decision=counter)
+
+
+def _path(name):
+    return os.path.join(settings.RATELIMIT_DIR, f'{name}.json')
+
+
+@contextlib.contextmanager
+def _bucket(name):
+    """Lock ``name``'s bucket file; yields ``(state, save)``. Raises ``OSError``.
+
+    ``state`` is ``None`` for a new (or unreadable) bucket; ``save(state)``
+    replaces it before the lock is released.
+    """
+    os.makedirs(settings.RATELIMIT_DIR, exist_ok=True)
+    fd = os.open(_path(name), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        with contextlib.nullcontext() if fcntl else _file_lock:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                state = json.loads(os.read(fd, 4096) or 'null')
+            except ValueError:
+                state = None
+
+            def save(new_state):
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, json.dumps(new_state).encode())
+
+            yield state, save
+    finally:
+        # Closing the file releases the flock
+        os.close(fd)
+
+
+def _refill(state, limit, now):
+    if state is None:
+        return limit['burst']
+    return min(limit['burst'], state['tokens'] + max(0, now - state['stamp']) * limit['rate'])
+
+
+def _take(name, limit):
+    """Take a token; returns ``(admitted, wait)``. Raises ``OSError``."""
+    with _bucket(name) as (state, save):
+        now = time.time()
+        tokens = _refill(state, limit, now)
+        cooldown_until = state['cooldown_until'] if state else 0
+        wait = max(0, (1 - tokens) / limit['rate'], cooldown_until - now)
+        if wait > settings.RATELIMIT_MAX_WAIT:
+            return False, wait
+        save({'tokens': tokens - 1, 'stamp': max(state['stamp'] if state else now, now),
+              'cooldown_until': cooldown_until})
+        return True, wait
+
+
+def reserve(url):
+    """Reserve a call to ``url``; returns the seconds to wait before making it.
+
+    Raises ``RateLimited`` if the wait would exceed ``RATELIMIT_MAX_WAIT``.
+    """
+    name = upstream_name(url)
+    if name is None:
+        return 0
+
+    try:
+        admitted, wait = _take(name, settings.UPSTREAM_RATE_LIMITS[name])
+    except OSError as e:
+        logger.warning(f"Shared rate limit unavailable for {name}: {str(e)}")
+        admitted, wait = False, settings.RATELIMIT_MAX_WAIT
+
+    if not admitted:
+        _count(name, 'shed')
+        raise RateLimited(name, wait)
+    _count(name, 'delayed' if wait else 'admitted')
+    return wait
+
+
+def acquire(url):
+    """Block until a call to ``url`` fits the budget; see ``reserve``."""
+    wait = reserve(url)
+    if wait:
+        time.sleep(wait)
+
+
+def _retry_after(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+def observe(url, status_code, headers):
+    """Record an upstream response's rate limit signals."""
+    name = upstream_name(url)
+    if name is None:
+        return
+
+    now = time.time()
+    until = None
+    if status_code == 429:
+        _count(name, 'throttled')
+        retry_after = _retry_after(headers.get('Retry-After'))
+        until = now + (retry_after if retry_after is not None else settings.RATELIMIT_DEFAULT_COOLDOWN)
+    elif headers.get('X-RateLimit-Remaining') == '0' and headers.get('X-RateLimit-Reset'):
+        try:
+            until = float(headers['X-RateLimit-Reset'])
+        except ValueError:
+            pass
+
+    if 'X-RateLimit-Limit' in headers or 'X-RateLimit-Remaining' in headers:
+        with _lock:
+            _last_headers[name] = {
+                'limit': headers.get('X-RateLimit-Limit'),
+                'remaining': headers.get('X-RateLimit-Remaining'),
+                'reset': headers.get('X-RateLimit-Reset'),
+            }
+
+    if until is None or until <= now:
+        return
+    logger.warning(f"{name} asked us to back off for {until - now:.1f}s")
+    try:
+        with _bucket(name) as (state, save):
+            if state is None:
+                state = {'tokens': settings.UPSTREAM_RATE_LIMITS[name]['burst'], 'stamp': now, 'cooldown_until': 0}
+            if state['cooldown_until'] < until:
+                save({**state, 'cooldown_until': until})
+    except OSError as e:
+        logger.warning(f"Rate limit cooldown write failed: {str(e)}")
+
+
+def usage():
+    """Current budget per upstream, with this process's counters."""
+    now = time.time()
+    result = {}
+    for name, limit in settings.UPSTREAM_RATE_LIMITS.items():
+        try:
+            with _bucket(name) as (state, _):
+                pass
+        except OSError as e:
+            logger.warning(f"Rate limit bucket read failed: {str(e)}")
+            state = None
+        tokens = _refill(state, limit, now)
+        result[name] = {
+            'rate': limit['rate'],
+            'burst': limit['burst'],
+            'available': max(0, int(tokens)),
+            'queued': max(0, math.ceil(-tokens)),
+            'cooldown': round(max(0, state['cooldown_until'] - now), 1) if state else 0,
+            'headers': _last_headers.get(name),
+            'counters': dict(_counters.get(name, {})),
+        }
+    return result
@@ -0,0 +1,191 @@
+"""
+Full-text search and faceted filtering over a user's watchlist.
+
+On SQLite, text queries go through an FTS5 index over the catalog's title,
+creator and genres, and genre filters and counts use the ``CatalogGenre``
+table. Both are kept in sync with ``MediaCatalog`` by triggers (migration
+0008). Results are ranked by bm25 unless another sort is asked for. Facet
+counts for status, media type and genre are computed by the database, each
+with every filter applied except its own, so no rows are read out beyond the
+requested page.
+
+Other databases get the same API with ``icontains`` text matching and genre
+counts aggregated in Python.
+"""
+import re
+from collections import Counter
+
+from django.db import connection, connections
+from django.db.models import Count, Q
+from django.db.models.expressions import RawSQL
+
+from . import catalog
+from .models import CatalogGenre, WatchlistItem
+
+FTS_TABLE = 'enterainmentdjango_mediacatalog_fts'
+
+SORT_FIELDS = ('date_updated', 'date_added', 'title', 'rating', 'year')
+# Sort fields that live on the catalog entry
+CATALOG_SORT_FIELDS = {'title': 'catalog__title', 'year': 'catalog__year'}
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+GENRE_FACET_LIMIT = 30
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(text):
+    """An FTS5 query matching every word of ``text`` as a prefix, or ``None``."""
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def parse_params(params):
+    """Validate search parameters from a QueryDict; raises ``ValueError``."""
+    status = params.getlist('status')
+    unknown = set(status) - set(dict(WatchlistItem.STATUS_CHOICES))
+    if unknown:
+        raise ValueError(f'Unknown status: {", ".join(sorted(unknown))}')
+
+    media_type = params.getlist('media_type')
+    unknown = set(media_type) - set(dict(WatchlistItem.MEDIA_TYPES))
+    if unknown:
+        raise ValueError(f'Unknown media type: {", ".join(sorted(unknown))}')
+
+    q = params.get('q', '').strip()
+    sort = params.get('sort') or ('relevance' if q else '-date_updated')
+    if sort != 'relevance' and sort.lstrip('-') not in SORT_FIELDS:
+        raise ValueError(f'Unknown sort: {sort}')
+
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+        offset = int(params.get('offset', 0))
+    except ValueError:
+        raise ValueError('limit and offset must be integers')
+
+    return {
+        'q': q,
+        'status': status,
+        'media_type': media_type,
+        'genre': [genre for genre in params.getlist('genre') if genre],
+        'sort': sort,
+        'limit': max(1, min(limit, MAX_LIMIT)),
+        'offset': max(0, offset),
+    }
+
+
+def _text_filter(queryset, q):
+    if fts_enabled():
+        expression = match_expression(q)
+        if expression is None:
+            return queryset
+        # Runs the MATCH once, rather than once per candidate row
+        return queryset.filter(
+            catalog_id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression])
+        )
+
+    for word in q.split():
+        queryset = queryset.filter(Q(catalog__title__icontains=word) | Q(catalog__creator__icontains=word))
+    return queryset
+
+
+def _genre_filter(queryset, genres):
+    if fts_enabled():
+        return queryset.filter(catalog_id__in=CatalogGenre.objects.filter(name__in=genres).values('catalog_id'))
+    # JSON containment; matches any of the genres
+    matches = Q()
+    for genre in genres:
+        matches |= Q(catalog__genres__contains=[genre])
+    return queryset.filter(matches)
+
+
+def _filtered(user, q, status, media_type, genre, skip=None):
+    # Every filter except ``skip``, which is the facet being counted
+    queryset = WatchlistItem.objects.filter(user=user)
+    if q and skip != 'q':
+        queryset = _text_filter(queryset, q)
+    if status and skip != 'status':
+        queryset = queryset.filter(status__in=status)
+    if media_type and skip != 'media_type':
+        queryset = queryset.filter(media_type__in=media_type)
+    if genre and skip != 'genre':
+        queryset = _genre_filter(queryset, genre)
+    return queryset
+
+
+def _counts(queryset, field):
+    rows = queryset.order_by().values(field).annotate(count=Count('id'))
+    return {row[field]: row['count'] for row in rows}
+
+
+def _genre_counts(queryset):
+    if fts_enabled():
+        # A user tracks each entry at most once, so entries count as items
+        rows = (
+            CatalogGenre.objects
+            .filter(catalog_id__in=queryset.order_by().values('catalog_id'))
+            .values('name')
+            .annotate(count=Count('id'))
+            .order_by('-count', 'name')[:GENRE_FACET_LIMIT]
+        )
+        return {row['name']: row['count'] for row in rows}
+
+    counts = Counter()
+    for genres in queryset.values_list('catalog__genres', flat=True):
+        counts.update(set(genres or []))
+    return dict(sorted(counts.items(), key=lambda entry: (-entry[1], entry[0]))[:GENRE_FACET_LIMIT])
+
+
+def facets(user, q='', status=(), media_type=(), genre=()):
+    """Counts per status, media type and genre for a search."""
+    filters = {'q': q, 'status': status, 'media_type': media_type, 'genre': genre}
+    return {
+        'status': _counts(_filtered(user, **filters, skip='status'), 'status'),
+        'media_type': _counts(_filtered(user, **filters, skip='media_type'), 'media_type'),
+        'genre': _genre_counts(_filtered(user, **filters, skip='genre')),
+    }
+
+
+def _ranked(queryset, expression, limit, offset):
+    # FTS5's rank column is bm25, lower is better. The matches are
+    # materialized first; a rowid constraint on the FTS table itself would
+    # re-run the MATCH for every candidate id
+    candidates, params = queryset.order_by().values('catalog_id').query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            f'WITH matches AS MATERIALIZED (SELECT rowid, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s) '
+            f'SELECT rowid FROM matches WHERE rowid IN ({candidates}) ORDER BY rank LIMIT %s OFFSET %s',
+            [expression, *params, limit, offset],
+        )
+        catalog_ids = [row[0] for row in cursor.fetchall()]
+    items = {item.catalog_id: item for item in queryset.filter(catalog_id__in=catalog_ids).select_related('catalog')}
+    return [catalog.serialize(items[catalog_id]) for catalog_id in catalog_ids if catalog_id in items]
+
+
+def search(user, q='', status=(), media_type=(), genre=(), sort='-date_updated', limit=DEFAULT_LIMIT, offset=0):
+    """Return ``(rows, total)`` for one page of watchlist search results.
+
+    ``rows`` are dicts as produced by ``catalog.serialize``. ``sort`` is a
+    field from ``SORT_FIELDS``, optionally prefixed with ``-``, or
+    ``'relevance'`` to rank text matches.
+    """
+    queryset = _filtered(user, q, status, media_type, genre)
+    total = queryset.count()
+
+    expression = match_expression(q) if fts_enabled() else None
+    if sort == 'relevance' and expression:
+        return _ranked(_filtered(user, q, status, media_type, genre, skip='q'), expression, limit, offset), total
+
+    if sort == 'relevance':
+        queryset = queryset.order_by('-date_updated', '-id')
+    else:
+        prefix = '-' if sort.startswith('-') else ''
+        field = sort.lstrip('-')
+        queryset = queryset.order_by(f'{prefix}{CATALOG_SORT_FIELDS.get(field, field)}', f'{prefix}id')
+
+    items = queryset.select_related('catalog')[offset:offset + limit]
+    return [catalog.serialize(item) for item in items], total
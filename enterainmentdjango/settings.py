@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 import mimetypes
 mimetypes.add_type("text/javascript", ".js", True)
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'enterainmentdjango.timing.ServerTimingMiddleware',  # First, so it times the rest
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,7 +64,7 @@ ROOT_URLCONF = 'enterainmentdjango.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'enterainmentdjango.timing.TimedDjangoTemplates',
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -81,11 +83,82 @@ WSGI_APPLICATION = 'enterainmentdjango.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# SQLite in WAL mode: readers don't block the writer or each other. Every
+# connection runs SQLITE_PRAGMAS when it opens and is kept for
+# DB_CONN_MAX_AGE seconds. Writes take the lock when their transaction
+# begins (IMMEDIATE), so two writers queue on busy_timeout instead of one
+# failing with "database is locked" when it upgrades from a read.
+SQLITE_PRAGMAS = {
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),  # ms to wait for a lock
+    'synchronous': 'NORMAL',  # Durable in WAL mode; syncs at checkpoints
+    'cache_size': -int(os.getenv('SQLITE_CACHE_KB', 20000)),  # Negative means KiB
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 128 * 1024 * 1024)),
+}
+SQLITE_INIT_COMMAND = ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items())
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 600))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': f'PRAGMA journal_mode=WAL;{SQLITE_INIT_COMMAND}',
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Same file, opened query-only; see db_routing.py
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': f'{SQLITE_INIT_COMMAND};PRAGMA query_only=ON',
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+DATABASE_ROUTERS = ['enterainmentdjango.db_routing.ReadOnlyRouter']
+READ_ONLY_DATABASE = 'replica'
+
+
+# Caches
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# 'default' is persistent and shared by every worker process (run
+# `python manage.py createcachetable` once); 'local' is a per-process LRU.
+
+COORDINATION_CACHE_DIR = os.getenv(
+    'COORDINATION_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'enterainment-coordination')
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('SHARED_CACHE_MAX_ENTRIES', 50000)),
+        },
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'enterainment-local',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('LOCAL_CACHE_MAX_ENTRIES', 2000)),
+        },
+    },
+    # Short-lived coordination between worker processes, kept off the database
+    'coordination': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': COORDINATION_CACHE_DIR,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
 }
 
 
@@ -139,6 +212,152 @@ AWS_COGNITO_REGION = os.getenv('AWS_COGNITO_REGION')
 TMDB_API_KEY = os.getenv('TMDB_API_KEY')
 GOOGLE_BOOKS_API_KEY = os.getenv('GOOGLE_BOOKS_API_KEY')
 
+# Upstream API base URLs (override to point at a local stub)
+TMDB_API_URL = os.getenv('TMDB_API_URL', 'https://api.themoviedb.org/3')
+ANILIST_API_URL = os.getenv('ANILIST_API_URL', 'https://graphql.anilist.co')
+GOOGLE_BOOKS_API_URL = os.getenv('GOOGLE_BOOKS_API_URL', 'https://www.googleapis.com/books/v1')
+
+# Shared upstream HTTP client: (connect, read) timeouts in seconds, pooled
+# connections per host and retries for idempotent calls (each one rate-limited)
+UPSTREAM_TIMEOUT = (3.05, 10)
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', 20))
+UPSTREAM_ASYNC_POOL_SIZE = int(os.getenv('UPSTREAM_ASYNC_POOL_SIZE', 200))  # Per event loop
+UPSTREAM_RETRIES = 2
+UPSTREAM_BACKOFF = 0.3
+
+# Single-flight coalescing of identical in-flight upstream calls. Worker
+# processes coordinate through SINGLEFLIGHT_CACHE (set it empty to coalesce
+# within each process only); waiters poll it for up to SINGLEFLIGHT_WAIT seconds
+SINGLEFLIGHT_CACHE = os.getenv('SINGLEFLIGHT_CACHE', 'coordination')
+SINGLEFLIGHT_LOCK_TIMEOUT = 30  # Longer than a call with all its retries
+SINGLEFLIGHT_RESULT_TTL = 10
+SINGLEFLIGHT_WAIT = 15
+SINGLEFLIGHT_POLL_INTERVAL = 0.05
+
+# Per-upstream token buckets shared by all workers through files in
+# RATELIMIT_DIR: `rate` calls per second with bursts of up to `burst`, retries
+# included. Calls wait up to RATELIMIT_MAX_WAIT seconds for a token before they
+# are shed
+# https://developer.themoviedb.org/docs/rate-limiting
+# https://docs.anilist.co/guide/rate-limiting
+UPSTREAM_RATE_LIMITS = {
+    'tmdb': {'rate': 40, 'burst': 40},
+    'anilist': {'rate': 1.5, 'burst': 10},  # 90 per minute
+    'google_books': {'rate': 10, 'burst': 20},
+}
+RATELIMIT_MAX_WAIT = 5
+RATELIMIT_DIR = os.path.join(COORDINATION_CACHE_DIR, 'ratelimit')
+RATELIMIT_DEFAULT_COOLDOWN = 60  # For a 429 without Retry-After
+
+# Metadata cache used by views.iteminfo: cache aliases and TTLs in seconds
+METADATA_CACHE_LOCAL = 'local'
+METADATA_CACHE_SHARED = 'default'
+METADATA_CACHE_TTLS = {
+    'movie': 7 * 24 * 60 * 60,
+    'tv': 24 * 60 * 60,  # Episode counts change while a show is airing
+    'anime': 24 * 60 * 60,
+    'manga': 24 * 60 * 60,
+    'book': 30 * 24 * 60 * 60,
+    'default': 24 * 60 * 60,
+}
+
+# Concurrent watchlist enrichment: worker threads, seconds to wait per request
+# and maximum simultaneous calls per upstream
+ENRICHMENT_MAX_WORKERS = int(os.getenv('ENRICHMENT_MAX_WORKERS', 16))
+ENRICHMENT_DEADLINE = float(os.getenv('ENRICHMENT_DEADLINE', 2.0))
+ENRICHMENT_UPSTREAM_CONCURRENCY = {
+    'tmdb': 8,
+    'anilist': 2,
+    'google_books': 4,
+}
+
+# AniList ids per batched metadata query (AniList caps pages at 50)
+ANILIST_BATCH_SIZE = 50
+
+# Google Books volume store (see volumes.py). Searches are cached as volume id
+# lists; stored volumes older than BOOK_VOLUME_MAX_AGE are downloaded again
+BOOKS_SEARCH_CACHE = 'default'
+BOOKS_SEARCH_TTL = 6 * 60 * 60
+BOOK_VOLUME_MAX_AGE = 30 * 24 * 60 * 60
+GOOGLE_BOOKS_BATCH_SIZE = 20
+
+# Page cache and next-page prefetch for shows, animanga and books (see
+# prefetch.py). Prefetching is capped per process
+PREFETCH_ENABLED = True
+PREFETCH_CACHE = 'default'
+PREFETCH_TTL = 5 * 60
+PREFETCH_MAX_INFLIGHT = 4
+PREFETCH_PER_MINUTE = 60
+
+# Detail-page records (see detail_cache.py), fresh for DETAIL_CACHE_TTLS
+# seconds and then served stale for up to DETAIL_STALE_TTL more while a
+# background refresh replaces them
+DETAIL_CACHE = 'default'
+DETAIL_CACHE_TTLS = {
+    'movie': 24 * 60 * 60,
+    'tv': 6 * 60 * 60,  # Airing shows gain seasons and episodes
+}
+DETAIL_STALE_TTL = 7 * 24 * 60 * 60
+DETAIL_REFRESH_WORKERS = 2
+DETAIL_REFRESH_LOCK_TIMEOUT = 60
+
+# AniList detail pages (see animanga_details.py): the core record and each
+# lazily loaded section are cached for their own TTL
+ANIMANGA_DETAIL_TTLS = {
+    'core': 6 * 60 * 60,
+    'characters': 7 * 24 * 60 * 60,
+    'staff': 7 * 24 * 60 * 60,
+    'reviews': 24 * 60 * 60,
+    'recommendations': 24 * 60 * 60,
+}
+ANIMANGA_SECTION_PER_PAGE = 25
+ANIMANGA_SECTION_MAX_PAGE = 20  # Later pages are clamped to this one
+
+# Trending snapshots (see `python manage.py refresh_trending`). Web processes
+# re-read the stored snapshots every TRENDING_RELOAD_INTERVAL seconds
+TRENDING_REFRESH_INTERVAL = int(os.getenv('TRENDING_REFRESH_INTERVAL', 3 * 60 * 60))
+TRENDING_RELOAD_INTERVAL = 60
+
+# Write-time enrichment job queue (see `python manage.py process_enrichment_jobs`)
+ENRICHMENT_JOB_MAX_ATTEMPTS = 5
+ENRICHMENT_JOB_BACKOFF = 30  # seconds before the first retry, doubled per attempt
+ENRICHMENT_JOB_TIMEOUT = 300  # seconds before a running job is considered abandoned
+
+# Per-request timing (see timing.py): a Server-Timing header on every
+# response and a JSON line per request on the enterainmentdjango.timing
+# logger. Requests slower than SLOW_REQUEST_MS log every call they made, up
+# to SERVER_TIMING_MAX_CALLS
+SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', 'true').lower() == 'true'
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 1000))
+SERVER_TIMING_MAX_CALLS = 500
+
+# Prometheus metrics at /metrics (see metrics.py). Each worker process writes
+# its totals to METRICS_DIR every METRICS_FLUSH_INTERVAL seconds; clear the
+# directory on deploy
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'enterainment-metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+# /metrics and the job queue and upstream stats endpoints only answer these
+# addresses or `Authorization: Bearer <METRICS_TOKEN>`; anyone else gets a 404
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'enterainmentdjango.timing': {
+            'handlers': ['console'],
+            'level': os.getenv('TIMING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,286 @@
+"""
+Single-flight coalescing of identical concurrent upstream calls.
+
+Calls are keyed by method, URL, params, JSON body and headers. While a call is
+in flight, identical calls from other threads (or coroutines on the same event
+loop) wait for it and get the same response instead of sending their own.
+
+Threads are coalesced first, in this process's table of in-flight calls;
+only the thread leading a call coordinates with other worker processes. It
+takes a lock in ``settings.SINGLEFLIGHT_CACHE``, a cheap cache kept apart from
+the database (a file cache by default; point it at Redis or Memcached when
+there is one). Processes that find the lock taken mark themselves as waiting,
+and the leader only publishes the response when someone is. The file cache's
+``add`` isn't atomic across processes, so two processes can occasionally both
+lead; that costs a duplicate call, never a wrong response.
+
+Only in-flight calls are shared: a call that starts after the previous one
+finished goes upstream again. ``stats()`` reports how many calls were
+deduplicated in this process.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+_calls = {}
+_calls_lock = threading.Lock()
+_async_calls = weakref.WeakKeyDictionary()  # event loop -> {key: future}
+
+_counters = {
+    'calls': 0,       # Coalescable calls made
+    'executed': 0,    # Calls sent upstream by this process
+    'coalesced': 0,   # Calls that shared another thread's in-flight call
+    'shared': 0,      # Calls answered by another process's in-flight call
+    'fallbacks': 0,   # Waits on another process that gave up and went upstream
+}
+_counters_lock = threading.Lock()
+
+# Hop-by-hop details that don't apply to a re-served body
+_DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def stats():
+    """Counters for this process, with the number of upstream calls saved."""
+    with _counters_lock:
+        counters = dict(_counters)
+    counters['deduplicated'] = counters['coalesced'] + counters['shared']
+    return counters
+
+
+def key(method, url, params=None, json_body=None, headers=None):
+    """Normalized identity of an upstream call."""
+    raw = json.dumps([
+        method.upper(),
+        url,
+        sorted((name, str(value)) for name, value in (params or {}).items() if value is not None),
+        json_body,
+        sorted((headers or {}).items()),
+    ], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _cache():
+    if not settings.SINGLEFLIGHT_CACHE:
+        return None
+    return caches[settings.SINGLEFLIGHT_CACHE]
+
+
+def _freeze(status_code, headers, content, url):
+    headers = {name: value for name, value in headers.items() if name.lower() not in _DROPPED_HEADERS}
+    return {'status_code': status_code, 'headers': headers, 'content': content, 'url': str(url)}
+
+
+def _thaw(frozen):
+    response = requests.Response()
+    response.status_code = frozen['status_code']
+    response.headers = CaseInsensitiveDict(frozen['headers'])
+    response._content = frozen['content']
+    response.url = frozen['url']
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response
+
+
+def _thaw_async(frozen, method):
+    return httpx.Response(
+        frozen['status_code'],
+        headers=frozen['headers'],
+        content=frozen['content'],
+        request=httpx.Request(method, frozen['url']),
+    )
+
+
+def _lock_key(call_key):
+    return f'singleflight:lock:{call_key}'
+
+
+def _result_key(token):
+    return f'singleflight:result:{token}'
+
+
+def _waiting_key(token):
+    return f'singleflight:waiting:{token}'
+
+
+def _shared(call_key, fetch):
+    cache = _cache()
+    token = uuid.uuid4().hex
+    try:
+        leader = cache is None or cache.add(_lock_key(call_key), token, settings.SINGLEFLIGHT_LOCK_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Single-flight lock failed: {str(e)}")
+        cache, leader = None, True
+
+    if leader:
+        _count('executed')
+        if cache is None:
+            return fetch()
+        try:
+            response = fetch()
+            # 5xx responses aren't shared; the waiters retry on their own
+            try:
+                publish = response.status_code < 500 and cache.get(_waiting_key(token))
+            except Exception as e:
+                logger.warning(f"Single-flight waiter check failed: {str(e)}")
+                publish = False
+            if publish:
+                try:
+                    cache.set(_result_key(token), _freeze(
+                        response.status_code, response.headers, response.content, response.url
+                    ), settings.SINGLEFLIGHT_RESULT_TTL)
+                except Exception as e:
+                    logger.warning(f"Single-flight publish failed: {str(e)}")
+            return response
+        finally:
+            try:
+                cache.delete(_lock_key(call_key))
+            except Exception as e:
+                logger.warning(f"Single-flight unlock failed: {str(e)}")
+
+    # Another process is making this call; wait for its response
+    deadline = time.monotonic() + settings.SINGLEFLIGHT_WAIT
+    try:
+        token = cache.get(_lock_key(call_key))
+        if token is not None:
+            cache.set(_waiting_key(token), 1, settings.SINGLEFLIGHT_LOCK_TIMEOUT)
+        while token is not None and time.monotonic() < deadline:
+            time.sleep(settings.SINGLEFLIGHT_POLL_INTERVAL)
+            frozen = cache.get(_result_key(token))
+            if frozen is not None:
+                _count('shared')
+                return _thaw(frozen)
+            if cache.get(_lock_key(call_key)) != token:
+                break
+    except Exception as e:
+        logger.warning(f"Single-flight wait failed: {str(e)}")
+
+    _count('fallbacks')
+    _count('executed')
+    return fetch()
+
+
+def do(call_key, fetch):
+    """Return ``fetch()``, sharing one in-flight call per ``call_key``."""
+    _count('calls')
+    with _calls_lock:
+        call = _calls.get(call_key)
+        leader = call is None
+        if leader:
+            call = _calls[call_key] = {'done': threading.Event(), 'response': None, 'error': None}
+
+    if not leader:
+        _count('coalesced')
+        call['done'].wait()
+        if call['error'] is not None:
+            raise call['error']
+        return call['response']
+
+    try:
+        call['response'] = _shared(call_key, fetch)
+        return call['response']
+    except Exception as e:
+        call['error'] = e
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[call_key]
+        call['done'].set()
+
+
+async def _shared_async(call_key, method, fetch):
+    cache = _cache()
+    token = uuid.uuid4().hex
+    try:
+        leader = cache is None or await cache.aadd(_lock_key(call_key), token, settings.SINGLEFLIGHT_LOCK_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Single-flight lock failed: {str(e)}")
+        cache, leader = None, True
+
+    if leader:
+        _count('executed')
+        if cache is None:
+            return await fetch()
+        try:
+            response = await fetch()
+            try:
+                publish = response.status_code < 500 and await cache.aget(_waiting_key(token))
+            except Exception as e:
+                logger.warning(f"Single-flight waiter check failed: {str(e)}")
+                publish = False
+            if publish:
+                try:
+                    await cache.aset(_result_key(token), _freeze(
+                        response.status_code, response.headers, response.content, response.url
+                    ), settings.SINGLEFLIGHT_RESULT_TTL)
+                except Exception as e:
+                    logger.warning(f"Single-flight publish failed: {str(e)}")
+            return response
+        finally:
+            try:
+                await cache.adelete(_lock_key(call_key))
+            except Exception as e:
+                logger.warning(f"Single-flight unlock failed: {str(e)}")
+
+    deadline = time.monotonic() + settings.SINGLEFLIGHT_WAIT
+    try:
+        token = await cache.aget(_lock_key(call_key))
+        if token is not None:
+            await cache.aset(_waiting_key(token), 1, settings.SINGLEFLIGHT_LOCK_TIMEOUT)
+        while token is not None and time.monotonic() < deadline:
+            await asyncio.sleep(settings.SINGLEFLIGHT_POLL_INTERVAL)
+            frozen = await cache.aget(_result_key(token))
+            if frozen is not None:
+                _count('shared')
+                return _thaw_async(frozen, method)
+            if await cache.aget(_lock_key(call_key)) != token:
+                break
+    except Exception as e:
+        logger.warning(f"Single-flight wait failed: {str(e)}")
+
+    _count('fallbacks')
+    _count('executed')
+    return await fetch()
+
+
+async def do_async(call_key, method, fetch):
+    """Async ``do``; ``fetch`` is a coroutine function returning an ``httpx.Response``.
+
+    The call runs in a task of its own that every caller, the first one
+    included, awaits through ``asyncio.shield``: a cancelled caller (a client
+    that disconnected, say) stops waiting without cancelling the call for the
+    others, and the call finishes even if every caller gave up on it.
+    """
+    _count('calls')
+    loop = asyncio.get_running_loop()
+    calls = _async_calls.setdefault(loop, {})
+    task = calls.get(call_key)
+    if task is not None:
+        _count('coalesced')
+    else:
+        task = calls[call_key] = loop.create_task(_shared_async(call_key, method, fetch))
+        task.add_done_callback(lambda done: _finish_async(calls, call_key, done))
+    return await asyncio.shield(task)
+
+
+def _finish_async(calls, call_key, task):
+    if calls.get(call_key) is task:
+        del calls[call_key]
+    if not task.cancelled():
+        task.exception()  # Retrieved here in case nobody was waiting
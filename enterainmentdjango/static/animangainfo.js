@@ -0,0 +1,72 @@
+/**
+ * Tabs for the anime info page.
+ * Characters, staff, reviews and recommendations are not part of the first
+ * render; each is fetched a page at a time the first time its tab is shown.
+ * @param {Object} urls - Section name -> JSON endpoint
+ * @returns {Object} Alpine.js component configuration
+ */
+function animangaInfo(urls) {
+    // Sections shown by each tab
+    const tabSections = {
+        details: ['staff', 'characters'],
+        recommendations: ['recommendations'],
+        reviews: ['reviews'],
+    };
+
+    const emptySection = () => ({ items: [], page: 0, hasNext: true, loading: false, error: null });
+
+    return {
+        activeTab: 'details',
+        isLoading: false,
+        showSpoilers: false,
+        watchlistStatus: false,
+        sections: Object.fromEntries(Object.keys(urls).map(name => [name, emptySection()])),
+
+        init() {
+            this.loadTab(this.activeTab);
+        },
+
+        switchTab(tabName) {
+            this.isLoading = true;
+            this.activeTab = tabName;
+            this.loadTab(tabName);
+            setTimeout(() => this.isLoading = false, 300);
+        },
+
+        loadTab(tabName) {
+            (tabSections[tabName] || [])
+                .filter(name => this.sections[name].page === 0)
+                .forEach(name => this.loadMore(name));
+        },
+
+        async loadMore(name) {
+            const section = this.sections[name];
+            if (section.loading || !section.hasNext) return;
+
+            section.loading = true;
+            section.error = null;
+            try {
+                const response = await fetch(`${urls[name]}?page=${section.page + 1}`);
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                const data = await response.json();
+                section.items.push(...data.items);
+                section.page = data.page;
+                section.hasNext = data.has_next;
+            } catch (error) {
+                console.error(`Error loading ${name}:`, error);
+                section.error = `Couldn't load ${name}.`;
+            } finally {
+                section.loading = false;
+            }
+        },
+
+        toggleSpoilers() {
+            this.showSpoilers = !this.showSpoilers;
+        },
+
+        toggleWatchlist() {
+            this.watchlistStatus = !this.watchlistStatus;
+            // Here you could add actual API call to update watchlist
+        }
+    };
+}
@@ -2,6 +2,7 @@ function watchlistApp() {
     return {
         currentTab: 'watching',
         items: [],
+        itemIndex: new Map(), // id -> item, so lookups survive sorting and deletes
         sortBy: 'title',
         searchQuery: '', // Add this
         filterOption: 'all', // Add this
@@ -51,46 +52,111 @@ function watchlistApp() {
                 }));
         },
         
+        normalizeItem(item) {
+            // Ensure each item has required properties
+            return {
+                ...item,
+                genres: item.genres || [],
+                rating: item.rating || 0,
+                progress: item.progress || 0,
+                creator: item.creator || 'Unknown',
+                year: item.year || '',
+                total_episodes: item.total_episodes || '?'
+            };
+        },
+
         async loadWatchlist() {
             console.log('Loading watchlist...');
             try {
-                const response = await fetch('/api/watchlist/');  // Add trailing slash
-                if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-                const data = await response.json();
-                // Ensure each item has required properties
-                this.items = data.map(item => ({
-                    ...item,
-                    genres: item.genres || [],
-                    rating: item.rating || 0,
-                    progress: item.progress || 0,
-                    creator: item.creator || 'Unknown',
-                    year: item.year || '',
-                    total_episodes: item.total_episodes || '?',
-                    originalStatus: item.status // Add this line
-                }));
+                this.items = [];
+                this.itemIndex = new Map();
+                // Rows arrive first, additional info is patched in as it is looked up.
+                // Pages are fetched one after another until the server runs out of cursors.
+                let cursor = null;
+                do {
+                    const params = new URLSearchParams({ limit: 200 });
+                    if (cursor) params.set('cursor', cursor);
+                    const response = await fetch(`/api/watchlist/stream/?${params}`);
+                    if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+                    cursor = null;
+                    await this.readStream(response, message => {
+                        if (message.type === 'done') cursor = message.next_cursor;
+                        this.applyStreamMessage(message);
+                    });
+                } while (cursor);
                 console.log('Watchlist loaded:', this.items);
             } catch (error) {
                 console.error('Error loading watchlist:', error);
                 this.items = [];
+                this.itemIndex = new Map();
+            }
+        },
+
+        async readStream(response, onMessage) {
+            // Parse a newline-delimited JSON response, handing over each message as soon as it is complete
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                lines.filter(line => line.trim()).forEach(line => onMessage(JSON.parse(line)));
+            }
+            if (buffer.trim()) onMessage(JSON.parse(buffer));
+        },
+
+        applyStreamMessage(message) {
+            switch (message.type) {
+                case 'item':
+                    this.items.push({
+                        ...this.normalizeItem(message.item),
+                        originalStatus: message.item.status
+                    });
+                    // The stored element, which is the reactive one
+                    this.itemIndex.set(message.item.id, this.items[this.items.length - 1]);
+                    break;
+                case 'patch': {
+                    const item = this.itemIndex.get(message.id);
+                    if (item) Object.assign(item, this.normalizeItem({ ...item, ...message.fields }));
+                    break;
+                }
+                case 'done':
+                    break;
+                default:
+                    console.warn('Unknown watchlist stream message:', message.type);
             }
         },
         
+        async saveItemFields(item, fields) {
+            // Send only the changed fields. The version makes the server reject the
+            // write with a 409 if the item was changed elsewhere (e.g. another tab).
+            const response = await fetch('/api/watchlist/update/', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value
+                },
+                body: JSON.stringify({ id: item.id, version: item.version, ...fields })
+            });
+            const result = await response.json();
+            // Both success and conflict responses carry the item's current values
+            if (result.item) Object.assign(item, result.item);
+            if (response.status === 409) throw new Error('Item was changed elsewhere and has been refreshed');
+            if (!response.ok) throw new Error(result.message || `HTTP error! status: ${response.status}`);
+            return result;
+        },
+
         async updateStatus(item) {
             console.log('Updating status:', item);
             try {
-                const response = await fetch('/api/watchlist/update/', {  // Add trailing slash
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value
-                    },
-                    body: JSON.stringify(item)
-                });
-                if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-                const result = await response.json();
+                const result = await this.saveItemFields(item, { status: item.status, progress: item.progress });
                 console.log('Update result:', result);
             } catch (error) {
                 console.error('Error updating status:', error);
+                this.showNotification(error.message, 'error');
             }
         },
 
@@ -139,22 +205,8 @@ function watchlistApp() {
             const normalizedRating = this.normalizeRating(item, rating);
             
             try {
-                const response = await fetch('/api/watchlist/update/', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value
-                    },
-                    body: JSON.stringify({
-                        id: item.id,
-                        rating: normalizedRating
-                    })
-                });
-
-                if (!response.ok) throw new Error('Failed to update rating');
-                
-                // Update local state
-                item.rating = normalizedRating;
+                // Updates local state from the server's response
+                await this.saveItemFields(item, { rating: normalizedRating });
                 this.showNotification('Rating updated');
             } catch (error) {
                 this.showNotification('Failed to update rating', 'error');
@@ -197,6 +249,7 @@ function watchlistApp() {
                 
                 // Remove item from local state only after successful deletion
                 this.items = this.items.filter(i => i.id !== item.id);
+                this.itemIndex.delete(item.id);
                 this.showNotification(data.message || 'Item successfully deleted');
                 
             } catch (error) {
@@ -208,15 +261,7 @@ function watchlistApp() {
 
         async updateItem(item) {
             try {
-                const response = await fetch('/api/watchlist/update', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value
-                    },
-                    body: JSON.stringify(item)
-                });
-                if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+                await this.saveItemFields(item, { status: item.status, progress: item.progress });
             } catch (error) {
                 console.error('Error updating item:', error);
                 this.showNotification('Error updating item', 'error');
@@ -294,34 +339,16 @@ function watchlistApp() {
             }));
         },
 
-        updateProgress(itemId, progress) {
-            // Implement API call to update progress
-            fetch(`/api/watchlist/update_progress/`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-CSRFToken': this.csrfToken
-                },
-                body: JSON.stringify({ item_id: itemId, progress: progress })
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    // Update progress in UI
-                    this.watchlistItems.forEach(item => {
-                        if (item.id === itemId) {
-                            item.progress = progress;
-                        }
-                    });
-                    this.showNotification('Progress updated successfully', 'success');
-                } else {
-                    this.showNotification('Error updating progress', 'error');
-                }
-            })
-            .catch(error => {
+        async updateProgress(itemId, progress) {
+            const item = this.itemIndex.get(itemId);
+            if (!item) return;
+            try {
+                await this.saveItemFields(item, { progress: progress });
+                this.showNotification('Progress updated successfully', 'success');
+            } catch (error) {
                 console.error('Error updating progress:', error);
-                this.showNotification('Error updating progress', 'error');
-            });
+                this.showNotification(error.message || 'Error updating progress', 'error');
+            }
         },
 
         getCreatorText(item) {
@@ -1,3 +1,870 @@
-from django.test import TestCase
+import asyncio
+import collections
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import animanga_details, db_routing, detail_cache, jobs, metadata_cache, metrics, mutations, prefetch, queries, ratelimit, search, singleflight, timing, trending, upstream, views, volumes
+from .models import BookVolume, CatalogGenre, EnrichmentJob, MediaCatalog, TrendingSnapshot, WatchlistItem
+
+TMDB_URL = f'{settings.TMDB_API_URL}/movie/603'
+
+
+def fake_response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response._content = b'{}'
+    return response
+
+
+@override_settings(
+    UPSTREAM_RATE_LIMITS={'tmdb': {'rate': 0.5, 'burst': 2}},
+    RATELIMIT_MAX_WAIT=3,
+    UPSTREAM_RETRIES=2,
+    UPSTREAM_BACKOFF=0,
+)
+class RateLimiterTests(SimpleTestCase):
+    # A SimpleTestCase, so any database query fails the test: the buckets
+    # must not compete with watchlist writes for SQLite's writer lock
+
+    def setUp(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        patch = override_settings(RATELIMIT_DIR=workdir.name)
+        patch.__enter__()
+        self.addCleanup(patch.__exit__, None, None, None)
+
+    def test_burst_then_queue_then_shed(self):
+        self.assertEqual(ratelimit.reserve(TMDB_URL), 0)
+        self.assertEqual(ratelimit.reserve(TMDB_URL), 0)
+        # The bucket is empty: the next token is 2s away, under the 3s limit
+        self.assertAlmostEqual(ratelimit.reserve(TMDB_URL), 2, delta=0.1)
+        # ...and the one after that 4s away, so it is shed
+        with self.assertRaises(ratelimit.RateLimited):
+            ratelimit.reserve(TMDB_URL)
+
+        usage = ratelimit.usage()['tmdb']
+        self.assertEqual(usage['available'], 0)
+        self.assertEqual(usage['queued'], 1)
+
+    @override_settings(UPSTREAM_RATE_LIMITS={'tmdb': {'rate': 0.001, 'burst': 5}}, RATELIMIT_MAX_WAIT=0)
+    def test_concurrent_callers_share_the_bucket(self):
+        admitted = []
+
+        def call():
+            try:
+                ratelimit.reserve(TMDB_URL)
+                admitted.append(True)
+            except ratelimit.RateLimited:
+                pass
+
+        threads = [threading.Thread(target=call) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(admitted), 5)
+
+    def test_unreadable_bucket_sheds(self):
+        with mock.patch.object(ratelimit.os, 'open', side_effect=PermissionError('denied')):
+            with self.assertRaises(ratelimit.RateLimited):
+                ratelimit.reserve(TMDB_URL)
+
+    def test_unlimited_upstream_is_not_counted(self):
+        self.assertEqual(ratelimit.reserve('https://example.com/'), 0)
+
+    def test_retry_after_pauses_the_upstream(self):
+        ratelimit.observe(TMDB_URL, 429, {'Retry-After': '60'})
+        with self.assertRaises(ratelimit.RateLimited):
+            ratelimit.reserve(TMDB_URL)
+        self.assertGreater(ratelimit.usage()['tmdb']['cooldown'], 50)
+
+    def test_retries_take_tokens(self):
+        session = mock.Mock()
+        session.request.side_effect = [fake_response(503), fake_response(200)]
+        with mock.patch.object(upstream, 'session_for', return_value=session):
+            response = upstream._send('GET', TMDB_URL, {})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session.request.call_count, 2)
+        self.assertEqual(ratelimit.usage()['tmdb']['available'], 0)
+
+    def test_non_idempotent_calls_are_not_retried(self):
+        session = mock.Mock()
+        session.request.return_value = fake_response(503)
+        with mock.patch.object(upstream, 'session_for', return_value=session):
+            response = upstream._send('POST', TMDB_URL, {})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(session.request.call_count, 1)
+
+
+@override_settings(
+    CACHES={
+        **settings.CACHES,
+        'coordination': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'},
+    },
+    SINGLEFLIGHT_CACHE='coordination',
+    SINGLEFLIGHT_POLL_INTERVAL=0.01,
+)
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        self.cache = caches['coordination']
+        self.cache.clear()
+
+    def test_concurrent_calls_share_one_fetch(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(True)
+            started.set()
+            release.wait(5)
+            return fake_response(200)
+
+        results = []
+        coalesced = singleflight.stats()['coalesced']
+        leader = threading.Thread(target=lambda: results.append(singleflight.do('key', fetch)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(singleflight.do('key', fetch)))
+        follower.start()
+        deadline = time.monotonic() + 5
+        while singleflight.stats()['coalesced'] == coalesced and time.monotonic() < deadline:
+            time.sleep(0.001)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 2)
+        self.assertIs(results[0], results[1])
+
+    def test_cancelled_leader_does_not_cancel_waiters(self):
+        calls = []
+
+        async def scenario():
+            started, release = asyncio.Event(), asyncio.Event()
+
+            async def fetch():
+                calls.append(True)
+                started.set()
+                await release.wait()
+                return httpx.Response(200, request=httpx.Request('GET', TMDB_URL))
+
+            leader = asyncio.create_task(singleflight.do_async('key', 'GET', fetch))
+            await started.wait()
+            waiter = asyncio.create_task(singleflight.do_async('key', 'GET', fetch))
+            await asyncio.sleep(0)
+            leader.cancel()
+            await asyncio.sleep(0)
+            release.set()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await waiter
+
+        response = asyncio.run(scenario())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 1)
+
+    def test_response_is_only_published_for_waiting_processes(self):
+        tokens = []
+
+        def fetch():
+            tokens.append(self.cache.get(singleflight._lock_key('key')))
+            return fake_response(200)
+
+        singleflight.do('key', fetch)
+        self.assertIsNone(self.cache.get(singleflight._result_key(tokens[-1])))
+        self.assertIsNone(self.cache.get(singleflight._lock_key('key')))
+
+        def fetch_with_waiter():
+            token = self.cache.get(singleflight._lock_key('key'))
+            tokens.append(token)
+            self.cache.set(singleflight._waiting_key(token), 1)
+            return fake_response(200)
+
+        singleflight.do('key', fetch_with_waiter)
+        self.assertEqual(self.cache.get(singleflight._result_key(tokens[-1]))['status_code'], 200)
+
+    def test_waits_for_another_process(self):
+        self.cache.add(singleflight._lock_key('key'), 'other')
+        self.cache.set(singleflight._result_key('other'), singleflight._freeze(
+            200, {'Content-Type': 'application/json'}, b'{"id": 1}', TMDB_URL
+        ))
+        fetch = mock.Mock()
+
+        response = singleflight.do('key', fetch)
+
+        fetch.assert_not_called()
+        self.assertEqual(response.json(), {'id': 1})
+        self.assertEqual(self.cache.get(singleflight._waiting_key('other')), 1)
+
+
+class EnrichmentBackfillTests(TestCase):
+    def catalog(self, external_id, **fields):
+        return MediaCatalog.objects.create(source='tmdb', media_type='movie', external_id=external_id,
+                                           title=f'Movie {external_id}', **fields)
+
+    def test_backfill_queues_entries_without_metadata(self):
+        missing = self.catalog('1')
+        self.catalog('2', enriched_at=timezone.now())
+        queued = self.catalog('3')
+        EnrichmentJob.objects.create(catalog=queued, status='failed', run_after=timezone.now())
+
+        self.assertEqual(jobs.backfill(), 1)
+        self.assertEqual(list(EnrichmentJob.objects.filter(status='pending').values_list('catalog', flat=True)),
+                         [missing.id])
+        # Nothing left to queue the second time
+        self.assertEqual(jobs.backfill(), 0)
+
+
+class WatchlistMutationTests(TestCase):
+    def post(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type='application/json')
+
+    def add(self, **data):
+        return self.post('/api/watchlist/add/', {'media_type': 'movie', 'media_id': 603, 'title': 'The Matrix', **data})
+
+    def test_add_rejects_bad_values(self):
+        for data in ({'media_id': None}, {'media_id': ''}, {'media_id': True}, {'media_id': [603]},
+                     {'title': None}, {'title': '  '}, {'title': 5}, {'media_type': ['movie']}):
+            with self.subTest(data=data):
+                self.assertEqual(self.add(**data).status_code, 400)
+        self.assertFalse(MediaCatalog.objects.exists())
+
+    def test_clients_cannot_set_shared_catalog_fields(self):
+        self.add(poster_path='https://example.com/spam.jpg', genres=['Spam'], creator='Someone')
+        self.add(title='Something else')
+
+        entry = MediaCatalog.objects.get()
+        self.assertEqual((entry.title, entry.poster_path, entry.genres, entry.creator),
+                         ('The Matrix', None, [], 'Unknown'))
+
+        job = EnrichmentJob.objects.get(catalog=entry)
+        lookup = mock.Mock(return_value={'title': 'The Matrix (1999)', 'poster_path': 'https://stub/603.jpg',
+                                         'genres': ['Action'], 'creator': 'The Wachowskis', 'year': '1999'})
+        self.assertTrue(jobs.run(job, lookup))
+        entry.refresh_from_db()
+        self.assertEqual((entry.title, entry.poster_path, entry.genres), ('The Matrix (1999)', 'https://stub/603.jpg', ['Action']))
+
+    def test_update_conflict_and_increments(self):
+        item_id = self.add().json()['item_id']
+
+        response = self.post('/api/watchlist/update/', {'id': item_id, 'progress': {'inc': 2}, 'version': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['item']['progress'], response.json()['item']['version']), (2, 1))
+        self.assertEqual(self.post('/api/watchlist/update/', {'id': item_id, 'progress': {'inc': 3}}).json()['item']['progress'], 5)
+
+        # Based on a version that has been replaced since
+        response = self.post('/api/watchlist/update/', {'id': item_id, 'status': 'completed', 'version': 0})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['item']['version'], 2)
+        self.assertEqual(WatchlistItem.objects.get(id=item_id).status, 'plan_to_watch')
+
+    def test_writes_need_the_csrf_token(self):
+        item_id = self.add().json()['item_id']
+        client = Client(enforce_csrf_checks=True)
+        response = client.post('/api/watchlist/update/', json.dumps({'id': item_id, 'progress': 5}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(WatchlistItem.objects.get(id=item_id).progress, 0)
+
+    def test_bulk_reports_each_operation(self):
+        item_id = self.add().json()['item_id']
+
+        response = self.post('/api/watchlist/bulk/', {'operations': [
+            {'op': 'add', 'media_type': 'tv', 'media_id': '1399', 'title': 'Game of Thrones'},
+            {'op': 'add', 'media_type': 'movie', 'media_id': '603', 'title': 'The Matrix'},
+            {'op': 'add', 'media_type': 'movie', 'media_id': None, 'title': 'Nothing'},
+            {'op': 'update', 'id': item_id, 'rating': {'inc': 4}},
+            {'op': 'update', 'id': item_id, 'status': 'dropped', 'version': 7},
+            {'op': 'delete', 'id': item_id + 100},
+            {'op': 'rename'},
+        ]})
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results],
+                         ['success', 'exists', 'error', 'success', 'conflict', 'error', 'error'])
+        self.assertEqual([result['index'] for result in results], list(range(7)))
+        self.assertEqual(results[1]['id'], item_id)
+        self.assertEqual(WatchlistItem.objects.get(id=item_id).rating, 4)
+        self.assertEqual(WatchlistItem.objects.count(), 2)
+
+
+# The replica is a second connection, which can't see a test's uncommitted rows
+@override_settings(READ_ONLY_DATABASE='default')
+class WatchlistPageTests(TestCase):
+    def setUp(self):
+        start = timezone.now()
+        for i in range(7):
+            entry = MediaCatalog.objects.create(source='tmdb', media_type='movie' if i % 2 else 'tv',
+                                                external_id=str(i), title=f'Title {i}')
+            item = WatchlistItem.objects.create(user='dummy_user', catalog=entry, media_type=entry.media_type,
+                                                status='watching' if i % 3 else 'completed')
+            # Ties on the sort field are broken by id
+            WatchlistItem.objects.filter(id=item.id).update(date_added=start - timedelta(minutes=i // 2),
+                                                            date_updated=start + timedelta(minutes=i % 4))
+
+    def test_cursor_walks_every_row_once_in_order(self):
+        for sort in ('date_added', '-date_added', 'date_updated', '-date_updated'):
+            for filters in ({}, {'status': 'watching'}, {'media_type': 'movie'}):
+                with self.subTest(sort=sort, **filters):
+                    expected = [row['id'] for row in queries.watchlist_page('dummy_user', sort=sort, limit=100, **filters)[0]]
+                    seen, cursor = [], None
+                    while True:
+                        rows, cursor = queries.watchlist_page('dummy_user', sort=sort, limit=2, cursor=cursor, **filters)
+                        seen.extend(row['id'] for row in rows)
+                        if cursor is None:
+                            break
+                    self.assertEqual(seen, expected)
+                    values = [WatchlistItem.objects.filter(id=item_id).values_list(sort.lstrip('-'), 'id')[0]
+                              for item_id in seen]
+                    self.assertEqual(values, sorted(values, reverse=sort.startswith('-')))
+
+    def test_bad_cursor_and_sort_are_rejected(self):
+        for params in ({'cursor': 'not-a-cursor'}, {'cursor': queries.encode_cursor('yesterday', 1)},
+                       {'cursor': queries.encode_cursor(timezone.now(), [1])}, {'sort': 'title'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/watchlist/', params).status_code, 400)
+
+    def test_every_sort_uses_an_index(self):
+        for sort in queries.SORT_FIELDS:
+            for filters in ({}, {'status': 'watching'}, {'media_type': 'movie'}):
+                queryset = WatchlistItem.objects.filter(user='dummy_user', **filters).order_by(f'-{sort}', '-id')
+                with self.subTest(sort=sort, **filters):
+                    plan = queryset.explain()
+                    self.assertIn('USING INDEX', plan)
+                    self.assertNotIn('TEMP B-TREE', plan)
+
+
+class AniListInfoTests(TestCase):
+    def test_only_requested_ids_are_returned(self):
+        response = fake_response(200)
+        response._content = json.dumps({'data': {'Page': {'media': [
+            {'id': 21, 'genres': ['Action'], 'episodes': 1000},
+            {'id': 99, 'genres': ['Drama'], 'episodes': 12},
+        ]}}}).encode()
+        with mock.patch.object(upstream, 'anilist_query', return_value=response):
+            results = views.fetch_anilist_info('anime', ['21', 'abc'])
+
+        self.assertEqual(list(results), ['21'])
+        self.assertEqual(results['21']['total_episodes'], 1000)
+
+
+class WatchlistStreamTests(TestCase):
+    databases = {'default', 'replica'}
+
+    def test_body_runs_in_the_request_context(self):
+        seen = []
+
+        def stream_watchlist_items(items, next_cursor):
+            seen.append((db_routing._read_only.get(), timing._current.get()))
+            WatchlistItem.objects.count()
+            yield views.ndjson_line({'type': 'done', 'next_cursor': next_cursor})
+
+        with mock.patch.object(views, 'stream_watchlist_items', stream_watchlist_items), \
+                self.assertLogs('enterainmentdjango.timing', 'INFO') as logs:
+            response = self.client.get('/api/watchlist/stream/')
+            self.assertEqual(logs.output, [])
+            body = b''.join(response.streaming_content)
+
+        self.assertEqual(json.loads(body)['type'], 'done')
+        read_only, timeline = seen[0]
+        self.assertTrue(read_only)
+        self.assertIsNotNone(timeline)
+        # Logged after the body was sent, with the body's query counted
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['db'], {
+            alias: {'count': count, 'ms': round(seconds * 1000, 1)}
+            for alias, (count, seconds) in timeline.summary('db').items()
+        })
+        self.assertIn('SELECT COUNT(*)', timeline.calls[-1][3])
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        for state in (trending._snapshots, trending._filled_at):
+            self.addCleanup(state.clear)
+            state.clear()
+        trending._loaded_at = 0.0
+
+    def test_first_request_downloads_a_missing_feed(self):
+        fetch = mock.Mock(return_value=[{'image_url': 'https://stub/1.jpg'}])
+        with mock.patch.dict(trending.FEEDS, {'anime': fetch}):
+            first = self.client.get('/api/trending-anime')
+            second = self.client.get('/api/trending-anime', HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(first.json(), [{'image_url': 'https://stub/1.jpg'}])
+        self.assertEqual(second.status_code, 304)
+        fetch.assert_called_once()
+        self.assertTrue(TrendingSnapshot.objects.filter(feed='anime').exists())
+
+    def test_async_views_validate_like_the_sync_ones(self):
+        trending._snapshots['anime'] = ([{'image_url': 'https://stub/1.jpg'}], timezone.now())
+        trending._loaded_at = time.monotonic()
+
+        for path in ('/api/trending-anime', '/async/api/trending-anime'):
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertEqual(response.json(), [{'image_url': 'https://stub/1.jpg'}])
+                self.assertIn('max-age=300', response['Cache-Control'])
+                self.assertTrue(response.has_header('Last-Modified'))
+                self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_failed_download_is_not_retried_on_every_request(self):
+        fetch = mock.Mock(side_effect=requests.ConnectionError('down'))
+        with mock.patch.dict(trending.FEEDS, {'anime': fetch}):
+            self.assertEqual(self.client.get('/api/trending-anime').json(), [])
+            self.assertEqual(self.client.get('/api/trending-anime').json(), [])
+        fetch.assert_called_once()
+
+
+@override_settings(READ_ONLY_DATABASE='default')
+class WatchlistConditionalTests(TestCase):
+    def setUp(self):
+        entry = MediaCatalog.objects.create(source='tmdb', media_type='movie', external_id='603',
+                                            title='The Matrix', enriched_at=timezone.now())
+        self.item = WatchlistItem.objects.create(user='dummy_user', catalog=entry, media_type='movie',
+                                                 status='watching')
+
+    def get(self, etag=None, path='/api/watchlist/'):
+        return self.client.get(path, HTTP_IF_NONE_MATCH=etag) if etag else self.client.get(path)
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get(response['ETag']).status_code, 304)
+        # Each filter and page has its own tag
+        self.assertEqual(self.get(response['ETag'], '/api/watchlist/?status=watching').status_code, 200)
+
+    def test_changes_give_a_new_etag(self):
+        etag = self.get()['ETag']
+        changes = [
+            lambda: mutations.update_item('dummy_user', self.item.id, {'progress': 3}),
+            lambda: MediaCatalog.objects.filter(id=self.item.catalog_id).update(
+                title='The Matrix (1999)', date_updated=timezone.now() + timedelta(seconds=1)),
+            lambda: WatchlistItem.objects.filter(id=self.item.id).delete(),
+        ]
+        for change in changes:
+            change()
+            response = self.get(etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+
+    def test_pending_enrichment_disables_the_etag(self):
+        MediaCatalog.objects.update(enriched_at=None)
+        with mock.patch.object(views, 'iteminfo', return_value={}):
+            self.assertFalse(self.get().has_header('ETag'))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for patch in (override_settings(METRICS_DIR=directory.name, METRICS_TOKEN='secret'),
+                      mock.patch.object(metrics, '_retired', False),
+                      mock.patch.multiple(metrics, _counters={}, _histograms={})):
+            patch.__enter__()
+            self.addCleanup(patch.__exit__, None, None, None)
+
+    def total(self):
+        counters, _ = metrics.collect()
+        return counters.get(('cache_lookups_total', (('cache', 'test'), ('result', 'hit'))), 0)
+
+    def test_scrapes_need_an_allowed_address_or_the_token(self):
+        for path in ('/metrics', '/api/watchlist/jobs/', '/api/upstream/stats/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).status_code, 200)
+                self.assertEqual(self.client.get(path, REMOTE_ADDR='203.0.113.9').status_code, 404)
+                self.assertEqual(self.client.get(path, REMOTE_ADDR='203.0.113.9',
+                                                 HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+                self.assertEqual(self.client.get(path, REMOTE_ADDR='203.0.113.9',
+                                                 HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_exited_processes_still_count_and_leave_no_file(self):
+        # Another process with this process's PID that has already exited
+        with open(os.path.join(settings.METRICS_DIR, f'{os.getpid()}-0ld.json'), 'w') as f:
+            json.dump({'counters': [['cache_lookups_total', [['cache', 'test'], ['result', 'hit']], 5]],
+                       'histograms': []}, f)
+        metrics.inc('cache_lookups_total', 2, cache='test', result='hit')
+        metrics.flush()
+        self.assertEqual(len(os.listdir(settings.METRICS_DIR)), 2)
+        self.assertEqual(self.total(), 7)
+
+        metrics.retire()
+        self.assertEqual(sorted(os.listdir(settings.METRICS_DIR)),
+                         sorted([f'{os.getpid()}-0ld.json', 'exited.json', 'exited.lock']))
+        # The live totals are still in memory, but already counted in exited.json
+        with mock.patch.multiple(metrics, _counters={}, _histograms={}):
+            self.assertEqual(self.total(), 7)
+
+
+class SearchIndexTests(TestCase):
+    def ids(self, **params):
+        return [row['id'] for row in search.search('dummy_user', **params)[0]]
+
+    def check_index(self):
+        # Raises if the FTS index disagrees with the catalog table
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO enterainmentdjango_mediacatalog_fts (enterainmentdjango_mediacatalog_fts) "
+                           "VALUES ('integrity-check')")
+
+    def test_triggers_keep_the_index_in_sync(self):
+        item_id, _ = mutations.add_item('dummy_user', {'media_type': 'movie', 'media_id': 603, 'title': 'Matrix'})
+        self.assertEqual(self.ids(q='matr'), [item_id])
+        self.check_index()
+
+        job = EnrichmentJob.objects.get()
+        jobs.run(job, lambda item: {'title': 'The Matrix', 'creator': 'Lana Wachowski',
+                                    'genres': ['Action', 'Science Fiction']})
+        self.assertEqual(self.ids(q='wachowski'), [item_id])
+        self.assertEqual(self.ids(q='science'), [item_id])
+        self.assertEqual(self.ids(genre=['Action']), [item_id])
+        self.assertEqual(search.facets('dummy_user')['genre'], {'Action': 1, 'Science Fiction': 1})
+        self.check_index()
+
+        MediaCatalog.objects.update(title='Reloaded', genres=['Drama'])
+        self.assertEqual(self.ids(q='matrix'), [])
+        self.assertEqual(self.ids(q='reloaded'), [item_id])
+        self.assertEqual(self.ids(genre=['Action']), [])
+        self.check_index()
+
+        WatchlistItem.objects.all().delete()
+        MediaCatalog.objects.all().delete()
+        self.assertFalse(CatalogGenre.objects.exists())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM enterainmentdjango_mediacatalog_fts WHERE "
+                           "enterainmentdjango_mediacatalog_fts MATCH 'reloaded'")
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.check_index()
+
+
+class DeferredExecutor:
+    """Collects submitted calls so a test can run them when it wants."""
+
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, *args):
+        self.calls.append((fn, args))
+
+    def run_all(self):
+        calls, self.calls = self.calls, []
+        for fn, args in calls:
+            fn(*args)
+
+
+@override_settings(
+    CACHES={
+        **settings.CACHES,
+        'details': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'details-tests'},
+    },
+    DETAIL_CACHE='details',
+)
+class DetailCacheTests(TestCase):
+    def setUp(self):
+        caches['details'].clear()
+        self.executor = DeferredExecutor()
+        for patch in (mock.patch.object(detail_cache, '_executor', self.executor),
+                      mock.patch.multiple(detail_cache, _refreshing=set(),
+                                          _counters=dict.fromkeys(detail_cache._counters, 0))):
+            patch.__enter__()
+            self.addCleanup(patch.__exit__, None, None, None)
+        # Past its TTL, inside the stale window
+        detail_cache.store('key', 'old', -1)
+
+    def test_stale_record_is_served_while_one_refresh_runs(self):
+        fetch = mock.Mock(return_value='new')
+        self.assertEqual(detail_cache.get('key', fetch, 60), 'old')
+        self.assertEqual(detail_cache.get('key', fetch, 60), 'old')
+        fetch.assert_not_called()
+        self.assertEqual(len(self.executor.calls), 1)
+
+        self.executor.run_all()
+        self.assertEqual(detail_cache.get('key', fetch, 60), 'new')
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(detail_cache.stats()['stale'], 2)
+        self.assertEqual(detail_cache.stats()['fresh'], 1)
+
+    def test_failed_refresh_keeps_the_stale_record(self):
+        fetch = mock.Mock(side_effect=requests.ConnectionError('down'))
+        self.assertEqual(detail_cache.get('key', fetch, 60), 'old')
+        self.executor.run_all()
+
+        self.assertEqual(detail_cache.stats()['failed'], 1)
+        self.assertEqual(detail_cache.get('key', fetch, 60), 'old')
+        # The lock was released, so the next read tries again
+        self.assertEqual(len(self.executor.calls), 1)
+
+    def test_refresh_claimed_by_another_worker_is_skipped(self):
+        caches['details'].add('detail-refresh:key', 1)
+        self.assertEqual(detail_cache.get('key', mock.Mock(), 60), 'old')
+        self.assertEqual(self.executor.calls, [])
+
+    def test_miss_waits_for_the_fetch(self):
+        self.assertEqual(detail_cache.get('other', lambda: 'new', 60), 'new')
+        self.assertEqual(detail_cache.lookup('other'), ('new', False))
+
+    def test_detail_record_is_trimmed(self):
+        show = {
+            'id': 603,
+            'title': 'The Matrix',
+            'runtime': 136,
+            'production_companies': [{'name': 'Village Roadshow'}],
+            'genres': [{'id': 28, 'name': 'Action'}],
+            'credits': {
+                'cast': [{'name': f'Actor {n}', 'character': f'Role {n}'} for n in range(30)],
+                'crew': [{'name': 'Lana Wachowski', 'job': 'Director'}, {'name': 'Bill Pope', 'job': 'Cinematography'}],
+            },
+            'similar': {'results': [{'id': n, 'title': f'Similar {n}'} for n in range(20)]},
+        }
+        record = views.show_detail_record('movie', show)
+
+        self.assertEqual(len(record['cast']), 10)
+        self.assertEqual(len(record['similar']), 6)
+        self.assertEqual([director['name'] for director in record['directors']], ['Lana Wachowski'])
+        self.assertEqual(record['genres'], ['Action'])
+        self.assertEqual(record['runtime'], 136)
+        self.assertNotIn('credits', record)
+        self.assertNotIn('production_companies', record)
+
+
+@override_settings(
+    CACHES={
+        **settings.CACHES,
+        'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pages-tests'},
+    },
+    PREFETCH_CACHE='pages',
+    PREFETCH_ENABLED=True,
+    PREFETCH_MAX_INFLIGHT=2,
+    PREFETCH_PER_MINUTE=3,
+)
+class PrefetchTests(TestCase):
+    def setUp(self):
+        caches['pages'].clear()
+        self.executor = DeferredExecutor()
+        for patch in (mock.patch.object(prefetch, '_executor', self.executor),
+                      mock.patch.multiple(prefetch, _inflight=set(), _recent=collections.deque(),
+                                          _counters=dict.fromkeys(prefetch._counters, 0))):
+            patch.__enter__()
+            self.addCleanup(patch.__exit__, None, None, None)
+
+    def schedule(self, page, fetch=None):
+        prefetch.schedule('shows', {'page': page}, fetch or (lambda: {'page': page}))
+
+    def test_prefetched_page_is_served_from_cache(self):
+        self.schedule(2)
+        self.executor.run_all()
+
+        fetch = mock.Mock()
+        self.assertEqual(prefetch.get('shows', {'page': 2}, fetch), {'page': 2})
+        fetch.assert_not_called()
+        stats = prefetch.stats()
+        self.assertEqual((stats['scheduled'], stats['completed'], stats['prefetch_hits']), (1, 1, 1))
+
+    def test_budget_limits_inflight_and_per_minute_fetches(self):
+        self.schedule(2)
+        self.schedule(2)  # Already in flight
+        self.schedule(3)
+        self.schedule(4)  # Two in flight already
+        self.assertEqual(len(self.executor.calls), 2)
+        self.executor.run_all()
+
+        self.schedule(5)
+        self.schedule(6)  # Three started this minute
+        self.executor.run_all()
+        stats = prefetch.stats()
+        self.assertEqual((stats['scheduled'], stats['skipped'], stats['completed']), (3, 2, 3))
+
+    def test_warm_pages_take_no_budget(self):
+        prefetch.store('shows', {'page': 2}, {'page': 2})
+        self.schedule(2)
+        self.assertEqual(self.executor.calls, [])
+        self.assertEqual(prefetch.stats()['scheduled'], 0)
+
+    def test_failure_is_counted_and_logs_no_params(self):
+        def fetch():
+            raise requests.ConnectionError('down')
+
+        prefetch.schedule('books', {'page': 2, 'key': 'secret-api-key'}, fetch)
+        with self.assertLogs('enterainmentdjango.prefetch', 'WARNING') as logs:
+            self.executor.run_all()
+        self.assertEqual(prefetch.stats()['failed'], 1)
+        self.assertNotIn('secret-api-key', logs.output[0])
+        self.assertIsNone(prefetch.cached('books', {'page': 2, 'key': 'secret-api-key'}))
+
+
+def volume_item(volume_id, title='Dune'):
+    return {'id': volume_id, 'volumeInfo': {'title': title, 'authors': ['Frank Herbert'], 'publishedDate': '1965'}}
+
+
+class VolumeStoreTests(TestCase):
+    def setUp(self):
+        caches[settings.BOOKS_SEARCH_CACHE].clear()
+        volumes.store([volumes.normalize(volume_item('stored'))])
+
+    def test_stored_volumes_are_not_downloaded(self):
+        with mock.patch.object(volumes, 'fetch_volume', side_effect=lambda volume_id: volumes.normalize(
+            volume_item(volume_id, 'Fetched')
+        )) as fetch_volume:
+            found = volumes.get_many(['stored', 'missing', 'stored'])
+
+        fetch_volume.assert_called_once_with('missing')
+        self.assertEqual(found['stored']['title'], 'Dune')
+        self.assertEqual(found['missing']['title'], 'Fetched')
+        self.assertTrue(BookVolume.objects.filter(id='missing').exists())
+
+    def test_stale_volume_is_kept_when_the_download_fails(self):
+        BookVolume.objects.filter(id='stored').update(date_fetched=timezone.now() - timedelta(days=365))
+        with mock.patch.object(volumes, 'fetch_volume', side_effect=requests.ConnectionError('down')) as fetch_volume:
+            found = volumes.get_many(['stored'])
+
+        fetch_volume.assert_called_once_with('stored')
+        self.assertEqual(found['stored']['title'], 'Dune')
+
+    def test_repeated_search_is_served_from_the_store(self):
+        params = {'q': 'dune', 'startIndex': 0, 'key': 'first-key'}
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'totalItems': 1, 'items': [volume_item('searched')]}
+        with mock.patch.object(upstream, 'google_books_get', return_value=response) as google_books_get:
+            first = volumes.search(params)
+            # The API key isn't part of the cache key
+            second = volumes.search({**params, 'key': 'second-key'})
+
+        google_books_get.assert_called_once()
+        self.assertEqual(first['total_items'], 1)
+        self.assertEqual([volume['id'] for volume in second['volumes']], ['searched'])
+        self.assertIsNone(volumes.cached_search({**params, 'q': 'emma'}))
+
+
+@override_settings(ANIMANGA_SECTION_MAX_PAGE=20)
+class AnimangaSectionTests(TestCase):
+    def get(self, page):
+        with mock.patch.object(animanga_details, 'section', return_value={'items': []}) as section:
+            response = self.client.get('/api/animanga/1/characters/', {'page': page})
+        return response, section
+
+    def test_page_is_clamped(self):
+        for page, expected in (('100000', 20), ('0', 1), ('-3', 1), ('2', 2)):
+            response, section = self.get(page)
+            self.assertEqual(response.status_code, 200)
+            section.assert_called_once_with(1, 'characters', expected)
+
+    def test_invalid_page_is_rejected(self):
+        response, section = self.get('abc')
+        self.assertEqual(response.status_code, 400)
+        section.assert_not_called()
+
+    def test_unknown_section_is_not_found(self):
+        self.assertEqual(self.client.get('/api/animanga/1/trivia/').status_code, 404)
+
+
+@override_settings(
+    CACHES={
+        **settings.CACHES,
+        'metadata-local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'metadata-local-tests'},
+        'metadata-shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'metadata-shared-tests'},
+    },
+    METADATA_CACHE_LOCAL='metadata-local',
+    METADATA_CACHE_SHARED='metadata-shared',
+)
+class MetadataCacheTests(TestCase):
+    def setUp(self):
+        caches['metadata-local'].clear()
+        caches['metadata-shared'].clear()
+
+    def test_entries_are_keyed_by_media_type_and_id(self):
+        metadata_cache.set('movie', '603', {'title': 'The Matrix'})
+        metadata_cache.set('tv', '603', {'title': 'Another show'})
+
+        self.assertEqual(metadata_cache.get('movie', '603'), {'title': 'The Matrix'})
+        self.assertEqual(metadata_cache.get('tv', '603'), {'title': 'Another show'})
+        self.assertIsNone(metadata_cache.get('book', '603'))
+        self.assertEqual(
+            metadata_cache.get_many([('movie', '603'), ('movie', '604')]),
+            {('movie', '603'): {'title': 'The Matrix'}},
+        )
+
+    def test_shared_entries_are_promoted_to_the_local_tier(self):
+        metadata_cache.set('movie', '603', {'title': 'The Matrix'})
+        caches['metadata-local'].clear()
+
+        self.assertEqual(metadata_cache.get('movie', '603'), {'title': 'The Matrix'})
+        self.assertIsNotNone(caches['metadata-local'].get(metadata_cache._key('movie', '603')))
+
+    def test_delete_drops_only_that_item(self):
+        metadata_cache.set('movie', '603', {'title': 'The Matrix'})
+        metadata_cache.set('tv', '603', {'title': 'Another show'})
+        metadata_cache.delete('movie', '603')
+
+        self.assertIsNone(metadata_cache.get('movie', '603'))
+        self.assertIsNone(caches['metadata-shared'].get(metadata_cache._key('movie', '603')))
+        self.assertEqual(metadata_cache.get('tv', '603'), {'title': 'Another show'})
+
+    @override_settings(METADATA_CACHE_TTLS={'movie': 600, 'default': 60})
+    def test_ttl_follows_the_media_type(self):
+        metadata_cache.set('movie', '603', {})
+        metadata_cache.set('book', 'abc', {})
+        movie_expires_at, _ = caches['metadata-shared'].get(metadata_cache._key('movie', '603'))
+        book_expires_at, _ = caches['metadata-shared'].get(metadata_cache._key('book', 'abc'))
+        self.assertAlmostEqual(movie_expires_at - time.time(), 600, delta=5)
+        self.assertAlmostEqual(book_expires_at - time.time(), 60, delta=5)
+
+
+class ReadOnlyRoutingTests(TestCase):
+    # Only 'default' is allowed here, so a query sent to the replica fails the test
+
+    def test_reads_in_read_only_views_go_to_the_replica(self):
+        @db_routing.read_only
+        def view(request):
+            return WatchlistItem.objects.all().db
+
+        self.assertEqual(view(None), 'replica')
+        # The flag is reset once the view returns
+        self.assertEqual(WatchlistItem.objects.all().db, 'default')
+
+    @override_settings(READ_ONLY_DATABASE='missing')
+    def test_unconfigured_replica_falls_back_to_default(self):
+        self.assertEqual(db_routing.read_only(lambda request: WatchlistItem.objects.all().db)(None), 'default')
+
+    def test_writes_in_read_only_views_go_to_default(self):
+        entry = MediaCatalog.objects.create(source='tmdb', media_type='movie', external_id='603', title='The Matrix')
+
+        @db_routing.read_only
+        def view(request):
+            item = WatchlistItem.objects.create(user='dummy_user', catalog=entry, media_type='movie')
+            return item._state.db
+
+        self.assertEqual(view(None), 'default')
+        self.assertTrue(WatchlistItem.objects.filter(catalog=entry).exists())
+
+    def test_replica_is_never_migrated(self):
+        router = db_routing.ReadOnlyRouter()
+        self.assertFalse(router.allow_migrate('replica', 'enterainmentdjango'))
+        self.assertTrue(router.allow_migrate('default', 'enterainmentdjango'))
+
+
+class PageParameterTests(SimpleTestCase):
+    def test_malformed_page_falls_back_to_the_first(self):
+        for query, page in (('?page=abc', 1), ('?page=-2', 1), ('', 1), ('?page=3', 3)):
+            request = RequestFactory().get(f'/shows/{query}')
+            self.assertEqual(views.shows_filters(request)['page'], page)
+            self.assertEqual(views.request_page(request), page)
@@ -0,0 +1,269 @@
+"""
+Per-request timing of database queries, upstream calls, caches and templates.
+
+``ServerTimingMiddleware`` starts a ``Timeline`` for every request. While it
+runs, every SQL query (on any alias, in any thread that carries the request's
+context), every upstream HTTP call, every detail/page/metadata cache lookup and
+every template render is added to it. When the response is ready the totals go
+out as a ``Server-Timing`` header, which browsers show in the network panel,
+and as one JSON log line on the ``enterainmentdjango.timing`` logger (for
+streamed responses, once the body has been sent). Requests slower than
+``settings.SLOW_REQUEST_MS`` also log every recorded call with its duration.
+
+Upstream calls are keyed by host, status and whether the call went upstream
+(``miss``) or shared another in-flight call's response (``hit``, see
+``singleflight``). Upstream calls made from enrichment threads overlap, so
+their summed duration can exceed the request's.
+
+Requests, upstream calls and cache lookups are also counted in ``metrics``,
+including those made outside a request.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('timeline', default=None)
+
+
+class Timeline:
+    """Everything recorded for one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.totals = {}  # (kind, key) -> [count, seconds]
+        self.calls = []   # (kind, key, seconds, detail) for the slow-request log
+        self._lock = threading.Lock()
+
+    def add(self, kind, key, seconds, detail=None, count=1):
+        with self._lock:
+            total = self.totals.setdefault((kind, key), [0, 0.0])
+            total[0] += count
+            total[1] += seconds
+            if len(self.calls) < settings.SERVER_TIMING_MAX_CALLS:
+                self.calls.append((kind, key, seconds, detail))
+
+    def summary(self, kind):
+        """``{key: (count, seconds)}`` for one kind of call."""
+        with self._lock:
+            return {key: tuple(total) for (entry_kind, key), total in self.totals.items() if entry_kind == kind}
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def record(kind, key, seconds, detail=None, count=1):
+    timeline = _current.get()
+    if timeline is not None:
+        timeline.add(kind, key, seconds, detail, count)
+
+
+def record_upstream(method, url, status, shared, seconds):
+    """Record an upstream HTTP call; ``status`` is ``'error'`` if it raised."""
+    host = urlsplit(url).netloc
+    record('upstream', (host, status, 'hit' if shared else 'miss'), seconds, f'{method} {url}')
+    metrics.observe_upstream(url, status, shared, seconds)
+
+
+def record_cache(name, hit, count=1):
+    """Record ``count`` lookups in the named cache."""
+    if count:
+        result = 'hit' if hit else 'miss'
+        record('cache', (name, result), 0.0, count=count)
+        metrics.inc('cache_lookups_total', count, cache=name, result=result)
+
+
+@contextlib.contextmanager
+def span(kind, key=None):
+    """Time a block of code as one call."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, key, time.perf_counter() - start)
+
+
+def _time_query(execute, sql, params, many, context):
+    timeline = _current.get()
+    if timeline is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timeline.add('db', context['connection'].alias, time.perf_counter() - start, sql)
+
+
+@receiver(connection_created)
+def _install_query_timer(sender, connection, **kwargs):
+    # Connections are per thread and outlive requests; the timer only records
+    # while a request's timeline is in the context
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def _metric_name(text):
+    # Server-Timing names are HTTP tokens
+    return ''.join(char if char.isalnum() or char in '-_.' else '_' for char in str(text))
+
+
+def server_timing(timeline):
+    """The ``Server-Timing`` header value for a timeline."""
+    entries = [f'total;dur={timeline.elapsed() * 1000:.1f}']
+
+    queries = timeline.summary('db')
+    if queries:
+        count = sum(total[0] for total in queries.values())
+        seconds = sum(total[1] for total in queries.values())
+        entries.append(f'db;dur={seconds * 1000:.1f};desc="{count} queries"')
+
+    by_host = {}
+    for (host, status, outcome), (count, seconds) in timeline.summary('upstream').items():
+        calls = by_host.setdefault(host, {'count': 0, 'seconds': 0.0, 'shared': 0, 'statuses': set()})
+        calls['count'] += count
+        calls['seconds'] += seconds
+        calls['shared'] += count if outcome == 'hit' else 0
+        calls['statuses'].add(str(status))
+    for host, calls in sorted(by_host.items()):
+        statuses = ' '.join(sorted(calls['statuses']))
+        entries.append(
+            f'upstream-{_metric_name(host)};dur={calls["seconds"] * 1000:.1f};'
+            f'desc="{calls["count"]} calls, {calls["shared"]} shared, status {statuses}"'
+        )
+
+    caches = {}
+    for (name, outcome), (count, _) in timeline.summary('cache').items():
+        caches.setdefault(name, {'hit': 0, 'miss': 0})[outcome] += count
+    for name, counts in sorted(caches.items()):
+        entries.append(f'cache-{_metric_name(name)};desc="{counts["hit"]} hit, {counts["miss"]} miss"')
+
+    renders = timeline.summary('render')
+    if renders:
+        seconds = sum(total[1] for total in renders.values())
+        entries.append(f'render;dur={seconds * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def log_record(request, response, timeline):
+    """The structured log entry for a finished request."""
+    match = getattr(request, 'resolver_match', None)
+    queries = timeline.summary('db')
+    return {
+        'method': request.method,
+        'path': request.path,
+        'view': match.url_name if match else None,
+        'status': response.status_code,
+        'total_ms': round(timeline.elapsed() * 1000, 1),
+        'db': {
+            alias: {'count': count, 'ms': round(seconds * 1000, 1)}
+            for alias, (count, seconds) in queries.items()
+        },
+        'upstream': [
+            {'host': host, 'status': status, 'cache': outcome, 'count': count, 'ms': round(seconds * 1000, 1)}
+            for (host, status, outcome), (count, seconds) in timeline.summary('upstream').items()
+        ],
+        'cache': {
+            f'{name}:{outcome}': count for (name, outcome), (count, _) in timeline.summary('cache').items()
+        },
+        'render_ms': round(sum(seconds for _, seconds in timeline.summary('render').values()) * 1000, 1),
+    }
+
+
+class ServerTimingMiddleware:
+    """Time each request and report it in a header and a log line."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timeline = Timeline()
+        token = _current.set(timeline)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timeline)
+
+    async def __acall__(self, request):
+        timeline = Timeline()
+        token = _current.set(timeline)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timeline)
+
+    def finish(self, request, response, timeline):
+        match = getattr(request, 'resolver_match', None)
+        metrics.observe_request(match.url_name if match else None, request.method,
+                                response.status_code, timeline.elapsed())
+
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = server_timing(timeline)
+
+        if response.streaming and not response.is_async:
+            # Log once the body, and whatever it queries, has been sent
+            response.streaming_content = self._log_after(response.streaming_content, request, response, timeline)
+        else:
+            self.log(request, response, timeline)
+        return response
+
+    def _log_after(self, content, request, response, timeline):
+        try:
+            yield from content
+        finally:
+            self.log(request, response, timeline)
+
+    def log(self, request, response, timeline):
+        entry = log_record(request, response, timeline)
+        if entry['total_ms'] >= settings.SLOW_REQUEST_MS:
+            entry['calls'] = [
+                {'kind': kind, 'key': key, 'ms': round(seconds * 1000, 2), 'detail': detail}
+                for kind, key, seconds, detail in timeline.calls
+            ]
+            logger.warning(json.dumps(entry, default=str))
+        elif logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(entry, default=str))
+
+
+class _TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with span('render', getattr(self.template.origin, 'template_name', None)):
+            return self.template.render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render times added to the timeline."""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
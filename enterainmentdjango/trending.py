@@ -0,0 +1,140 @@
+"""
+Trending poster feeds for the homepage, refreshed in the background.
+
+``python manage.py refresh_trending`` downloads each feed and stores the last
+good result in the ``TrendingSnapshot`` table. Views read snapshots through
+``get``, which serves them from process memory and only goes back to the
+table every ``settings.TRENDING_RELOAD_INTERVAL`` seconds to pick up newer
+snapshots. The request path only calls TMDB or AniList for a feed that has
+never been stored, e.g. on a fresh deploy: the first request downloads it
+while concurrent ones wait for the result (and processes share the download
+through ``singleflight``). A failed first download is retried after
+``TRENDING_RELOAD_INTERVAL``.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import upstream
+from .models import TrendingSnapshot
+
+logger = logging.getLogger(__name__)
+
+TRENDING_ANIME_QUERY = '''
+    query {
+        Page(page: 1, perPage: 10) {
+            media(type: ANIME, sort: TRENDING_DESC) {
+                coverImage {
+                    extraLarge
+                }
+            }
+        }
+    }
+    '''
+
+
+def anime_posters(data):
+    return [
+        {"image_url": item["coverImage"]["extraLarge"]}
+        for item in data["data"]["Page"]["media"]
+        if item["coverImage"]["extraLarge"]
+    ]
+
+
+def movie_posters(data):
+    return [
+        {"image_url": f"https://image.tmdb.org/t/p/w500{movie['poster_path']}"}
+        for movie in data.get("results", [])[:10]
+        if movie.get("poster_path")
+    ]
+
+
+def fetch_movies():
+    response = upstream.tmdb_get('/trending/movie/week')
+    response.raise_for_status()
+    return movie_posters(response.json())
+
+
+def fetch_anime():
+    response = upstream.anilist_query(TRENDING_ANIME_QUERY)
+    response.raise_for_status()
+    return anime_posters(response.json())
+
+
+FEEDS = {
+    'movies': fetch_movies,
+    'anime': fetch_anime,
+}
+
+# feed -> (data, date_refreshed); reloaded from the table when older than
+# TRENDING_RELOAD_INTERVAL
+_snapshots = {}
+_loaded_at = 0.0
+_lock = threading.Lock()
+# feed -> when the request path last tried to download it
+_filled_at = {}
+_fill_lock = threading.Lock()
+
+
+def _load():
+    global _loaded_at
+    rows = TrendingSnapshot.objects.filter(feed__in=FEEDS).values_list('feed', 'data', 'date_refreshed')
+    _snapshots.update((feed, (data, date_refreshed)) for feed, data, date_refreshed in rows)
+    _loaded_at = time.monotonic()
+
+
+def snapshot(feed):
+    """Return ``(data, date_refreshed)`` for a feed, or ``([], None)`` before its first refresh."""
+    if time.monotonic() - _loaded_at > settings.TRENDING_RELOAD_INTERVAL:
+        with _lock:
+            if time.monotonic() - _loaded_at > settings.TRENDING_RELOAD_INTERVAL:
+                try:
+                    _load()
+                except Exception as e:
+                    # Keep serving what is in memory
+                    logger.warning(f"Trending snapshot reload failed: {str(e)}")
+    if feed not in _snapshots:
+        _fill(feed)
+    return _snapshots.get(feed, ([], None))
+
+
+def _fill(feed):
+    # Download a feed nobody has stored yet; one thread per process at a time
+    with _fill_lock:
+        tried_at = _filled_at.get(feed)
+        if feed in _snapshots or (tried_at and time.monotonic() - tried_at < settings.TRENDING_RELOAD_INTERVAL):
+            return
+        _filled_at[feed] = time.monotonic()
+        logger.info(f"No trending {feed} snapshot yet; downloading it now")
+        refresh([feed])
+
+
+def get(feed):
+    """The latest posters for a feed; empty if it has never been downloaded."""
+    return snapshot(feed)[0]
+
+
+def refresh(feeds=None):
+    """Download feeds and store the non-empty results; returns the feeds refreshed.
+
+    A failed or empty download keeps the previous snapshot.
+    """
+    refreshed = []
+    for feed in feeds or FEEDS:
+        try:
+            data = FEEDS[feed]()
+        except Exception as e:
+            logger.error(f"Error refreshing trending {feed}: {str(e)}")
+            continue
+        if not data:
+            logger.warning(f"Trending {feed} came back empty; keeping the last snapshot")
+            continue
+        now = timezone.now()
+        TrendingSnapshot.objects.update_or_create(feed=feed, defaults={'data': data, 'date_refreshed': now})
+        with _lock:
+            _snapshots[feed] = (data, now)
+        refreshed.append(feed)
+    return refreshed
@@ -0,0 +1,248 @@
+"""
+Shared HTTP client for the upstream APIs (TMDB, AniList and Google Books).
+
+Every call goes through a pooled, keep-alive ``requests.Session`` per host with
+default connect/read timeouts and retries with jittered backoff. Only
+idempotent calls are retried; AniList GraphQL queries are read-only, so POSTs
+to AniList count as idempotent. Retries are sent here rather than by the HTTP
+library, so each attempt takes a token from the upstream's rate budget.
+Host-specific default headers, such as the TMDB bearer token, are set once on
+the session instead of being built per call.
+
+The ``*_async`` functions are the equivalents for async views. They share one
+pooled ``httpx.AsyncClient`` per event loop.
+
+Identical idempotent calls that are in flight at the same time are coalesced
+into one upstream request (see ``singleflight``), and every request that does
+go out is paced by its upstream's rate budget (see ``ratelimit``).
+"""
+import asyncio
+import random
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import ratelimit, singleflight, timing
+
+_sessions = {}
+_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _host(url):
+    return urlsplit(url).netloc
+
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+def _retries(method, url):
+    return settings.UPSTREAM_RETRIES if method.upper() in _idempotent_methods(_host(url)) else 0
+
+
+def _backoff(attempt):
+    # Exponential with jitter, as urllib3's Retry would
+    return settings.UPSTREAM_BACKOFF * 2 ** (attempt - 1) + random.uniform(0, settings.UPSTREAM_BACKOFF)
+
+
+def _default_headers(host):
+    if host == _host(settings.TMDB_API_URL):
+        return {
+            "accept": "application/json",
+            "Authorization": f"Bearer {settings.TMDB_API_KEY}"
+        }
+    if host == _host(settings.ANILIST_API_URL):
+        return {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+            'User-Agent': 'Entertainment Tracker/1.0'
+        }
+    return {'Accept': 'application/json'}
+
+
+def _idempotent_methods(host):
+    methods = set(Retry.DEFAULT_ALLOWED_METHODS)
+    if host == _host(settings.ANILIST_API_URL):
+        methods.add('POST')
+    return frozenset(methods)
+
+
+def _create_session(host):
+    # No retries at this level; see _send
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.UPSTREAM_POOL_SIZE)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(_default_headers(host))
+    return session
+
+
+def session_for(url):
+    """Return the shared session for the host of ``url``."""
+    host = _host(url)
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _sessions[host] = _create_session(host)
+    return session
+
+
+def _call_key(method, url, kwargs):
+    # Only plain idempotent calls are coalesced
+    if method.upper() not in _idempotent_methods(_host(url)):
+        return None
+    if set(kwargs) - {'params', 'json', 'headers', 'timeout'}:
+        return None
+    return singleflight.key(method, url, kwargs.get('params'), kwargs.get('json'), kwargs.get('headers'))
+
+
+def _send(method, url, kwargs):
+    retries = _retries(method, url)
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(_backoff(attempt))
+        ratelimit.acquire(url)
+        try:
+            response = session_for(url).request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt < retries:
+                continue
+            raise
+        ratelimit.observe(url, response.status_code, response.headers)
+        if response.status_code not in RETRY_STATUSES or attempt == retries:
+            return response
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault('timeout', settings.UPSTREAM_TIMEOUT)
+    call_key = _call_key(method, url, kwargs)
+    start = time.perf_counter()
+    sent = []
+    status = 'error'
+
+    def send():
+        sent.append(True)
+        return _send(method, url, kwargs)
+
+    try:
+        response = send() if call_key is None else singleflight.do(call_key, send)
+        status = response.status_code
+        return response
+    finally:
+        timing.record_upstream(method, url, status, not sent, time.perf_counter() - start)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def tmdb_get(path, **kwargs):
+    """GET a TMDB v3 path such as ``/movie/603``."""
+    return get(f"{settings.TMDB_API_URL}{path}", **kwargs)
+
+
+def anilist_query(query, variables=None, **kwargs):
+    """POST a GraphQL query to AniList."""
+    payload = {'query': query}
+    if variables is not None:
+        payload['variables'] = variables
+    return post(settings.ANILIST_API_URL, json=payload, **kwargs)
+
+
+def google_books_get(path, **kwargs):
+    """GET a Google Books v1 path such as ``/volumes``."""
+    return get(f"{settings.GOOGLE_BOOKS_API_URL}{path}", **kwargs)
+
+
+def async_client():
+    """Return the pooled async client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        connect, read = settings.UPSTREAM_TIMEOUT
+        transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=settings.UPSTREAM_ASYNC_POOL_SIZE,
+                max_keepalive_connections=settings.UPSTREAM_POOL_SIZE,
+            ),
+        )
+        client = _async_clients[loop] = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(read, connect=connect),
+        )
+    return client
+
+
+async def _send_async(method, url, kwargs):
+    retries = _retries(method, url)
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(_backoff(attempt))
+        # Taking a token blocks on a file lock for microseconds; it doesn't
+        # need the thread the database calls are serialized on
+        wait = await sync_to_async(ratelimit.reserve, thread_sensitive=False)(url)
+        if wait:
+            await asyncio.sleep(wait)
+        try:
+            response = await async_client().request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt < retries:
+                continue
+            raise
+        await sync_to_async(ratelimit.observe, thread_sensitive=False)(url, response.status_code, response.headers)
+        if response.status_code not in RETRY_STATUSES or attempt == retries:
+            return response
+
+
+async def request_async(method, url, **kwargs):
+    kwargs['headers'] = {**_default_headers(_host(url)), **kwargs.get('headers', {})}
+    if kwargs.get('params'):
+        # requests drops None-valued params; httpx would send them empty
+        kwargs['params'] = {k: v for k, v in kwargs['params'].items() if v is not None}
+    call_key = _call_key(method, url, kwargs)
+    start = time.perf_counter()
+    sent = []
+    status = 'error'
+
+    def send():
+        sent.append(True)
+        return _send_async(method, url, kwargs)
+
+    try:
+        if call_key is None:
+            response = await send()
+        else:
+            response = await singleflight.do_async(call_key, method, send)
+        status = response.status_code
+        return response
+    finally:
+        timing.record_upstream(method, url, status, not sent, time.perf_counter() - start)
+
+
+async def tmdb_get_async(path, **kwargs):
+    return await request_async('GET', f"{settings.TMDB_API_URL}{path}", **kwargs)
+
+
+async def anilist_query_async(query, variables=None, **kwargs):
+    payload = {'query': query}
+    if variables is not None:
+        payload['variables'] = variables
+    return await request_async('POST', settings.ANILIST_API_URL, json=payload, **kwargs)
+
+
+async def google_books_get_async(path, **kwargs):
+    return await request_async('GET', f"{settings.GOOGLE_BOOKS_API_URL}{path}", **kwargs)
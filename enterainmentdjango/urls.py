@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -13,12 +13,31 @@ urlpatterns = [
     path('movie/<int:movie_id>/', views.movie_detail, name='movie_detail'),
     path('animanga/', views.animanga, name='animanga'),  # Keep only the main animanga route
     path('animanga/<int:anime_id>/', views.animanga_detail, name='anime_detail'),
-    path('<str:media_type>/<int:show_id>/', views.movie_detail, name='movie_detail'),
+    path('<str:media_type>/<int:show_id>/', views.show_detail, name='show_detail'),
     path('api/trending-posters', views.get_trending_posters, name='trending-posters'),
     path('api/trending-anime', views.get_trending_anime, name='trending-anime'),
+    path('api/trending', views.get_trending, name='trending'),
+    path('api/animanga/<int:anime_id>/<str:section>/', views.animanga_section, name='anime_section'),
     path('api/watchlist/', views.get_watchlist, name='get_watchlist'),
+    path('api/watchlist/search/', views.search_watchlist, name='search_watchlist'),
+    path('api/watchlist/stream/', views.stream_watchlist, name='stream_watchlist'),
     path('api/watchlist/add/', views.add_to_watchlist, name='add_to_watchlist'),
     path('api/watchlist/update/', views.update_watchlist, name='update_watchlist'),
     path('api/watchlist/delete/<int:item_id>/', views.delete_from_watchlist, name='delete_from_watchlist'),
+    path('api/watchlist/bulk/', views.bulk_watchlist, name='bulk_watchlist'),
+    path('api/watchlist/jobs/', views.get_enrichment_jobs, name='get_enrichment_jobs'),
+    path('api/upstream/stats/', views.get_upstream_stats, name='get_upstream_stats'),
+    path('metrics', views.get_metrics, name='metrics'),
     path('watchlist/', views.watchlist, name='watchlist'),
+
+    # Async variants of the upstream-bound views, for ASGI deployments
+    path('async/books/', async_views.books, name='books_async'),
+    path('async/shows/', async_views.shows, name='shows_async'),
+    path('async/movie/<int:movie_id>/', async_views.movie_detail, name='movie_detail_async'),
+    path('async/animanga/', async_views.animanga, name='animanga_async'),
+    path('async/animanga/<int:anime_id>/', async_views.animanga_detail, name='anime_detail_async'),
+    path('async/<str:media_type>/<int:show_id>/', async_views.show_detail, name='show_detail_async'),
+    path('async/api/trending-posters', async_views.get_trending_posters, name='trending-posters-async'),
+    path('async/api/trending-anime', async_views.get_trending_anime, name='trending-anime-async'),
+    path('async/api/trending', async_views.get_trending, name='trending-async'),
 ]
\ No newline at end of file
@@ -1,14 +1,21 @@
 import requests
+import contextvars
 import json
+import hashlib
+import hmac
 from django.conf import settings
 from django.contrib import messages
 from django.shortcuts import render, redirect
 import boto3
 from django.core.paginator import Paginator
 import os
-from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest, HttpResponseServerError
-from django.views.decorators.http import require_http_methods
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, HttpResponse, HttpResponseBadRequest, HttpResponseServerError, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, set_response_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_http_methods
 from .models import WatchlistItem
+from . import animanga_details, db_routing, detail_cache, enrichment, jobs, metadata_cache, metrics, mutations, prefetch, queries, ratelimit, search, singleflight, trending, upstream, volumes
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,30 +24,146 @@ logger = logging.getLogger(__name__)
 # For now, using a dummy user ID for development
 
 def iteminfo(item):
+    cached = metadata_cache.get(item['media_type'], item['media_id'])
+    if cached is not None:
+        return cached
+
+    info = fetch_iteminfo(item)
+    # Failed lookups come back empty; leave them uncached so they are retried
+    if info:
+        metadata_cache.set(item['media_type'], item['media_id'], info)
+    return info
+
+def iteminfo_batch(items):
+    """Look up additional info for many items, batching the AniList requests.
+
+    Books come from the local volume store, downloading the missing ones
+    concurrently. Returns ``{(media_type, media_id): info}`` for the items
+    that were found.
+    """
+    found = metadata_cache.get_many([(item['media_type'], item['media_id']) for item in items])
+
+    missing = {}
+    for item in items:
+        key = (item['media_type'], item['media_id'])
+        if key not in found and item['media_type'] in ('anime', 'manga', 'book'):
+            missing.setdefault(item['media_type'], []).append(item['media_id'])
+
+    for volume_id, volume in volumes.get_many(missing.pop('book', [])).items():
+        info = volumes.volume_info(volume)
+        metadata_cache.set('book', volume_id, info)
+        found[('book', volume_id)] = info
+
+    size = settings.ANILIST_BATCH_SIZE
+    for media_type, media_ids in missing.items():
+        for start in range(0, len(media_ids), size):
+            for media_id, info in fetch_anilist_info(media_type, media_ids[start:start + size]).items():
+                metadata_cache.set(media_type, media_id, info)
+                found[(media_type, media_id)] = info
+    return found
+
+ANILIST_INFO_QUERY = '''
+query ($ids: [Int], $type: MediaType, $perPage: Int) {
+    Page(perPage: $perPage) {
+        media(id_in: $ids, type: $type) {
+            id
+            title {
+                english
+                romaji
+            }
+            coverImage {
+                large
+            }
+            genres
+            episodes
+            chapters
+            averageScore
+            startDate {
+                year
+            }
+            studios(isMain: true) {
+                nodes {
+                    name
+                }
+            }
+            staff(sort: RELEVANCE, perPage: 1) {
+                nodes {
+                    name {
+                        full
+                    }
+                }
+            }
+        }
+    }
+}
+'''
+
+def fetch_anilist_info(media_type, media_ids):
+    """Fetch additional info for up to ``ANILIST_BATCH_SIZE`` AniList ids in one query.
+
+    Returns ``{media_id: info}``; ids AniList doesn't know are left out.
+    """
+    ids = [int(media_id) for media_id in media_ids if str(media_id).isdigit()]
+    if not ids:
+        return {}
+    try:
+        response = upstream.anilist_query(ANILIST_INFO_QUERY, {
+            'ids': ids,
+            'type': media_type.upper(),
+            'perPage': len(ids),
+        })
+        data = response.json()
+        if 'errors' in data:
+            raise ValueError(data['errors'][0].get('message'))
+        media_list = data['data']['Page']['media']
+    except Exception as e:
+        logger.error(f"Error fetching Anilist data: {str(e)}")
+        return {}
+
+    results = {}
+    wanted = set(ids)
+    for media in media_list:
+        # Only the requested ids are cached under their keys
+        if media.get('id') not in wanted:
+            continue
+        # Anime are credited to their main studio, manga to their lead author
+        if media_type == 'anime':
+            creators = [studio['name'] for studio in (media.get('studios') or {}).get('nodes', [])]
+        else:
+            creators = [staff['name']['full'] for staff in (media.get('staff') or {}).get('nodes', [])]
+        year = (media.get('startDate') or {}).get('year')
+        title = media.get('title') or {}
+        results[str(media['id'])] = {
+            'title': title.get('english') or title.get('romaji'),
+            'poster_path': (media.get('coverImage') or {}).get('large'),
+            'genres': media.get('genres') or [],
+            'creator': creators[0] if creators else 'Unknown',
+            'year': str(year) if year else '',
+            'rating': media.get('averageScore') or 0,
+            'total_episodes': media.get('episodes') if media_type == 'anime' else media.get('chapters')
+        }
+    return results
+
+def fetch_iteminfo(item):
     if item['media_type'] == 'movie' or item['media_type'] == 'tv':
         # Get info from TMDB API
-        api_key = settings.TMDB_API_KEY
-        headers = {
-            "accept": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        url = f"https://api.themoviedb.org/3/{item['media_type']}/{item['media_id']}"
+        # Fold the movie credits into the details request instead of a second round trip
+        params = {'append_to_response': 'credits'} if item['media_type'] == 'movie' else {}
         try:
-            response = requests.get(url, headers=headers)
+            response = upstream.tmdb_get(f"/{item['media_type']}/{item['media_id']}", params=params)
             data = response.json()
             
             # For movies, fetch director from crew
             director = 'Unknown'
             if item['media_type'] == 'movie':
-                # Get credits
-                credits_url = f"https://api.themoviedb.org/3/movie/{item['media_id']}/credits"
-                credits_response = requests.get(credits_url, headers=headers)
-                credits_data = credits_response.json()
+                credits_data = data.get('credits', {})
                 # Find director in crew
                 directors = [crew['name'] for crew in credits_data.get('crew', []) if crew['job'] == 'Director']
                 director = directors[0] if directors else 'Unknown'
             
             return {
+                'title': data.get('title') if item['media_type'] == 'movie' else data.get('name'),
+                'poster_path': f"https://image.tmdb.org/t/p/w500{data['poster_path']}" if data.get('poster_path') else None,
                 'genres': [genre['name'] for genre in data.get('genres', [])],
                 'creator': director if item['media_type'] == 'movie' else data.get('created_by', [{'name': 'Unknown'}])[0]['name'],
                 'year': data.get('release_date', '')[:4] if item['media_type'] == 'movie' else data.get('first_air_date', '')[:4],
@@ -52,59 +175,215 @@ def iteminfo(item):
             return {}
             
     elif item['media_type'] == 'anime' or item['media_type'] == 'manga':
-        # TODO: Implement Anilist API integration
-        # Use GraphQL query to fetch anime/manga details
-        return {}
+        # Single lookups (e.g. from the job queue) are a batch of one
+        return fetch_anilist_info(item['media_type'], [item['media_id']]).get(str(item['media_id']), {})
         
     elif item['media_type'] == 'book':
-        # TODO: Implement Google Books API integration
-        # Use item['media_id'] to fetch book details
-        return {}
+        volume = volumes.get_many([item['media_id']]).get(item['media_id'])
+        return volumes.volume_info(volume) if volume else {}
         
     return {}
 
+@db_routing.read_only
 def watchlist(request):
-    items = WatchlistItem.objects.filter(user='dummy_user')
-    return render(request, 'watchlist.html', {'items': items})
+    # Items are loaded by watchlist.js from the watchlist API
+    return render(request, 'watchlist.html')
 
+def watchlist_etag(request):
+    # Changes whenever a row in the filtered list is added, updated or deleted,
+    # or the catalog entry behind one is, so a matching request gets a 304
+    # without reading any rows
+    try:
+        filters = queries.parse_filters(request.GET)
+    except ValueError:
+        return None
+    state = queries.watchlist_state('dummy_user', filters['status'], filters['media_type'])
+    if state['pending']:
+        # Rows the job queue hasn't reached are enriched per request, so the
+        # body can change without the rows changing
+        return None
+    key = f"{request.get_full_path()}:{state['count']}:{state['last_updated']}:{state['catalog_updated']}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+@db_routing.read_only
 @require_http_methods(['GET'])
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=watchlist_etag)
 def get_watchlist(request):
     try:
-        items = list(WatchlistItem.objects.filter(user='dummy_user').values())
-        # Process each item to include additional info
-        for item in items:
-            if item['media_type'] in ['movie', 'tv']:
-                info = iteminfo(item)
-                item.update({
-                    'genres': info.get('genres', []),
-                    'creator': info.get('creator', 'Unknown'),
-                    'year': info.get('year', ''),
-                    'rating': info.get('rating', 0),
-                    'total_episodes': info.get('total_episodes')
-                })
-        return JsonResponse(items, safe=False)
+        filters = queries.parse_filters(request.GET)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    try:
+        items, next_cursor = queries.watchlist_page('dummy_user', **filters)
+        # Rows are enriched at write time by the job queue; only look up
+        # additional info for the ones it hasn't reached yet
+        pending = [item for item in items if item['enriched_at'] is None]
+        enrichment.enrich_items(pending, iteminfo, batch_lookup=iteminfo_batch)
+        return JsonResponse({'items': items, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
     except Exception as e:
         logger.error(f"Error in get_watchlist: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
+def ndjson_line(message):
+    return json.dumps(message, cls=DjangoJSONEncoder) + '\n'
+
+def in_request_context(iterator):
+    # A streamed body is produced after the view and the middleware have
+    # returned; step through it in the view's context so its queries still
+    # go to the replica and onto the request's timeline
+    context = contextvars.copy_context()
+
+    def steps():
+        while True:
+            try:
+                yield context.run(next, iterator)
+            except StopIteration:
+                return
+    return steps()
+
+def stream_watchlist_items(items, next_cursor):
+    # Base rows go out first so the page can paint posters and titles right away
+    for item in items:
+        yield ndjson_line({'type': 'item', 'item': item})
+
+    # Then one patch per item as its additional info arrives
+    pending = [item for item in items if item['enriched_at'] is None]
+    for item, info in enrichment.iter_enrichment(pending, iteminfo, batch_lookup=iteminfo_batch):
+        yield ndjson_line({'type': 'patch', 'id': item['id'], 'fields': enrichment.info_fields(info)})
+
+    yield ndjson_line({'type': 'done', 'next_cursor': next_cursor})
+
+@db_routing.read_only
+@require_http_methods(['GET'])
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=watchlist_etag)
+def stream_watchlist(request):
+    try:
+        filters = queries.parse_filters(request.GET)
+        items, next_cursor = queries.watchlist_page('dummy_user', **filters)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error in stream_watchlist: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+    response = StreamingHttpResponse(in_request_context(stream_watchlist_items(items, next_cursor)), content_type='application/x-ndjson')
+    response['X-Accel-Buffering'] = 'no'  # Don't let a reverse proxy hold back the stream
+    return response
+
+@db_routing.read_only
+@require_http_methods(['GET'])
+def search_watchlist(request):
+    try:
+        params = search.parse_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    try:
+        items, total = search.search('dummy_user', **params)
+        next_offset = params['offset'] + len(items)
+        result = {
+            'items': items,
+            'total': total,
+            'next_offset': next_offset if next_offset < total else None,
+        }
+        if params['offset'] == 0:
+            # Later pages keep the facets from the first one
+            result['facets'] = search.facets(
+                'dummy_user', params['q'], params['status'], params['media_type'], params['genre']
+            )
+        return JsonResponse(result)
+    except Exception as e:
+        logger.error(f"Error in search_watchlist: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+def metrics_allowed(request):
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    return bool(settings.METRICS_TOKEN) and hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode())
+
+@require_http_methods(['GET'])
+def get_enrichment_jobs(request):
+    # Failures carry raw error text, which can include upstream URLs
+    if not metrics_allowed(request):
+        raise Http404()
+    return JsonResponse(jobs.status_summary())
+
+@require_http_methods(['GET'])
+def get_upstream_stats(request):
+    # Rate budgets are shared; the counters are per process
+    if not metrics_allowed(request):
+        raise Http404()
+    return JsonResponse({
+        'singleflight': singleflight.stats(),
+        'ratelimit': ratelimit.usage(),
+        'prefetch': prefetch.stats(),
+        'detail_cache': detail_cache.stats(),
+    })
+
+@require_http_methods(['GET'])
+def get_metrics(request):
+    # Prometheus text format, summed over every worker process. Not found
+    # rather than forbidden, so the endpoint isn't advertised
+    if not metrics_allowed(request):
+        raise Http404()
+    return HttpResponse(
+        metrics.render(ratelimit_usage=ratelimit.usage()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
 @require_http_methods(['POST'])
 def update_watchlist(request):
-    data = json.loads(request.body)
     try:
-        item = WatchlistItem.objects.get(id=data['id'], user='dummy_user')
-        item.status = data['status']
-        item.progress = data['progress']
-        item.save()
-        return JsonResponse({'status': 'success'})
+        data = json.loads(request.body)
+        item_id = int(data['id'])
+        fields = mutations.validate_update(data)
+        precondition = mutations.parse_precondition(data)
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'status': 'error', 'message': f'Invalid request: {str(e)}'}, status=400)
+
+    try:
+        item = mutations.update_item('dummy_user', item_id, fields, precondition)
+        return JsonResponse({'status': 'success', 'item': item})
     except WatchlistItem.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'Item not found.'}, status=404)
+    except mutations.UpdateConflict as e:
+        return JsonResponse({'status': 'error', 'message': str(e), 'item': e.current}, status=409)
+
+@require_http_methods(['POST'])
+def bulk_watchlist(request):
+    try:
+        data = json.loads(request.body)
+        operations = data['operations']
+        if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+            raise ValueError('operations must be a list of objects')
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'status': 'error', 'message': f'Invalid request: {str(e)}'}, status=400)
+
+    if len(operations) > mutations.MAX_BULK_OPERATIONS:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'At most {mutations.MAX_BULK_OPERATIONS} operations per request'
+        }, status=400)
+
+    try:
+        results = mutations.apply_bulk('dummy_user', operations)
+        return JsonResponse({'status': 'success', 'results': results})
+    except Exception as e:
+        logger.error(f'Error applying bulk watchlist operations: {str(e)}', exc_info=True)
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
 @require_http_methods(['DELETE'])
 def delete_from_watchlist(request, item_id):
     logger.debug(f'Attempting to delete item {item_id} from watchlist')
     try:
-        item = WatchlistItem.objects.get(id=item_id, user='dummy_user')
-        title = item.title
+        item = WatchlistItem.objects.select_related('catalog').get(id=item_id, user='dummy_user')
+        title = item.catalog.title
         item.delete()
         logger.debug(f'Successfully deleted item {item_id} ({title}) from watchlist')
         return JsonResponse({'status': 'success', 'message': f'Successfully deleted {title}'})
@@ -121,30 +400,11 @@ def add_to_watchlist(request):
     try:
         data = json.loads(request.body)
         logger.debug('Received data: %s', data)
-        
-        # Extract genres from the incoming data or fetch from API
-        genres = data.get('genres', [])
-        creator = data.get('creator', 'Unknown')
-        year = data.get('year', '')
-        
-        item, created = WatchlistItem.objects.get_or_create(
-            user='dummy_user',
-            media_id=data['media_id'],
-            defaults={
-                'media_type': data['media_type'],
-                'title': data['title'],
-                'poster_path': data['poster_path'],
-                'status': 'plan_to_watch',
-                'progress': 0,
-                'total_episodes': data.get('total_episodes'),
-                'genres': genres,  # Store genres if your model supports it
-                'creator': creator,
-                'year': year,
-                'rating': 0
-            }
-        )
-        logger.debug('Item %s: %s', 'created' if created else 'updated', item.id)
-        return JsonResponse({'status': 'success', 'item_id': item.id})
+        item_id, created = mutations.add_item('dummy_user', data)
+        logger.debug('Item %s: %s', 'created' if created else 'updated', item_id)
+        return JsonResponse({'status': 'success', 'item_id': item_id})
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'status': 'error', 'message': f'Invalid request: {str(e)}'}, status=400)
     except Exception as e:
         logger.error('Error adding to watchlist: %s', str(e), exc_info=True)
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
@@ -165,68 +425,83 @@ def get_genre_id(genre_name):
 def main_page(request):
     return render(request, 'main_page.html')
 
-def books(request):
-    query = request.GET.get('q', '')
-    page = int(request.GET.get('page', 1))
-    max_results = 20
-    start_index = (page - 1) * max_results
-
+def request_page(request):
+    # A malformed page falls back to the first one instead of a 500
     try:
-        # Base URL for Google Books API
-        base_url = "https://www.googleapis.com/books/v1/volumes"
-        
-        if (query):
-            # Search query
-            search_query = query
-        else:
-            # Default query for trending/popular books
-            search_query = 'subject:fiction'
-            
-        # Parameters for the API request
-        params = {
-            'q': search_query,
-            'startIndex': start_index,
-            'maxResults': max_results,
-            'key': settings.GOOGLE_BOOKS_API_KEY,
-            'orderBy': 'relevance',
-            'printType': 'books',
-            'langRestrict': 'en'
-        }
+        return max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        return 1
 
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        data = response.json()
+BOOKS_PER_PAGE = 20
+BOOKS_MAX_AGE = 10 * 60
 
-        books = []
-        for item in data.get('items', []):
-            volume_info = item.get('volumeInfo', {})
-            books.append({
-                'id': item.get('id'),
-                'title': volume_info.get('title', 'Unknown Title'),
-                'authors': volume_info.get('authors', []),
-                'description': volume_info.get('description', ''),
-                'thumbnail': volume_info.get('imageLinks', {}).get('thumbnail', ''),
-                'info_link': volume_info.get('infoLink', ''),
-                'published_date': volume_info.get('publishedDate', ''),
-                'categories': volume_info.get('categories', []),
-                'average_rating': volume_info.get('averageRating', 0),
-                'ratings_count': volume_info.get('ratingsCount', 0)
-            })
-
-        total_items = data.get('totalItems', 0)
-        total_pages = (total_items + max_results - 1) // max_results
+def books_params(query, page):
+    start_index = (page - 1) * BOOKS_PER_PAGE
 
-        context = {
-            'books': books,
-            'query': query,
-            'current_page': page,
-            'total_pages': min(total_pages, 100),  # Google Books API limit
-            'has_next': page * max_results < min(total_items, 2000),  # API limit of 2000 items
-            'has_previous': page > 1
-        }
+    if (query):
+        # Search query
+        search_query = query
+    else:
+        # Default query for trending/popular books
+        search_query = 'subject:fiction'
+
+    # Parameters for the API request
+    return {
+        'q': search_query,
+        'startIndex': start_index,
+        'maxResults': BOOKS_PER_PAGE,
+        'key': settings.GOOGLE_BOOKS_API_KEY,
+        'orderBy': 'relevance',
+        'printType': 'books',
+        'langRestrict': 'en',
+        'fields': volumes.SEARCH_FIELDS
+    }
+
+def books_context(result, query, page):
+    # Volumes are normalized by the volume store (see volumes.py)
+    books = [
+        {name: volume[name] for name in volumes.COLUMNS if name != 'page_count'}
+        for volume in result['volumes']
+    ]
+
+    total_items = result['total_items']
+    total_pages = (total_items + BOOKS_PER_PAGE - 1) // BOOKS_PER_PAGE
+
+    return {
+        'books': books,
+        'query': query,
+        'current_page': page,
+        'total_pages': min(total_pages, 100),  # Google Books API limit
+        'has_next': page * BOOKS_PER_PAGE < min(total_items, 2000),  # API limit of 2000 items
+        'has_previous': page > 1
+    }
+
+def books_json_response(request, context):
+    # Search results are cached server-side for hours; let the browser reuse
+    # them briefly and revalidate against a content ETag after that
+    response = JsonResponse(context)
+    patch_vary_headers(response, ['X-Requested-With'])
+    response['Cache-Control'] = f'public, max-age={BOOKS_MAX_AGE}'
+    set_response_etag(response)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+def prefetch_books(query, page):
+    params = books_params(query, page)
+    prefetch.schedule('books', params, lambda: volumes.search(params))
+
+def books(request):
+    query = request.GET.get('q', '')
+    page = request_page(request)
+
+    try:
+        params = books_params(query, page)
+        result = prefetch.get('books', params, lambda: volumes.search(params))
+        context = books_context(result, query, page)
+        if context['has_next']:
+            prefetch_books(query, page + 1)
 
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return JsonResponse(context)
+            return books_json_response(request, context)
         return render(request, 'books.html', context)
 
     except requests.RequestException as e:
@@ -239,46 +514,46 @@ def books(request):
             'query': query
         })
 
-def shows(request):
-    query = request.GET.get('query', '')
-    category = request.GET.get('category', 'popular')
-    genre = request.GET.get('genre', '')
-    page = request.GET.get('page', 1)
-    media_type = request.GET.get('media_type', 'movie')  # Default to 'movie'
-
-    api_key = settings.TMDB_API_KEY
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Bearer {api_key}"
+def shows_filters(request):
+    return {
+        'query': request.GET.get('query', ''),
+        'category': request.GET.get('category', 'popular'),
+        'genre': request.GET.get('genre', ''),
+        'page': request_page(request),
+        'media_type': request.GET.get('media_type', 'movie'),  # Default to 'movie'
     }
 
-    if query:
-        url = f"https://api.themoviedb.org/3/search/{media_type}"
+def shows_request(filters):
+    media_type = filters['media_type']
+    if filters['query']:
+        path = f"/search/{media_type}"
         params = {
             'language': 'en-US', 
-            'query': query, 
-            'page': page,
+            'query': filters['query'], 
+            'page': filters['page'],
             'include_adult': 'false'  # Add adult content filter
         }
-    elif genre:
-        genre_id = get_genre_id(genre)
-        url = f"https://api.themoviedb.org/3/discover/{media_type}"
+    elif filters['genre']:
+        genre_id = get_genre_id(filters['genre'])
+        path = f"/discover/{media_type}"
         params = {
             'language': 'en-US', 
             'with_genres': genre_id, 
-            'page': page,
+            'page': filters['page'],
             'include_adult': 'false'  # Add adult content filter
         }
     else:
-        url = f"https://api.themoviedb.org/3/{media_type}/{category}"
+        path = f"/{media_type}/{filters['category']}"
         params = {
             'language': 'en-US', 
-            'page': page,
+            'page': filters['page'],
             'include_adult': 'false'  # Add adult content filter
         }
+    return path, params
 
-    response = requests.get(url, headers=headers, params=params)
-    data = response.json()
+def shows_context(data, filters):
+    media_type = filters['media_type']
+    page = filters['page']
 
     total_pages = data.get('total_pages', 1)
     if total_pages > 500:  # TMDB limits to 500 pages
@@ -301,19 +576,55 @@ def shows(request):
         }
         results.append(processed_item)
 
-    context = {
+    return {
         'media_items': results,
         'media_type': media_type,
-        'query': query,
-        'category': category,
-        'genre': genre,
-        'current_page': int(page),
+        'query': filters['query'],
+        'category': filters['category'],
+        'genre': filters['genre'],
+        'current_page': page,
         'total_pages': total_pages,
-        'has_next': int(page) < total_pages,
-        'has_previous': int(page) > 1,
-        'previous_page': int(page) - 1,
-        'next_page': int(page) + 1,
+        'has_next': page < total_pages,
+        'has_previous': page > 1,
+        'previous_page': page - 1,
+        'next_page': page + 1,
     }
+
+def shows_error_context(filters, error):
+    return {
+        'error': error,
+        'media_items': [],
+        'media_type': filters['media_type'],
+        'query': filters['query'],
+        'category': filters['category'],
+        'genre': filters['genre'],
+        'current_page': filters['page'],
+        'has_next': False,
+        'has_previous': False,
+    }
+
+def tmdb_json(path, params):
+    response = upstream.tmdb_get(path, params=params)
+    response.raise_for_status()
+    return response.json()
+
+def prefetch_shows(filters):
+    path, params = shows_request(filters)
+    prefetch.schedule('shows', [path, params], lambda: tmdb_json(path, params))
+
+def shows(request):
+    filters = shows_filters(request)
+    path, params = shows_request(filters)
+    try:
+        data = prefetch.get('shows', [path, params], lambda: tmdb_json(path, params))
+    except requests.RequestException as e:
+        logger.error(f"Error fetching shows: {str(e)}")
+        return render(request, 'shows.html', shows_error_context(filters, f"Failed to fetch shows: {str(e)}"))
+
+    context = shows_context(data, filters)
+    if context['has_next']:
+        # Infinite scroll asks for the next page soon
+        prefetch_shows({**filters, 'page': filters['page'] + 1})
     return render(request, 'shows.html', context)
 
 def get_genre_id(genre_name, media_type='movie'):
@@ -342,43 +653,91 @@ def get_genre_id(genre_name, media_type='movie'):
     }
     return genre_mappings.get(media_type, {}).get(genre_name.lower(), '')
 
-def movie_detail(request, movie_id):
-    # Validate 'id' parameter
-    try:
-        movie_id
-    except (ValueError, TypeError):
-        return HttpResponseBadRequest("Invalid movie ID.")
-
-    api_key = settings.TMDB_API_KEY
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Bearer {api_key}"
+DETAIL_MEDIA_TYPES = ('movie', 'tv')
+
+MOVIE_DETAIL_PARAMS = {
+    'language': 'en-US',
+    'append_to_response': 'credits,similar'
+}
+
+def show_detail_path(media_type, show_id):
+    return f"/{media_type}/{show_id}"
+
+def show_detail_key(media_type, show_id):
+    # Bump the version when the record's shape changes
+    return f"tmdb:v1:{media_type}:{show_id}"
+
+def show_detail_record(media_type, show):
+    """Project a TMDB movie or TV document onto the fields showsinfo.html uses."""
+    credits = show.get('credits', {})
+    if media_type == 'tv':
+        directors = [
+            {'name': creator['name'], 'profile_path': creator.get('profile_path'), 'job': 'Creator'}
+            for creator in show.get('created_by', [])
+        ]
+        runtimes = show.get('episode_run_time') or []
+    else:
+        directors = [
+            {'name': crew['name'], 'profile_path': crew.get('profile_path'), 'job': crew['job']}
+            for crew in credits.get('crew', []) if crew['job'] == 'Director'
+        ]
+        runtimes = [show['runtime']] if show.get('runtime') else []
+
+    return {
+        'id': show['id'],
+        'media_type': media_type,
+        'title': show.get('title') or show.get('name'),
+        'release_date': show.get('release_date') or show.get('first_air_date') or '',
+        'poster_path': show.get('poster_path'),
+        'vote_average': show.get('vote_average'),
+        'runtime': runtimes[0] if runtimes else None,
+        'overview': show.get('overview'),
+        'genres': [genre['name'] for genre in show.get('genres', [])],
+        'directors': directors,
+        'cast': [
+            {'name': member['name'], 'profile_path': member.get('profile_path'), 'character': member.get('character')}
+            for member in credits.get('cast', [])[:10]
+        ],
+        'similar': [
+            {'id': similar['id'], 'title': similar.get('title') or similar.get('name'), 'poster_path': similar.get('poster_path')}
+            for similar in show.get('similar', {}).get('results', [])[:6]
+        ],
     }
-    
+
+def fetch_show_detail(media_type, show_id):
+    response = upstream.tmdb_get(show_detail_path(media_type, show_id), params=MOVIE_DETAIL_PARAMS)
+    response.raise_for_status()
+    return show_detail_record(media_type, response.json())
+
+def movie_detail_context(record):
+    return {
+        'movie': record,
+        'directors': record['directors'],
+        'cast': record['cast'],
+        'similar_movies': record['similar'],
+        'genres': record['genres'],
+    }
+
+def show_detail(request, media_type, show_id):
+    if media_type not in DETAIL_MEDIA_TYPES:
+        raise Http404(f"Unknown media type: {media_type}")
+
     try:
-        # Get movie details
-        show_url = f"https://api.themoviedb.org/3/movie/{movie_id}?language=en-US&append_to_response=credits,videos,similar"
-        response = requests.get(show_url, headers=headers)
-        response.raise_for_status()
-        
-        show = response.json()
-        credits = show.get('credits', {})
-        creators = [crew for crew in credits.get('crew', []) if crew['job'] == 'Director']
-        
-        context = {
-            'movie': show,
-            'directors': creators,
-            'cast': credits.get('cast', [])[:10],
-            'similar_movies': show.get('similar', {}).get('results', [])[:6],
-            'genres': [genre['name'] for genre in show.get('genres', [])]
-        }
-        
-        return render(request, 'showsinfo.html', context)
-        
+        # Served from the detail cache; stale records are refreshed in the background
+        record = detail_cache.get(
+            show_detail_key(media_type, show_id),
+            lambda: fetch_show_detail(media_type, show_id),
+            settings.DETAIL_CACHE_TTLS[media_type],
+        )
+        return render(request, 'showsinfo.html', movie_detail_context(record))
+
     except requests.RequestException as e:
-        logger.error(f"Error fetching movie details: {str(e)}")
+        logger.error(f"Error fetching {media_type} details: {str(e)}")
         return render(request, 'showsinfo.html', {'error': 'Failed to load movie details'})
 
+def movie_detail(request, movie_id):
+    return show_detail(request, 'movie', movie_id)
+
 def account(request):
     return render(request, 'account')
 
@@ -408,10 +767,7 @@ def login_view(request):
         return redirect('main_page')
     return render(request, 'login.html')
 
-def animanga(request):
-    page = request.GET.get('page', 1)
-    
-    query_string = '''
+ANIMANGA_QUERY = '''
     query ($page: Int = 1) {
         Page(page: $page, perPage: 50) {
             pageInfo {
@@ -438,49 +794,50 @@ def animanga(request):
         }
     }
     '''
-    
+
+def animanga_context(data, page):
+    if 'errors' in data:
+        return {
+            'error': data['errors'][0]['message'],
+            'animanga_list': [],
+            'has_next': False,
+            'current_page': page
+        }
+
+    page_data = data['data']['Page']
+    return {
+        'animanga_list': page_data.get('media', []),
+        'has_next': page_data.get('pageInfo', {}).get('hasNextPage', False),
+        'current_page': page
+    }
+
+def anilist_json(query, variables):
+    response = upstream.anilist_query(query, variables)
+    response.raise_for_status()
+    return response.json()
+
+def prefetch_animanga(page):
+    variables = {'page': page}
+    prefetch.schedule('animanga', variables, lambda: anilist_json(ANIMANGA_QUERY, variables))
+
+def animanga(request):
+    page = request_page(request)
+
     variables = {
-        'page': int(page)
+        'page': page
     }
 
     try:
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-            'User-Agent': 'Entertainment Tracker/1.0'
-        }
-        response = requests.post(
-            'https://graphql.anilist.co',
-            json={
-                'query': query_string,
-                'variables': variables
-            },
-            headers=headers
-        )
-        
-        response.raise_for_status()
-        data = response.json()
-        
-        if 'errors' in data:
-            return render(request, 'animanga.html', {
-                'error': data['errors'][0]['message'],
-                'animanga_list': [],
-                'has_next': False,
-                'current_page': int(page)
-            })
-
-        page_data = data['data']['Page']
-        context = {
-            'animanga_list': page_data.get('media', []),
-            'has_next': page_data.get('pageInfo', {}).get('hasNextPage', False),
-            'current_page': int(page)
-        }
+        data = prefetch.get('animanga', variables, lambda: anilist_json(ANIMANGA_QUERY, variables))
+        context = animanga_context(data, page)
+        if context['has_next']:
+            prefetch_animanga(page + 1)
     except requests.RequestException as e:
         return render(request, 'animanga.html', {
             'error': f"Failed to fetch anime: {str(e)}",
             'animanga_list': [],
             'has_next': False,
-            'current_page': int(page)
+            'current_page': page
         })
 
     return render(request, 'animanga.html', context)
@@ -500,320 +857,80 @@ def animanga_view(request):
     return render(request, 'animanga.html')
 
 def animanga_detail(request, anime_id):
-    query_string = '''
-    query ($id: Int) {
-    Media(id: $id, type: ANIME) {
-        id
-        title {
-        romaji
-        english
-        native
-        }
-        description
-        startDate {
-        year
-        month
-        day
-        }
-        endDate {
-        year
-        month
-        day
-        }
-        season
-        seasonYear
-        episodes
-        duration
-        status
-        averageScore
-        meanScore
-        popularity
-        favourites
-        format
-        genres
-        tags {
-        name
-        description
-        category
-        rank
-        isGeneralSpoiler
-        isMediaSpoiler
-        isAdult
-        }
-        studios {
-        edges {
-            node {
-            id
-            name
-            siteUrl
-            }
-            isMain
-        }
-        }
-        staff {
-        edges {
-            node {
-            id
-            name {
-                full
-                native
-            }
-            language
-            primaryOccupations
-            image {
-                large
-            }
-            siteUrl
-            }
-            role
-        }
-        }
-        characters {
-        edges {
-            node {
-            id
-            name {
-                full
-                native
-            }
-            image {
-                large
-            }
-            description
-            siteUrl
-            }
-            role
-            voiceActors(language: JAPANESE) {
-            id
-            name {
-                full
-                native
-            }
-            language
-            image {
-                large
-            }
-            siteUrl
-            }
-        }
-        }
-        relations {
-        edges {
-            node {
-            id
-            title {
-                romaji
-                english
-            }
-            type
-            format
-            status
-            coverImage {
-                large
-            }
-            siteUrl
-            }
-            relationType
-        }
-        }
-        recommendations {
-        edges {
-            node {
-            mediaRecommendation {
-                id
-                title {
-                romaji
-                english
-                }
-                format
-                status
-                averageScore
-                popularity
-                coverImage {
-                large
-                }
-                siteUrl
-            }
-            rating
-            userRating
-            }
-        }
-        }
-        trailer {
-        id
-        site
-        thumbnail
-        }
-        siteUrl
-        nextAiringEpisode {
-        airingAt
-        timeUntilAiring
-        episode
-        }
-        streamingEpisodes {
-        title
-        thumbnail
-        url
-        site
-        }
-        reviews {
-        nodes {
-            id
-            summary
-            rating
-            ratingAmount
-            user {
-            id
-            name
-            avatar {
-                large
-            }
-            siteUrl
-            }
-            siteUrl
-        }
-        }
-        rankings {
-        id
-        rank
-        type
-        format
-        year
-        season
-        allTime
-        context
-        }
-        coverImage {
-        extraLarge
-        }
-        bannerImage
-        externalLinks {
-        id
-        site
-        url
-        type
-        language
-        color
-        icon
-        notes
-        isDisabled
-        }
-        source
-        hashtag
-        updatedAt
-    }
-    }
-    '''
-    
-    variables = {
-        'id': anime_id
-    }
-
     try:
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-            'User-Agent': 'Entertainment Tracker/1.0'
-        }
-        response = requests.post(
-            'https://graphql.anilist.co',
-            json={
-                'query': query_string,
-                'variables': variables
-            },
-            headers=headers
-        )
-        
-        response.raise_for_status()
-        data = response.json()
-        
-        if 'errors' in data:
-            return render(request, 'showsinfo.html', {
-                'error': data['errors'][0]['message']
-            })
-
+        # Characters, staff, reviews and recommendations load separately
         context = {
-            'Media': data['data']['Media']
+            'anime_id': anime_id,
+            'Media': animanga_details.core(anime_id)
         }
 
     except requests.RequestException as e:
         return render(request, 'animangainfo.html', {
+            'anime_id': anime_id,
             'error': f"Failed to fetch anime: {str(e)}"
         })
 
     return render(request, 'animangainfo.html', context)
 
-def get_trending_anime(request):
-    query_string = '''
-    query {
-        Page(page: 1, perPage: 10) {
-            media(type: ANIME, sort: TRENDING_DESC) {
-                coverImage {
-                    extraLarge
-                }
-            }
-        }
-    }
-    '''
-    
-    try:
-        response = requests.post(
-            'https://graphql.anilist.co',
-            json={'query': query_string},
-            headers={'Accept': 'application/json'}
-        )
-        data = response.json()
-        posters = [
-            {"image_url": item["coverImage"]["extraLarge"]}
-            for item in data["data"]["Page"]["media"]
-            if item["coverImage"]["extraLarge"]
-        ]
-        return JsonResponse(posters, safe=False)
-    except Exception:
-        return JsonResponse([], safe=False)
-
-def get_trending_posters(request):
-    # Update existing function to return image_url format
-    api_key = settings.TMDB_API_KEY
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-    
-    url = "https://api.themoviedb.org/3/trending/movie/week"
-    response = requests.get(url, headers=headers)
-    data = response.json()
-    
-    posters = [
+# Section pages are cached server-side for their own TTL; browsers may keep
+# them a little while
+ANIMANGA_SECTION_MAX_AGE = 10 * 60
 
-        {"image_url": f"https://image.tmdb.org/t/p/w500{movie['poster_path']}"} 
-        for movie in data.get("results", [])[:10] 
-        if movie.get("poster_path")
-    ]
-    
-    return JsonResponse(posters, safe=False)
-from django.views.decorators.csrf import csrf_exempt
-
-@csrf_exempt
-def update_watchlist_progress(request):
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            item_id = data.get('item_id')
-            progress = data.get('progress')
+def animanga_section(request, anime_id, section):
+    if section not in animanga_details.SECTIONS:
+        raise Http404(f"Unknown section: {section}")
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid page'}, status=400)
+    # Every page is a separate upstream call and cache entry
+    page = max(1, min(page, settings.ANIMANGA_SECTION_MAX_PAGE))
 
-            # Validate data
-            if not item_id or progress is None:
-                return JsonResponse({'success': False, 'error': 'Invalid data.'})
+    try:
+        data = animanga_details.section(anime_id, section, page)
+    except requests.RequestException as e:
+        logger.error(f"Error fetching anime {section}: {str(e)}")
+        return JsonResponse({'status': 'error', 'message': f'Failed to fetch {section}'}, status=502)
+
+    response = JsonResponse(data)
+    patch_cache_control(response, public=True, max_age=ANIMANGA_SECTION_MAX_AGE)
+    return response
+
+# Trending feeds are served from snapshots kept by `manage.py refresh_trending`
+# (the first request downloads a feed that has none yet), so they are validated
+# by when the snapshots were taken
+TRENDING_MAX_AGE = 5 * 60
+
+def trending_conditions(*feeds):
+    # Arguments for @condition, validating by the feeds' snapshot times
+    def dates():
+        dates = [trending.snapshot(feed)[1] for feed in feeds]
+        return None if None in dates else dates
+
+    def etag(request):
+        snapshot_dates = dates()
+        if snapshot_dates:
+            return ':'.join(f'{feed}-{date.timestamp()}' for feed, date in zip(feeds, snapshot_dates))
+
+    def last_modified(request):
+        snapshot_dates = dates()
+        if snapshot_dates:
+            return max(snapshot_dates)
+
+    return {'etag_func': etag, 'last_modified_func': last_modified}
+
+@cache_control(public=True, max_age=TRENDING_MAX_AGE)
+@condition(**trending_conditions('anime'))
+def get_trending_anime(request):
+    return JsonResponse(trending.get('anime'), safe=False)
 
-            # Update the watchlist item
-            item = WatchlistItem.objects.get(id=item_id, user=request.user)
-            item.progress = progress
-            item.save()
+@cache_control(public=True, max_age=TRENDING_MAX_AGE)
+@condition(**trending_conditions('movies'))
+def get_trending_posters(request):
+    return JsonResponse(trending.get('movies'), safe=False)
 
-            return JsonResponse({'success': True})
-        except Exception as e:
-            logger.error(f"Error updating watchlist progress: {e}")
-            return JsonResponse({'success': False, 'error': 'An error occurred.'})
-    else:
-        return JsonResponse({'success': False, 'error': 'Invalid request method.'})
\ No newline at end of file
+@cache_control(public=True, max_age=TRENDING_MAX_AGE)
+@condition(**trending_conditions(*trending.FEEDS))
+def get_trending(request):
+    # Both homepage feeds in one request
+    return JsonResponse({feed: trending.get(feed) for feed in trending.FEEDS})
@@ -0,0 +1,190 @@
+"""
+Local store of normalized Google Books volumes.
+
+Volumes are fetched with a ``fields=`` mask that keeps only what the books page
+and the watchlist use, and kept in the ``BookVolume`` table. Searches are
+cached as lists of volume ids, so a repeated search or a watchlist book that
+was already seen is served from the database without downloading the volume
+JSON again. Rows older than ``settings.BOOK_VOLUME_MAX_AGE`` are refetched.
+"""
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from . import upstream
+from .models import BookVolume
+
+logger = logging.getLogger(__name__)
+
+# Partial responses: https://developers.google.com/books/docs/v1/performance#partial-response
+VOLUME_FIELDS = (
+    'id,volumeInfo(title,authors,description,imageLinks/thumbnail,infoLink,'
+    'publishedDate,categories,averageRating,ratingsCount,pageCount)'
+)
+SEARCH_FIELDS = f'totalItems,items({VOLUME_FIELDS})'
+
+# BookVolume columns, as produced by normalize()
+COLUMNS = (
+    'id', 'title', 'authors', 'description', 'thumbnail', 'info_link',
+    'published_date', 'categories', 'average_rating', 'ratings_count', 'page_count',
+)
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.ENRICHMENT_UPSTREAM_CONCURRENCY['google_books'],
+    thread_name_prefix='volumes',
+)
+
+
+def normalize(item):
+    """Map a Google Books volume resource onto ``BookVolume`` fields."""
+    volume_info = item.get('volumeInfo', {})
+    return {
+        'id': item['id'],
+        'title': volume_info.get('title', 'Unknown Title'),
+        'authors': volume_info.get('authors', []),
+        'description': volume_info.get('description', ''),
+        'thumbnail': volume_info.get('imageLinks', {}).get('thumbnail', ''),
+        'info_link': volume_info.get('infoLink', ''),
+        'published_date': volume_info.get('publishedDate', ''),
+        'categories': volume_info.get('categories', []),
+        'average_rating': float(volume_info.get('averageRating', 0)),
+        'ratings_count': volume_info.get('ratingsCount', 0),
+        'page_count': volume_info.get('pageCount'),
+    }
+
+
+def volume_info(volume):
+    """Watchlist metadata for a stored volume (see ``views.iteminfo``)."""
+    return {
+        'title': volume['title'],
+        'poster_path': volume['thumbnail'] or None,
+        'genres': volume['categories'],
+        'creator': volume['authors'][0] if volume['authors'] else 'Unknown',
+        'year': volume['published_date'][:4],
+        'rating': volume['average_rating'],
+        'total_episodes': volume['page_count'],
+    }
+
+
+def store(volumes):
+    """Insert or refresh normalized volumes in the local table."""
+    if not volumes:
+        return
+    now = timezone.now()
+    # A search can list the same volume twice
+    unique = {volume['id']: volume for volume in volumes}
+    BookVolume.objects.bulk_create(
+        [BookVolume(date_fetched=now, **volume) for volume in unique.values()],
+        update_conflicts=True,
+        unique_fields=['id'],
+        update_fields=[name for name in COLUMNS if name != 'id'] + ['date_fetched'],
+    )
+
+
+def _stored(volume_ids, fresh_only=True):
+    queryset = BookVolume.objects.filter(id__in=volume_ids)
+    if fresh_only:
+        queryset = queryset.filter(date_fetched__gte=timezone.now() - timedelta(seconds=settings.BOOK_VOLUME_MAX_AGE))
+    return {row['id']: row for row in queryset.values(*COLUMNS)}
+
+
+def fetch_volume(volume_id):
+    """Download one volume with the field mask; returns normalized fields."""
+    response = upstream.google_books_get(f'/volumes/{volume_id}', params={
+        'fields': VOLUME_FIELDS,
+        'key': settings.GOOGLE_BOOKS_API_KEY,
+    })
+    response.raise_for_status()
+    return normalize(response.json())
+
+
+def get_many(volume_ids):
+    """Return ``{volume_id: volume}``, downloading missing or stale volumes concurrently.
+
+    Volumes that can't be downloaded fall back to a stale row if there is one.
+    """
+    volume_ids = list(dict.fromkeys(volume_ids))
+    found = _stored(volume_ids)
+    missing = [volume_id for volume_id in volume_ids if volume_id not in found]
+    if not missing:
+        return found
+
+    fetched = []
+    futures = {volume_id: _executor.submit(fetch_volume, volume_id) for volume_id in missing}
+    for volume_id, future in futures.items():
+        try:
+            fetched.append(future.result())
+        except Exception as e:
+            logger.error(f"Error fetching Google Books volume {volume_id}: {str(e)}")
+    store(fetched)
+    found.update((volume['id'], volume) for volume in fetched)
+
+    # Better stale than nothing
+    stale = [volume_id for volume_id in missing if volume_id not in found]
+    if stale:
+        found.update(_stored(stale, fresh_only=False))
+    return found
+
+
+def _search_key(params):
+    # The API key doesn't change the results
+    params = {name: value for name, value in params.items() if name != 'key'}
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return f'books:search:{digest}'
+
+
+def _search_cache():
+    return caches[settings.BOOKS_SEARCH_CACHE]
+
+
+def cached_search(params):
+    """Return a cached search result, or ``None`` if it has to be downloaded.
+
+    Results are ``{'total_items': n, 'volumes': [volume, ...]}``.
+    """
+    try:
+        cached = _search_cache().get(_search_key(params))
+    except Exception as e:
+        logger.warning(f"Books search cache read failed: {str(e)}")
+        return None
+    if cached is None:
+        return None
+
+    stored = _stored(cached['ids'])
+    if len(stored) < len(set(cached['ids'])):
+        return None
+    return {
+        'total_items': cached['total_items'],
+        'volumes': [stored[volume_id] for volume_id in cached['ids']],
+    }
+
+
+def store_search(params, data):
+    """Store the volumes from a search response and cache the result ids."""
+    volumes = [normalize(item) for item in data.get('items', []) if item.get('id')]
+    store(volumes)
+    result = {'total_items': data.get('totalItems', 0), 'volumes': volumes}
+    try:
+        _search_cache().set(_search_key(params), {
+            'total_items': result['total_items'],
+            'ids': [volume['id'] for volume in volumes],
+        }, settings.BOOKS_SEARCH_TTL)
+    except Exception as e:
+        logger.warning(f"Books search cache write failed: {str(e)}")
+    return result
+
+
+def search(params):
+    """Search volumes (see ``views.books_params``), reusing stored results."""
+    result = cached_search(params)
+    if result is not None:
+        return result
+    response = upstream.google_books_get('/volumes', params=params)
+    response.raise_for_status()
+    return store_search(params, response.json())